@@ -11,10 +11,10 @@ def check_pw():
         st.stop()
 
 check_pw()
-from app.db import init_db, automate_statuses
+from app.db import ensure_schema, automate_statuses
 
 st.set_page_config(page_title="Gestão da Empresa", page_icon="🏢", layout="wide")
-init_db()
+ensure_schema()
 automate_statuses()
 
 # Sidebar (import robusto para aplicar CSS/JS global de navegação)
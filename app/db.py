@@ -1,16 +1,91 @@
 from __future__ import annotations
 from sqlmodel import SQLModel, Field, create_engine, Session, select
-from typing import Optional
+from sqlalchemy import event, Index, text
+from sqlalchemy.orm import Session as _OrmSession
+from typing import Optional, Callable
+from types import MappingProxyType
 from datetime import datetime, timedelta
 from pathlib import Path
+import math
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import pandas as pd
 
 # Ativa patch global para inputs numéricos estáveis (st.number_input)
 import app.utils  # noqa: F401
+from app.pricing import (
+    PricingParams, price_items, quotes_summary, machine_cpm,
+    ITEM_COLUMNS, SERVICE_COLUMNS, SERVICE_MACHINE_COLUMNS, SNAPSHOT_COLUMNS, QUOTE_COLUMNS, TOTAL_COLUMNS,
+)
+
+log = logging.getLogger(__name__)
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DATA_DIR / "db.sqlite"
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
+
+# --- Perfil do motor SQLite (WAL, pragmas, pool de ligações) ---
+# Valores por omissão pensados para várias pessoas a editar em simultâneo.
+# Cada chave pode ser ajustada por variável de ambiente APP_DB_<CHAVE>
+# (ex.: APP_DB_CACHE_SIZE_KIB=131072, APP_DB_JOURNAL_MODE=DELETE).
+DB_PROFILE_DEFAULTS = {
+    "journal_mode": "WAL",          # leitores não bloqueiam com escritores
+    "synchronous": "NORMAL",        # seguro em WAL, muito menos fsync
+    "busy_timeout_ms": 5000,        # espera por locks em vez de falhar logo
+    "cache_size_kib": 65536,        # 64 MiB de page cache por ligação
+    "mmap_size_bytes": 268435456,   # 256 MiB mapeados em memória
+    "temp_store": "MEMORY",
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout_s": 30,
+}
+
+
+def _load_db_profile() -> dict:
+    prof = dict(DB_PROFILE_DEFAULTS)
+    for key, default in DB_PROFILE_DEFAULTS.items():
+        raw = os.environ.get(f"APP_DB_{key.upper()}")
+        if raw is None or raw.strip() == "":
+            continue
+        try:
+            prof[key] = type(default)(raw.strip())
+        except ValueError:
+            pass
+    return prof
+
+
+DB_PROFILE = _load_db_profile()
+
+engine = create_engine(
+    f"sqlite:///{DB_PATH}",
+    echo=False,
+    pool_size=DB_PROFILE["pool_size"],
+    max_overflow=DB_PROFILE["max_overflow"],
+    pool_timeout=DB_PROFILE["pool_timeout_s"],
+    connect_args={
+        "check_same_thread": False,  # o Streamlit serve cada sessão numa thread diferente
+        "timeout": DB_PROFILE["busy_timeout_ms"] / 1000.0,
+    },
+)
+
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_conn, _conn_record):
+    """Aplica o perfil a cada ligação nova do pool (uma vez por ligação, não por sessão)."""
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"PRAGMA journal_mode={DB_PROFILE['journal_mode']}")
+        cur.execute(f"PRAGMA synchronous={DB_PROFILE['synchronous']}")
+        cur.execute(f"PRAGMA busy_timeout={int(DB_PROFILE['busy_timeout_ms'])}")
+        cur.execute(f"PRAGMA cache_size=-{int(DB_PROFILE['cache_size_kib'])}")
+        cur.execute(f"PRAGMA mmap_size={int(DB_PROFILE['mmap_size_bytes'])}")
+        cur.execute(f"PRAGMA temp_store={DB_PROFILE['temp_store']}")
+    finally:
+        cur.close()
 
 # Use expire_on_commit=False to keep objects usable after commit/close
 # This avoids DetachedInstanceError in pages that read cfg after saving.
@@ -68,7 +143,7 @@ class Settings(SQLModel, table=True):
 class Client(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     numero_cliente: int = Field(index=True)
-    nome: str
+    nome: str = Field(index=True)  # procura por nome no importador
     morada: str = ""
     pais: str = ""
     contacto: str = ""
@@ -81,6 +156,10 @@ class Client(SQLModel, table=True):
 
 
 class Material(SQLModel, table=True):
+    # Código único (vazios ignorados); ix_material_code serve as procuras por código
+    __table_args__ = (
+        Index("ux_material_code", "code", unique=True, sqlite_where=text("code <> ''")),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     code: str = Field(index=True)
     nome_pt: str = ""
@@ -182,13 +261,22 @@ def upgrade_services_observacoes():
         pass
 
 class Quote(SQLModel, table=True):
+    __table_args__ = (
+        # Número único quando atribuído (rascunhos sem número ficam de fora)
+        Index("ux_quote_numero", "numero", unique=True, sqlite_where=text("numero IS NOT NULL AND numero <> ''")),
+        # Listas do Planeamento/Dashboard: filtro por estado + ordenação/urgência por entrega
+        Index("ix_quote_estado_entrega", "estado", "data_entrega_prevista"),
+        # Candidatos a arquivo automático (ver automate_statuses); fica pequeno mesmo com arquivo grande
+        Index("ix_quote_pending_archive", "id",
+              sqlite_where=text("trabalho_entregue = 1 AND pago_total = 1 AND estado <> 'ARQUIVADO'")),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     numero: Optional[str] = Field(default=None, index=True)
-    cliente_id: int = Field(foreign_key="client.id")
+    cliente_id: int = Field(foreign_key="client.id", index=True)
     lingua: str = "PT"
     estado: str = "RASCUNHO"
     validade_dias: int = 30
-    data_criacao: datetime = Field(default_factory=datetime.utcnow)
+    data_criacao: datetime = Field(default_factory=datetime.utcnow, index=True)
     data_entrega_prevista: Optional[datetime] = None
     descricao: str = ""
     desconto_total: float = 0.0
@@ -229,6 +317,28 @@ class Quote(SQLModel, table=True):
     # Controle de baixa de stock (evita aplicar duas vezes)
     stock_discount_done: bool = False
 
+class QuoteNumberSeq(SQLModel, table=True):
+    """Último número atribuído por ano (prefixo YY de Quote.numero)."""
+    yy: str = Field(primary_key=True)
+    last_value: int = 0
+
+class PricingSnapshot(SQLModel, table=True):
+    """Parâmetros de preço (margens, IVA, tinta, energia, máquinas) num dado momento.
+    Uma linha por conteúdo distinto (content_hash); os itens referenciam-na por id.
+    """
+    __tablename__ = "pricing_snapshot"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(sa_column_kwargs={"unique": True})
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    margin_0_15: float = 0.0
+    margin_16_30: float = 0.0
+    margin_31_70: float = 0.0
+    margin_71_plus: float = 0.0
+    vat_rate: float = 0.0
+    uv_ink_price_eur_ml: float = 0.0
+    energy_cost_eur_kwh: float = 0.0
+    machines_json: str = "[]"                # [{id, name, power_watts, wear_cost_eur_per_min, markup_percent, ...}]
+
 class QuoteItem(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     quote_id: int = Field(foreign_key="quote.id", index=True)
@@ -251,7 +361,27 @@ class QuoteItem(SQLModel, table=True):
 
     # Snapshot de custos/parametrizações no momento da adição (para histórico)
     preco_compra_unitario: Optional[float] = Field(default=None)
-    snapshot_json: Optional[str] = Field(default=None)
+    pricing_snapshot_id: Optional[int] = Field(default=None, foreign_key="pricing_snapshot.id", index=True)
+    snapshot_json: Optional[str] = Field(default=None)  # legado: migrado para pricing_snapshot (v6)
+
+class QuoteTotals(SQLModel, table=True):
+    """Totais materializados por orçamento (mantidos em cada escrita de QuoteItem/Quote).
+    Listas e análises leem esta linha em vez de recalcular os itens.
+    """
+    __tablename__ = "quote_totals"
+    quote_id: int = Field(primary_key=True, foreign_key="quote.id")
+    items_count: int = 0
+    items_subtotal: float = 0.0       # soma das linhas (cliente, s/IVA, antes do desconto global)
+    discount: float = 0.0             # desconto global (€)
+    net_subtotal: float = 0.0         # items_subtotal - discount
+    vat: float = 0.0
+    total: float = 0.0                # net_subtotal + vat
+    material_cost: float = 0.0        # custo de compra (uso) dos materiais
+    service_cost: float = 0.0         # custo interno dos serviços (inclui tinta)
+    ink_ml: float = 0.0
+    ink_cost: float = 0.0
+    profit: float = 0.0               # net_subtotal - custos (>= 0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class QuoteVersion(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -263,13 +393,36 @@ class QuoteVersion(SQLModel, table=True):
 
 class StockMovement(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    ts: datetime = Field(default_factory=datetime.utcnow)
-    quote_id: int
-    code: str
+    ts: datetime = Field(default_factory=datetime.utcnow, index=True)
+    quote_id: int = Field(index=True)
+    code: str = Field(index=True)
     qty_delta: float  # negativo ao consumir
     unidade: Optional[str] = None
     note: Optional[str] = None
 
+class StockRemnant(SQLModel, table=True):
+    # Sobras de chapa reaproveitáveis. O índice (material, estado, lado menor, lado maior) serve a procura
+    # "sobras deste material onde cabe uma peça de a×b" sem ler a tabela inteira (ver find_remnants).
+    __table_args__ = (
+        Index("ix_stockremnant_lookup", "material_code", "status", "lado_menor_cm", "lado_maior_cm"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    material_code: str = ""
+    largura_cm: float = 0.0     # bbox
+    altura_cm: float = 0.0
+    lado_menor_cm: float = 0.0  # min/max da bbox: a procura não depende da orientação
+    lado_maior_cm: float = 0.0
+    area_cm2: float = 0.0
+    geometria_json: str = ""    # contorno em cm [[x, y], ...] (retângulo da bbox se vazio)
+    localizacao: str = ""       # onde está guardada (prateleira, armazém…)
+    status: str = "DISPONIVEL"  # DISPONIVEL | USADA | DESCARTADA
+    origem_quote_id: Optional[int] = Field(default=None, index=True)
+    usada_quote_id: Optional[int] = None
+    parent_id: Optional[int] = None     # sobra de onde esta saiu (sobra de sobra)
+    note: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    used_at: Optional[datetime] = None
+
 class NestLayout(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -290,6 +443,26 @@ class NestLayout(SQLModel, table=True):
     linked_quote_id: Optional[int] = None
 
 
+class NestJob(SQLModel, table=True):
+    # Pedidos de nesting em segundo plano. Os workers (app/nesting/jobs.py) escrevem com sqlite3
+    # direto, sem importar este módulo; o resultado final fica na cache de nesting (coluna `key`).
+    id: Optional[int] = Field(default=None, primary_key=True)
+    slot: str = Field(default="", index=True)   # quem acompanha (p.ex. sessão da página); um job vivo por slot
+    kind: str = "nest"          # nest | plan | alternatives
+    key: str = ""               # chave do pedido na cache (app/nesting/cache.py)
+    status: str = "PENDENTE"    # PENDENTE | A CORRER | CONCLUIDO | ERRO | CANCELADO | INTERROMPIDO
+    progress: float = 0.0       # 0..1
+    message: str = ""
+    best_count: int = 0
+    best_util: float = 0.0
+    best_json: str = ""         # melhor layout até agora: lista de Placement.as_dict()
+    time_limit_s: float = 0.0
+    pid: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 # --- ServiceCostHistory model ---
 class ServiceCostHistory(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -301,23 +474,30 @@ class ServiceCostHistory(SQLModel, table=True):
     changed_by: Optional[str] = None
 
 def init_db():
+    """Cria tabelas em falta e aplica as migrações versionadas pendentes."""
     SQLModel.metadata.create_all(engine)
+    run_migrations()
 
-def automate_statuses():
-    from datetime import datetime
-    with get_session() as s:
-        qs = s.exec(select(Quote)).all()
-        changed = 0
-        now = datetime.utcnow()
-        for q in qs:
-            if q.estado in ["ENVIADO"]:
-                if (now - q.data_criacao).days > (q.validade_dias or 30):
-                    q.estado = "EXPIRADO"; s.add(q); changed += 1
-            if q.trabalho_entregue and q.pago_total and q.estado not in ["ARQUIVADO"]:
-                q.estado = "ARQUIVADO"; s.add(q); changed += 1
-        if changed:
-            s.commit()
-    return True
+def automate_statuses() -> dict:
+    """Transições automáticas de estado, feitas na BD (sem carregar orçamentos):
+    - ENVIADO há mais de `validade_dias` (30 por omissão) dias → EXPIRADO
+    - entregue e pago na totalidade → ARQUIVADO
+    Devolve o nº de orçamentos alterados por transição.
+    """
+    now = datetime.utcnow().isoformat(sep=" ")
+    with engine.begin() as conn:
+        # (now - data_criacao).days > validade  ⇔  diferença em dias >= validade + 1
+        expirados = conn.exec_driver_sql(
+            "UPDATE quote SET estado = 'EXPIRADO' "
+            "WHERE estado = 'ENVIADO' "
+            "AND julianday(?) - julianday(data_criacao) >= COALESCE(NULLIF(validade_dias, 0), 30) + 1",
+            (now,),
+        ).rowcount
+        arquivados = conn.exec_driver_sql(
+            "UPDATE quote SET estado = 'ARQUIVADO' "
+            "WHERE trabalho_entregue = 1 AND pago_total = 1 AND estado <> 'ARQUIVADO'"
+        ).rowcount
+    return {"expirados": int(expirados or 0), "arquivados": int(arquivados or 0)}
 
 # --- Lightweight migration to ensure new Settings columns exist (SQLite) ---
 
@@ -515,13 +695,7 @@ def upgrade_services_machine_fk():
 
 def machine_cost_per_min(machine: Machine, settings: Settings) -> float:
     """Compute (energia + desgaste) + lucro for a machine, using global energy cost from settings."""
-    try:
-        energia_min = (float(machine.power_watts or 0.0) / 1000.0) * (1.0/60.0) * float(getattr(settings, 'energy_cost_eur_kwh', 0.0) or 0.0)
-        base_min = energia_min + float(machine.wear_cost_eur_per_min or 0.0)
-        lucro = base_min * (float(machine.markup_percent or 0.0) / 100.0)
-        return max(0.0, base_min + lucro)
-    except Exception:
-        return 0.0
+    return machine_cpm(machine, getattr(settings, 'energy_cost_eur_kwh', 0.0))
 
 # --- Lightweight migration to ensure QuoteItem.ink_ml exists (SQLite) ---
 
@@ -657,9 +831,77 @@ def _decrement_material_stock(session: Session, material_obj, used_amount: float
     return False, "sem_campo_stock"
 
 
+# --- Sobras (StockRemnant) ---
+# Abaixo disto (lado menor, cm) a sobra é desperdício e não entra no inventário
+REMNANT_MIN_SIDE_CM = 5.0
+
+
+def add_remnant(session: Session, material_code: str, largura_cm: float, altura_cm: float,
+                geometria=None, localizacao: str = "", origem_quote_id: Optional[int] = None,
+                parent_id: Optional[int] = None, note: Optional[str] = None) -> Optional[StockRemnant]:
+    """Regista uma sobra (sem commit). Devolve None se for pequena demais para guardar."""
+    w, h = float(largura_cm or 0.0), float(altura_cm or 0.0)
+    if min(w, h) < REMNANT_MIN_SIDE_CM:
+        return None
+    geo = geometria if geometria is not None else [[0.0, 0.0], [w, 0.0], [w, h], [0.0, h]]
+    rem = StockRemnant(
+        material_code=str(material_code or ""), largura_cm=w, altura_cm=h,
+        lado_menor_cm=min(w, h), lado_maior_cm=max(w, h), area_cm2=w * h,
+        geometria_json=json.dumps(geo), localizacao=localizacao,
+        origem_quote_id=origem_quote_id, parent_id=parent_id, note=note,
+    )
+    session.add(rem)
+    return rem
+
+
+def find_remnants(session: Session, material_code: str, min_w_cm: float = 0.0, min_h_cm: float = 0.0,
+                  limit: int = 50) -> list:
+    """Sobras disponíveis do material onde cabe um retângulo min_w×min_h (em qualquer orientação),
+    da menor para a maior (gastar primeiro as mais pequenas que servem)."""
+    short, long_ = sorted((float(min_w_cm or 0.0), float(min_h_cm or 0.0)))
+    q = (select(StockRemnant)
+         .where(StockRemnant.material_code == str(material_code or ""),
+                StockRemnant.status == "DISPONIVEL",
+                StockRemnant.lado_menor_cm >= short,
+                StockRemnant.lado_maior_cm >= long_)
+         .order_by(StockRemnant.area_cm2, StockRemnant.id)
+         .limit(int(limit)))
+    return list(session.exec(q).all())
+
+
+def consume_remnant(session: Session, remnant_id: int, quote_id: Optional[int] = None,
+                    leftover_cm: Optional[tuple] = None) -> Optional[StockRemnant]:
+    """Marca a sobra como usada (sem commit); `leftover_cm` = (largura, altura) do que ainda sobra dela."""
+    rem = session.get(StockRemnant, remnant_id)
+    if rem is None or rem.status != "DISPONIVEL":
+        return None
+    rem.status = "USADA"
+    rem.usada_quote_id = quote_id
+    rem.used_at = datetime.utcnow()
+    session.add(rem)
+    if leftover_cm:
+        add_remnant(session, rem.material_code, leftover_cm[0], leftover_cm[1], localizacao=rem.localizacao,
+                    origem_quote_id=quote_id, parent_id=rem.id)
+    return rem
+
+
+def _remnant_from_usage(session: Session, mat, used: float, quote_id: int) -> Optional[StockRemnant]:
+    """Chapa aberta e usada só em parte (fração de `used`): a faixa que sobra, a toda a largura, vai
+    para o inventário de sobras (a mesma forma que o planeador de nesting deixa na última chapa)."""
+    if str(getattr(mat, "tipo", "") or "").upper() != "AREA":
+        return None
+    w = float(getattr(mat, "largura_cm", 0.0) or 0.0)
+    h = float(getattr(mat, "altura_cm", 0.0) or 0.0)
+    frac = used - math.floor(used)
+    if w <= 0 or h <= 0 or frac <= 1e-6:
+        return None
+    return add_remnant(session, mat.code, w, h * (1.0 - frac), origem_quote_id=quote_id)
+
+
 def apply_stock_on_archive(session: Session, quote_id: int):
     """Percorre os itens do orçamento e lança baixas de stock para materiais.
     Regista sempre um StockMovement. Ignora serviços/minutos.
+    Chapas abertas só em parte: a sobra vai para StockRemnant e a chapa sai inteira do stock.
     """
     # evitar import circular
     from app.db import QuoteItem, Material
@@ -675,6 +917,8 @@ def apply_stock_on_archive(session: Session, quote_id: int):
         mat = session.exec(select(Material).where(Material.code == getattr(it,'code',''))).first()
         note = None
         if mat is not None:
+            if _remnant_from_usage(session, mat, used, quote_id) is not None:
+                used = float(math.ceil(used))
             ok, note = _decrement_material_stock(session, mat, used)
             if not ok and note:
                 session.add(StockMovement(quote_id=quote_id, code=getattr(it,'code',''), qty_delta=-used, unidade=getattr(it,'unidade',''), note=note))
@@ -684,6 +928,340 @@ def apply_stock_on_archive(session: Session, quote_id: int):
     session.commit()
 
 
+# --- Numeração de orçamentos (sequência por ano, sem saltos) ---
+
+def next_quote_number(session: Session, when: Optional[datetime] = None) -> str:
+    """Reserva o próximo número YYNNNN dentro da transação da sessão.
+    O incremento só fica gravado com o commit do orçamento (rollback não deixa
+    buracos) e duas sessões em simultâneo serializam no lock de escrita do SQLite.
+    """
+    yy = (when or datetime.utcnow()).strftime("%y")
+    row = session.connection().exec_driver_sql(
+        "INSERT INTO quotenumberseq (yy, last_value) VALUES (?, 1) "
+        "ON CONFLICT(yy) DO UPDATE SET last_value = last_value + 1 "
+        "RETURNING last_value",
+        (yy,),
+    ).first()
+    return f"{yy}{int(row[0]):04d}"
+
+
+def register_quote_number(session: Session, numero: Optional[str]):
+    """Avança a sequência quando um número YYNNNN é atribuído à mão (ex.: importação)."""
+    s = str(numero or "").strip()
+    if len(s) < 6 or not s.isdigit():
+        return
+    session.connection().exec_driver_sql(
+        "INSERT INTO quotenumberseq (yy, last_value) VALUES (?, ?) "
+        "ON CONFLICT(yy) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)",
+        (s[:2], int(s[2:])),
+    )
+
+
+def seed_quote_number_seq():
+    """Inicializa a sequência a partir dos números já existentes (máximo por ano)."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS quotenumberseq ("
+            "yy VARCHAR NOT NULL PRIMARY KEY, last_value INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO quotenumberseq (yy, last_value) "
+            "SELECT substr(numero, 1, 2), MAX(CAST(substr(numero, 3) AS INTEGER)) FROM quote "
+            "WHERE length(numero) >= 6 AND numero NOT GLOB '*[^0-9]*' "
+            "GROUP BY substr(numero, 1, 2) "
+            "ON CONFLICT(yy) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)"
+        )
+
+
+# --- Settings em cache (um snapshot só de leitura por processo) ---
+# Invalidado por um contador de versão, incrementado quando um commit altera Settings
+# (ver _settings_bump_on_commit); as leituras seguintes voltam a ir à BD uma única vez.
+
+class SettingsSnapshot:
+    """Vista só de leitura de Settings (mesmos atributos do modelo)."""
+    __slots__ = ("_values",)
+
+    def __init__(self, values: dict):
+        object.__setattr__(self, "_values", MappingProxyType(dict(values)))
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SettingsSnapshot é só de leitura; alterar em Parâmetros")
+
+    def model_dump(self) -> dict:
+        return dict(self._values)
+
+
+_settings_version = 0
+_settings_cache: Optional[SettingsSnapshot] = None
+_settings_cache_version = -1
+_settings_lock = threading.RLock()
+
+
+def settings_version() -> int:
+    return _settings_version
+
+
+def bump_settings_version():
+    global _settings_version
+    with _settings_lock:
+        _settings_version += 1
+
+
+def get_settings() -> SettingsSnapshot:
+    """Settings atuais (cria a linha por omissão se não existir). Sem acesso à BD enquanto a versão não mudar."""
+    global _settings_cache, _settings_cache_version
+    cached = _settings_cache
+    if cached is not None and _settings_cache_version == _settings_version:
+        return cached
+    with _settings_lock:
+        version = _settings_version
+        with get_session() as s:
+            cfg = s.exec(select(Settings)).first()
+            if cfg is None:
+                cfg = Settings(); s.add(cfg); s.commit(); s.refresh(cfg)
+            snap = SettingsSnapshot(cfg.model_dump())
+        _settings_cache, _settings_cache_version = snap, version
+        return snap
+
+
+# --- Snapshots de parâmetros de preço (pricing_snapshot) ---
+# Escritos uma vez por conteúdo distinto (hash); sempre que Settings/Machine mudam é criado o novo.
+
+SNAPSHOT_FIELDS = (
+    "margin_0_15", "margin_16_30", "margin_31_70", "margin_71_plus",
+    "vat_rate", "uv_ink_price_eur_ml", "energy_cost_eur_kwh",
+)
+SNAPSHOT_MACHINE_FIELDS = (
+    "id", "name", "power_watts", "wear_cost_eur_per_min", "markup_percent", "ink_price_eur_ml", "active",
+)
+
+
+def _current_snapshot_values(conn) -> dict:
+    row = conn.exec_driver_sql(f"SELECT {', '.join(SNAPSHOT_FIELDS)} FROM settings ORDER BY id LIMIT 1").first()
+    values = {k: float(v or 0.0) for k, v in zip(SNAPSHOT_FIELDS, row or (0.0,) * len(SNAPSHOT_FIELDS))}
+    machines = conn.exec_driver_sql(f"SELECT {', '.join(SNAPSHOT_MACHINE_FIELDS)} FROM machine ORDER BY id").all()
+    values["machines"] = [dict(zip(SNAPSHOT_MACHINE_FIELDS, m)) for m in machines]
+    return values
+
+
+def _upsert_pricing_snapshot(conn, values: dict) -> int:
+    payload = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    row = conn.exec_driver_sql("SELECT id FROM pricing_snapshot WHERE content_hash = ?", (digest,)).first()
+    if row is not None:
+        return int(row[0])
+    return int(conn.exec_driver_sql(
+        f"INSERT INTO pricing_snapshot (content_hash, created_at, {', '.join(SNAPSHOT_FIELDS)}, machines_json) "
+        f"VALUES ({', '.join('?' * (len(SNAPSHOT_FIELDS) + 3))}) "
+        "ON CONFLICT(content_hash) DO UPDATE SET content_hash = excluded.content_hash RETURNING id",
+        (digest, datetime.utcnow(), *(float(values.get(k) or 0.0) for k in SNAPSHOT_FIELDS),
+         json.dumps(values.get("machines") or [], sort_keys=True, default=str)),
+    ).scalar_one())
+
+
+def current_pricing_snapshot_id(session: Session) -> int:
+    """Id do snapshot dos parâmetros atuais (cria-o na transação da sessão se ainda não existir)."""
+    conn = session.connection()
+    return _upsert_pricing_snapshot(conn, _current_snapshot_values(conn))
+
+
+def _snapshot_values_from_legacy(blob: dict) -> dict:
+    m = blob.get("margins") or {}
+    return {
+        "margin_0_15": float(m.get("0_15") or 0.0),
+        "margin_16_30": float(m.get("16_30") or 0.0),
+        "margin_31_70": float(m.get("31_70") or 0.0),
+        "margin_71_plus": float(m.get("71_plus") or 0.0),
+        "vat_rate": float(blob.get("iva_percent") or 0.0),
+        "uv_ink_price_eur_ml": float(blob.get("uv_ink_price_eur_ml") or 0.0),
+        "energy_cost_eur_kwh": float((blob.get("laser") or {}).get("energia_eur_kwh") or 0.0),
+        "machines": [],
+    }
+
+
+def migrate_pricing_snapshots():
+    """Cria quoteitem.pricing_snapshot_id e converte os snapshot_json existentes em linhas de pricing_snapshot."""
+    with engine.begin() as conn:
+        cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info('quoteitem')")}
+        if "pricing_snapshot_id" not in cols:
+            conn.exec_driver_sql("ALTER TABLE quoteitem ADD COLUMN pricing_snapshot_id INTEGER REFERENCES pricing_snapshot (id)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_quoteitem_pricing_snapshot_id ON quoteitem (pricing_snapshot_id)")
+        rows = conn.exec_driver_sql(
+            "SELECT id, snapshot_json FROM quoteitem WHERE snapshot_json IS NOT NULL AND pricing_snapshot_id IS NULL").all()
+        ids_by_hash = {}
+        updates = []
+        for item_id, raw in rows:
+            try:
+                values = _snapshot_values_from_legacy(json.loads(raw))
+            except Exception:
+                continue  # blob ilegível: fica como está
+            key = json.dumps(values, sort_keys=True)
+            if key not in ids_by_hash:
+                ids_by_hash[key] = _upsert_pricing_snapshot(conn, values)
+            updates.append((ids_by_hash[key], item_id))
+        if updates:
+            conn.exec_driver_sql("UPDATE quoteitem SET pricing_snapshot_id = ?, snapshot_json = NULL WHERE id = ?", updates)
+        _upsert_pricing_snapshot(conn, _current_snapshot_values(conn))
+
+
+# --- Totais materializados por orçamento (quote_totals) ---
+# O cálculo é o do motor de preços (app/pricing.py), o mesmo usado pelas páginas e pelo PDF.
+
+def _settings_row(conn) -> PricingParams:
+    keys = ("margin_0_15", "margin_16_30", "margin_31_70", "margin_71_plus", "uv_ink_price_eur_ml")
+    row = conn.exec_driver_sql(f"SELECT {', '.join(keys)} FROM settings ORDER BY id LIMIT 1").first()
+    if row is None:
+        return PricingParams()
+    return PricingParams(**{k: float(v or 0.0) for k, v in zip(keys, row)})
+
+
+def refresh_quote_totals(conn, quote_ids=None, open_only=False):
+    """Recalcula e grava quote_totals para `quote_ids` (None = todos), na ligação/transação dada.
+    `open_only`: deixa os arquivados como estão (fechados, não acompanham os parâmetros atuais)."""
+    if quote_ids is not None:
+        quote_ids = sorted({int(q) for q in quote_ids if q is not None})
+        if not quote_ids:
+            return
+    params = _settings_row(conn)
+
+    def _in(col):
+        conds, args = [], ()
+        if quote_ids is not None:
+            conds.append(f"{col} IN ({', '.join('?' * len(quote_ids))})")
+            args = tuple(quote_ids)
+        if open_only:
+            conds.append(f"{col} IN (SELECT id FROM quote WHERE estado <> 'ARQUIVADO')")
+        return (" WHERE " + " AND ".join(conds) if conds else ""), args
+
+    where, args = _in("id")
+    quotes = conn.exec_driver_sql(
+        f"SELECT id, {', '.join(QUOTE_COLUMNS)} FROM quote{where}", args).all()
+    where, args = _in("quote_id")
+    items = conn.exec_driver_sql(f"SELECT {', '.join(ITEM_COLUMNS)} FROM quoteitem{where}", args).all()
+    # itens com snapshot são preçados com os parâmetros desse snapshot (margens, tinta, custo/min das máquinas)
+    snapshots = conn.exec_driver_sql(
+        f"SELECT id, {', '.join(SNAPSHOT_COLUMNS)} FROM pricing_snapshot "
+        f"WHERE id IN (SELECT pricing_snapshot_id FROM quoteitem{where})", args).all()
+    service_cols = (*SERVICE_COLUMNS, *SERVICE_MACHINE_COLUMNS)
+    services = pd.DataFrame.from_records(
+        conn.exec_driver_sql(f"SELECT id, {', '.join(service_cols)} FROM service").all(),
+        columns=["id", *service_cols]).set_index("id")
+
+    lines = price_items(items, params, services, snapshots=snapshots)
+    totals = quotes_summary(lines, quotes, params)
+    now = datetime.utcnow()
+    rows = [(int(qid), int(r[0]), *map(float, r[1:]), now)
+            for qid, r in zip(totals.index, totals[list(TOTAL_COLUMNS)].itertuples(index=False))]
+    if rows:
+        cols = ", ".join(TOTAL_COLUMNS)
+        conn.exec_driver_sql(
+            f"INSERT INTO quote_totals (quote_id, {cols}, updated_at) "
+            f"VALUES ({', '.join('?' * (len(TOTAL_COLUMNS) + 2))}) "
+            "ON CONFLICT(quote_id) DO UPDATE SET "
+            + ", ".join(f"{c}=excluded.{c}" for c in (*TOTAL_COLUMNS, "updated_at")),
+            rows,
+        )
+    if quote_ids is not None:
+        present = {int(q) for q in totals.index}
+        gone = [q for q in quote_ids if q not in present]
+        if gone:
+            conn.exec_driver_sql(
+                f"DELETE FROM quote_totals WHERE quote_id IN ({', '.join('?' * len(gone))})", tuple(gone))
+
+
+@event.listens_for(_OrmSession, "before_flush")
+def _collect_flush_targets(session, _flush_context, _instances):
+    touched = session.info.setdefault("_quote_totals_dirty", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Settings):
+            session.info["_settings_changed"] = True
+        if isinstance(obj, (Settings, Machine)):
+            session.info["_pricing_snapshot_dirty"] = True
+        if isinstance(obj, (Settings, Service)):
+            # margens/preço da tinta/custos de serviço mexem em todos os orçamentos em aberto
+            session.info["_quote_totals_all"] = True
+        elif isinstance(obj, QuoteItem):
+            touched.add(obj.quote_id)
+        elif isinstance(obj, Quote) and obj.id is not None:
+            touched.add(obj.id)
+
+
+@event.listens_for(_OrmSession, "after_flush")
+def _refresh_after_flush(session, _flush_context):
+    if session.info.pop("_pricing_snapshot_dirty", False):
+        conn = session.connection()
+        _upsert_pricing_snapshot(conn, _current_snapshot_values(conn))
+    touched = session.info.pop("_quote_totals_dirty", None)
+    if session.info.pop("_quote_totals_all", False):
+        conn = session.connection()
+        # os arquivados ficam com os totais com que fecharam; só os tocados neste flush são refeitos
+        refresh_quote_totals(conn, open_only=True)
+        if touched:
+            refresh_quote_totals(conn, touched)
+        return
+    # orçamentos novos só têm id depois do flush
+    touched = set(touched or ()) | {o.id for o in session.new if isinstance(o, Quote)}
+    if touched:
+        refresh_quote_totals(session.connection(), touched)
+
+
+@event.listens_for(_OrmSession, "after_commit")
+def _settings_bump_on_commit(session):
+    if session.info.pop("_settings_changed", False):
+        bump_settings_version()
+
+
+@event.listens_for(_OrmSession, "after_rollback")
+def _settings_discard_on_rollback(session):
+    session.info.pop("_settings_changed", None)
+
+
+def load_quote_totals(session: Session, quote_ids=None) -> dict:
+    """Mapa {quote_id: QuoteTotals} (uma linha por orçamento)."""
+    stmt = select(QuoteTotals)
+    if quote_ids is not None:
+        stmt = stmt.where(QuoteTotals.quote_id.in_(list(quote_ids)))
+    return {t.quote_id: t for t in session.exec(stmt).all()}
+
+
+def load_pricing_snapshots(session: Session, items) -> list:
+    """PricingSnapshot referenciados pelos itens (para price_items(..., snapshots=...))."""
+    ids = {it.pricing_snapshot_id for it in items if getattr(it, "pricing_snapshot_id", None) is not None}
+    if not ids:
+        return []
+    return session.exec(select(PricingSnapshot).where(PricingSnapshot.id.in_(sorted(ids)))).all()
+
+
+def load_open_pipeline():
+    """Itens, orçamentos e serviços do pipeline aberto (não arquivado) em DataFrames (simulador de Parâmetros)."""
+    with engine.connect() as conn:
+        quotes = conn.exec_driver_sql(
+            f"SELECT id, numero, cliente_id, estado, {', '.join(QUOTE_COLUMNS)} FROM quote WHERE estado <> 'ARQUIVADO'").all()
+        items = conn.exec_driver_sql(
+            f"SELECT {', '.join('i.' + c for c in ITEM_COLUMNS)} FROM quoteitem i "
+            "JOIN quote q ON q.id = i.quote_id WHERE q.estado <> 'ARQUIVADO'").all()
+        services = conn.exec_driver_sql(
+            f"SELECT id, {', '.join(SERVICE_COLUMNS)}, machine_id, machine_type FROM service").all()
+    return (
+        pd.DataFrame.from_records(items, columns=list(ITEM_COLUMNS)),
+        pd.DataFrame.from_records(quotes, columns=["id", "numero", "cliente_id", "estado", *QUOTE_COLUMNS]).set_index("id"),
+        pd.DataFrame.from_records(services, columns=["id", *SERVICE_COLUMNS, "machine_id", "machine_type"]).set_index("id"),
+    )
+
+
+def backfill_quote_totals():
+    # os totais leem quoteitem.pricing_snapshot_id: numa BD anterior à v6 a coluna ainda não existe
+    migrate_pricing_snapshots()
+    with engine.begin() as conn:
+        refresh_quote_totals(conn)
+
+
 # --- Convenience: run all safe upgrades for app startup ---
 
 def upgrade_all_safe():
@@ -703,3 +1281,106 @@ def upgrade_all_safe():
     upgrade_machines_table()
     seed_default_machines_from_settings()
     upgrade_services_machine_fk()
+
+
+# --- Migrações versionadas (tabela schema_version) ---
+# Cada passo corre uma única vez por base de dados; a versão aplicada fica
+# registada em `schema_version`. Para alterar o esquema, acrescentar um passo
+# novo no fim de MIGRATIONS (nunca reordenar nem reutilizar números).
+
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "schema_version"
+    version: int = Field(primary_key=True)
+    name: str = ""
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def create_declared_indexes():
+    """Cria (se faltarem) todos os índices declarados nos modelos.
+    Índices únicos que colidam com duplicados já existentes são ignorados:
+    a BD continua a funcionar com o índice simples até os dados serem corrigidos.
+    Índices sobre colunas que ainda não existem ficam para a migração que as adiciona.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        with engine.connect() as conn:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info('{table.name}')")}
+        for idx in sorted(table.indexes, key=lambda i: i.name or ""):
+            if any(col.name not in existing for col in idx.columns):
+                continue
+            try:
+                with engine.begin() as conn:
+                    idx.create(conn, checkfirst=True)
+            except Exception:
+                if not idx.unique:
+                    raise
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[], None]]] = [
+    (1, "legacy_upgrades", upgrade_all_safe),
+    (2, "secondary_indexes", create_declared_indexes),
+    (3, "pending_archive_index", create_declared_indexes),
+    (4, "quote_number_seq", seed_quote_number_seq),
+    (5, "quote_totals", backfill_quote_totals),
+    (6, "pricing_snapshots", migrate_pricing_snapshots),
+    (7, "stock_remnants", create_declared_indexes),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Versão já garantida neste processo (evita ir à BD em cada rerun do Streamlit)
+_schema_version_ready = 0
+_schema_lock = threading.Lock()
+# Já houve uma tentativa de migrar neste processo (a primeira falha sobe; as seguintes só ficam no log)
+_migrations_tried = False
+
+
+def get_schema_version() -> int:
+    """Versão atual registada na BD (0 se ainda não houver migrações)."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL DEFAULT '', applied_at TIMESTAMP NOT NULL)"
+        )
+        row = conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").first()
+    return int(row[0] or 0) if row else 0
+
+
+def run_migrations() -> int:
+    """Aplica, por ordem, os passos de MIGRATIONS ainda não registados.
+    Devolve a versão final. Se um passo falhar, pára nesse ponto (sem o registar)
+    para voltar a ser tentado na próxima execução; o erro vai para o log com a versão e o
+    nome do passo e, na primeira execução do processo, é relançado.
+    """
+    global _schema_version_ready, _migrations_tried
+    with _schema_lock:
+        first, _migrations_tried = not _migrations_tried, True
+        current = get_schema_version()
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                step()
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(
+                        "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                        (version, name, datetime.utcnow()),
+                    )
+            except Exception:
+                log.exception("Migração %s (%s) falhou; o esquema fica na versão %s", version, name, current)
+                _schema_version_ready = current
+                if first:
+                    raise
+                break
+            current = version
+        _schema_version_ready = current
+    return current
+
+
+def ensure_schema():
+    """Garante o esquema atualizado. Depois da primeira chamada no processo,
+    custa apenas uma comparação de inteiros (seguro chamar em cada rerun).
+    """
+    if _schema_version_ready >= SCHEMA_VERSION:
+        return
+    init_db()
@@ -0,0 +1,34 @@
+# app/nesting — Motor de nesting sem UI (usado por pages/9_Calculos.py e pela CLI)
+#
+#   from app.nesting import NestRequest, Sheet, piece_from_image, nest
+#   res = nest(NestRequest(piece=piece_from_image(img, 12, 8), sheet=Sheet(60, 40, 0.5), gap_cm=0.4))
+#   res = nest(NestRequest(piece=piece_from_vector(open("peca.dxf", "rb").read(), "peca.dxf"), sheet=...))
+#   mix = nest_parts(MultiNestRequest(parts=[PartSpec(a, 10), PartSpec(b, 4, angles=[0, 90])], sheet=...))
+#
+# CLI: python -m app.nesting --help
+from app.nesting.core import (
+    Sheet, Piece, NestRequest, Placement, NestResult, Job,
+    PartSpec, MultiNestRequest, MultiNestResult,
+    STRATEGIES, register_strategy, prepare,
+)
+from app.nesting.detect import detect_piece, piece_from_image
+from app.nesting.vector import VectorOutline, load_vector, piece_from_vector, is_vector
+from app.nesting.render import render_layout
+from app.nesting.raster import greedy_nest
+from app.nesting.engine import nest
+from app.nesting.rectpack import is_rectangular
+from app.nesting.multi import nest_parts
+from app.nesting.anneal import anneal_parts
+from app.nesting.planner import (
+    Remnant, RemnantUse, SheetPlan, SheetOption, sheet_options, plan_single, plan_parts, plan_alternatives,
+)
+
+__all__ = [
+    "Sheet", "Piece", "NestRequest", "Placement", "NestResult", "Job",
+    "PartSpec", "MultiNestRequest", "MultiNestResult",
+    "STRATEGIES", "register_strategy", "prepare",
+    "detect_piece", "piece_from_image", "VectorOutline", "load_vector", "piece_from_vector", "is_vector",
+    "render_layout", "greedy_nest", "nest", "nest_parts", "anneal_parts",
+    "is_rectangular",
+    "Remnant", "RemnantUse", "SheetPlan", "SheetOption", "sheet_options", "plan_single", "plan_parts", "plan_alternatives",
+]
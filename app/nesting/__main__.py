@@ -0,0 +1,5 @@
+import sys
+
+from app.nesting.cli import main
+
+sys.exit(main())
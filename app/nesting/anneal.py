@@ -0,0 +1,239 @@
+# app/nesting/anneal.py — Melhoria "anytime" por recozimento simulado sobre a ordem e a rotação das peças
+#
+# Genoma = uma lista de genes (peça, escolha de ângulo), um por cópia; a escolha é um índice em
+# `angles` da peça ou -1 (o melhor ângulo bottom-left, como no modo NFP). O descodificador coloca os genes
+# por ordem com o empacotador NFP; se o ângulo do gene não cabe tenta os restantes, e uma peça que já não
+# cabe em ângulo nenhum fica fechada (a região livre só encolhe).
+# - O genoma inicial é o guloso (ordem por área, todos -1), descodificado uma vez no processo principal e
+#   guardado como resultado de recurso: o resultado nunca é pior que o NFP, mesmo que nenhuma cadeia acabe.
+# - Energia = −área colocada (em peças médias) + ½ × altura ocupada / altura da chapa.
+# - Cada avaliação recomeça do primeiro gene alterado: guardam-se os estados do empacotador do genoma atual.
+# - Uma cadeia por worker (sementes seed, seed+1, …) até ao prazo; fica a melhor. O melhor até agora é
+#   sempre um layout válido, por isso parar no prazo devolve-o tal como está. O descodificador também
+#   pára no prazo (a meio do genoma), para as cadeias devolverem o melhor antes de o pool as largar.
+from __future__ import annotations
+from typing import Callable, List, Optional, Sequence, Tuple
+import math
+import random
+import time
+
+import numpy as np
+
+from app.nesting.core import REPORT_EVERY_S, Job, MultiNestRequest, MultiNestResult, Placement, register_strategy
+from app.nesting.multi import ORDERS, prepare_parts
+from app.nesting.nfp import NfpPacker, NfpShape, SHAPELY_OK, rotated_size, shape_from_job
+from app.nesting.parallel import resolve_workers, run_trials
+
+try:
+    import shapely
+except Exception:
+    pass
+
+# temperatura inicial/final (em peças médias de energia)
+T_START = 1.0
+T_END = 0.01
+
+Gene = Tuple[int, int]      # (índice da peça, índice do ângulo ou -1)
+
+
+class _Decoder:
+    def __init__(self, shapes: Sequence[NfpShape], angles: Sequence[Sequence[int]], areas: Sequence[float],
+                 sheet_w: int, sheet_h: int, deadline: Optional[float] = None):
+        self.shapes, self.angles, self.areas = shapes, angles, areas
+        self.sheet_h = float(sheet_h)
+        self.unit = float(np.mean(areas)) or 1.0
+        self.packer = NfpPacker(sheet_w, sheet_h, deadline=deadline)
+        self.bottoms = {}       # (forma, ângulo) → maxy do polígono rodado
+
+    def _bottom(self, i: int, ang: int) -> float:
+        b = self.bottoms.get((i, ang))
+        if b is None:
+            b = self.bottoms[(i, ang)] = self.shapes[i].frame(ang)[2][3]
+        return b
+
+    def run(self, genome: Sequence[Gene], start: int = 0, states: Optional[list] = None):
+        """Descodifica a partir do gene `start` (estados[start] tem de existir). Devolve
+        (energia, colocações [(peça, ângulo, x, y)], estados por gene). No prazo pára onde está: as
+        colocações são um layout válido (parcial) e há estados só até ao gene em que parou."""
+        packer = self.packer
+        if start and states:
+            snap, placed, closed, area, low = states[start]
+            packer.restore(snap)
+            placed, closed = list(placed), set(closed)
+            new_states = states[:start]
+        else:
+            packer.restore(((), {}))
+            placed, closed, area, low, start = [], set(), 0.0, 0.0, 0
+            new_states = []
+        for k in range(start, len(genome)):
+            if packer.expired():
+                break
+            new_states.append((packer.snapshot(), tuple(placed), frozenset(closed), area, low))
+            i, a = genome[k]
+            if i in closed:
+                continue
+            angs = self.angles[i]
+            p = packer.place(self.shapes[i], [angs[a]]) if a >= 0 else None
+            if p is None:
+                p = packer.place(self.shapes[i], angs)
+            if p is None:
+                closed.add(i)
+                if len(closed) == len(self.shapes):
+                    break
+                continue
+            placed.append((i, p.ang, p.x, p.y))
+            area += self.areas[i]
+            low = max(low, p.y + self._bottom(i, p.ang))
+        energy = -area / self.unit + 0.5 * low / self.sheet_h
+        return energy, placed, new_states
+
+
+def _mutate(genome: List[Gene], angles: Sequence[Sequence[int]], rng: random.Random,
+            active: Optional[int] = None) -> Tuple[List[Gene], int]:
+    """Vizinho do genoma e o índice do primeiro gene alterado (< `active`: os genes depois do ponto em que
+    o descodificador parou não contam)."""
+    g = list(genome)
+    n = len(g)
+    m = max(1, min(n, active or n))
+    mixed = len({i for i, _ in g}) > 1
+    r = rng.random()
+    if mixed and r < 0.3:
+        k, l = rng.randrange(m), rng.randrange(n)
+        g[k], g[l] = g[l], g[k]
+        return g, min(k, l)
+    if mixed and r < 0.5:
+        k, l = rng.randrange(n), rng.randrange(m)
+        g.insert(l, g.pop(k))
+        return g, min(k, l)
+    k = rng.randrange(m)
+    i, _ = g[k]
+    g[k] = (i, rng.randrange(-1, len(angles[i])))
+    return g, k
+
+
+def anneal(decoder: _Decoder, genome: List[Gene], deadline: float, rng: random.Random,
+           on_best: Optional[Callable[[list], None]] = None, first: Optional[tuple] = None):
+    """Recozimento até ao prazo; devolve (energia, colocações, genoma, avaliações) do melhor visto.
+    `on_best(colocações)` recebe o melhor até agora, no início e depois no máximo a cada REPORT_EVERY_S.
+    `first`: decoder.run(genome) já feito (o guloso do processo principal)."""
+    t0 = time.time()
+    span = max(1e-3, deadline - t0)
+    e_cur, placed, states = first or decoder.run(genome)
+    best = (e_cur, placed, genome)
+    evals = 0 if first else 1
+    cur = genome
+    if on_best is not None:
+        on_best(placed)
+    reported = t0
+    while time.time() < deadline and len(cur) > 0:
+        now = time.time()
+        if on_best is not None and now - reported >= REPORT_EVERY_S:
+            on_best(best[1])
+            reported = now
+        frac = min(1.0, (now - t0) / span)
+        temp = T_START * (T_END / T_START) ** frac
+        cand, k = _mutate(cur, decoder.angles, rng, len(states))
+        e, placed_c, states_c = decoder.run(cand, k, states)
+        evals += 1
+        if e <= e_cur or rng.random() < math.exp(-(e - e_cur) / temp):
+            cur, e_cur, states = cand, e, states_c
+            if e < best[0]:
+                best = (e, placed_c, cand)
+    return best[0], best[1], best[2], evals
+
+
+def _anneal_task(items, sheet_w, sheet_h, genome, deadline, seed, shuffle):
+    """Worker: reconstrói as formas (WKB) e corre uma cadeia com a sua semente."""
+    shapes = [NfpShape(shapely.from_wkb(wkb), tuple(size), gap=gap) for wkb, size, gap, _, _ in items]
+    decoder = _Decoder(shapes, [it[3] for it in items], [it[4] for it in items], sheet_w, sheet_h, deadline)
+    rng = random.Random(seed)
+    if shuffle:
+        # cadeias além da primeira partem de um vizinho aleatório do guloso, para explorar mais
+        for _ in range(max(1, len(genome) // 4)):
+            genome, _ = _mutate(genome, decoder.angles, rng)
+    return anneal(decoder, genome, deadline, rng)
+
+
+def _search(shapes, angles, areas, quantities, order_key, sheet_w, sheet_h, deadline, seed, workers, on_best=None):
+    """Genoma guloso + cadeias em paralelo; devolve (colocações, stats). O guloso é descodificado aqui e
+    fica como recurso (nenhuma cadeia a tempo = layout do NFP); `on_best` vê-o já e, em série, o resto."""
+    genome: List[Gene] = [(i, -1) for i in sorted(range(len(shapes)), key=order_key) for _ in range(quantities[i])]
+    workers = resolve_workers(workers)
+    base = seed if seed is not None else random.randrange(2**31)
+    decoder = _Decoder(shapes, angles, areas, sheet_w, sheet_h, deadline)
+    greedy = decoder.run(genome)
+    if workers <= 1:
+        results = [anneal(decoder, genome, deadline, random.Random(base), on_best, first=greedy)]
+    else:
+        if on_best is not None:
+            on_best(greedy[1])
+        items = [(shapely.to_wkb(s.poly), s.tex_size, s.gap, list(a), ar) for s, a, ar in zip(shapes, angles, areas)]
+        args = [(items, sheet_w, sheet_h, genome, deadline, base + w, w > 0) for w in range(workers)]
+        results = run_trials(_anneal_task, args, deadline, workers)
+    done = [i for i, r in enumerate(results) if r is not None]
+    stats = {"evals": 1 + sum(results[i][3] for i in done), "runs": len(done)}
+    best_i = min(done, key=lambda i: (results[i][0], i), default=None)
+    if best_i is None or greedy[0] < results[best_i][0]:
+        return greedy[1], dict(stats, seed=None, energy=round(greedy[0], 4))
+    return results[best_i][1], dict(stats, seed=base + best_i, energy=round(results[best_i][0], 4))
+
+
+@register_strategy("anneal")
+def anneal_nest(job: Job):
+    """Modo NFP melhorado por recozimento durante todo o tempo do pedido."""
+    if not SHAPELY_OK:
+        raise RuntimeError("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+    shape = shape_from_job(job)
+    area = float(job.mask.sum())
+    area_total = float(job.sheet_w * job.sheet_h)
+    # teto de cópias: nunca cabem mais do que a área da chapa / área da peça
+    bound = max(1, int(area_total // max(1.0, area)))
+
+    def on_best(placed):
+        # sem texturas: quem acompanha só precisa das posições
+        job.report([Placement(int(round(x)), int(round(y)), ang, *rotated_size(*job.tex.size, ang))
+                    for _, ang, x, y in placed], len(placed) * area / area_total * 100.0)
+
+    placed, stats = _search([shape], [job.angles], [area], [bound], lambda i: i,
+                            job.sheet_w, job.sheet_h, job.deadline, job.request.seed, job.request.workers,
+                            on_best if job.progress is not None else None)
+    textures = {}
+    placements = []
+    for _, ang, x, y in placed:
+        if ang not in textures:
+            textures[ang] = job.tex.rotate(ang, expand=True)
+        tex = textures[ang]
+        placements.append(Placement(int(round(x)), int(round(y)), ang, tex.size[0], tex.size[1], tex))
+    util = len(placements) * area / float(job.sheet_w * job.sheet_h) * 100.0
+    return placements, util, stats
+
+
+def anneal_parts(request: MultiNestRequest, seed: Optional[int] = None, workers: int = 0) -> MultiNestResult:
+    """Como nest_parts, mas usa todo o `time_limit_s` a melhorar ordem e rotações (melhor até ao prazo)."""
+    t0 = time.perf_counter()
+    deadline = time.time() + float(request.time_limit_s)
+    parts = prepare_parts(request)
+    sheet_w, sheet_h = request.sheet.usable_px(float(request.dpi))
+    order = ORDERS[request.order]
+    placed, stats = _search([p.shape for p in parts], [p.angles for p in parts], [p.area for p in parts],
+                            [p.quantity for p in parts], lambda i: order(parts[i]),
+                            sheet_w, sheet_h, deadline, seed, workers)
+    placements = []
+    counts = [0] * len(parts)
+    for i, ang, x, y in placed:
+        tex = parts[i].texture(ang)
+        placements.append(Placement(int(round(x)), int(round(y)), ang, tex.size[0], tex.size[1], tex, part=i))
+        counts[i] += 1
+    area_total = float(sheet_w) * float(sheet_h)
+    used = sum(parts[i].area * n for i, n in enumerate(counts))
+    return MultiNestResult(
+        placements=placements,
+        utilization=(used / area_total * 100.0) if area_total else 0.0,
+        sheet_px=(sheet_w, sheet_h),
+        dpi=float(request.dpi),
+        names=[p.name for p in parts],
+        requested=[p.quantity for p in parts],
+        placed=counts,
+        elapsed_s=time.perf_counter() - t0,
+        stats=dict(stats, order=request.order),
+    )
@@ -0,0 +1,326 @@
+# app/nesting/cache.py — Cache endereçada por conteúdo: contorno/polígono, layout e PNG
+#
+# Chave = sha256 dos bytes de entrada (imagem/SVG/DXF carregado ou píxeis da peça) + todos os parâmetros que
+# mudam o resultado. Duas camadas:
+# - memória: LRU com os objetos completos (texturas incluídas), para os reruns do Streamlit;
+# - disco: data/nesting_cache/<tipo>/<ab>/<chave>.pkl (.bin para os PNG), para trabalhos repetidos noutros dias.
+#   No disco os layouts vão sem imagens; as texturas refazem-se da peça (redimensionar + rodar é barato).
+# Escrita atómica (ficheiro temporário + os.replace); ficheiros ilegíveis contam como falha e são apagados.
+# O disco é podado pelos mais antigos (mtime) quando passa de `max_disk_bytes`.
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+from PIL import Image
+
+from app.nesting.core import MultiNestRequest, NestRequest, NestResult, Placement, SHAPELY_OK, scale_piece
+from app.nesting.detect import detect_piece
+from app.nesting.vector import FLATTEN_TOL_CM, load_vector
+
+if TYPE_CHECKING:
+    from app.nesting.planner import AlternativesRequest
+
+try:
+    import shapely
+except Exception:
+    pass
+
+# mesma pasta de dados que app.db.DATA_DIR (sem importar app.db: os workers não carregam Streamlit),
+# a partir do módulo e não da pasta onde se arrancou o Streamlit/CLI
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+CACHE_DIR = DATA_DIR / "nesting_cache"
+# sobe quando o formato do que se guarda muda (invalida o disco sem o apagar à mão)
+CACHE_VERSION = 2
+
+
+def digest(*chunks) -> str:
+    """sha256 de uma sequência de bytes/str/números (com separador, para 'ab'+'c' ≠ 'a'+'bc')."""
+    h = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for c in chunks:
+        if not isinstance(c, (bytes, bytearray, memoryview)):
+            c = str(c).encode()
+        h.update(len(c).to_bytes(8, "little"))
+        h.update(c)
+    return h.hexdigest()
+
+
+def _piece_chunks(piece) -> list:
+    img = piece.image.convert("RGBA")
+    poly = shapely.to_wkb(piece.polygon) if piece.polygon is not None and SHAPELY_OK else b""
+    return [img.size, img.tobytes(), poly, float(piece.width_cm), float(piece.height_cm), bool(piece.exact)]
+
+
+def request_key(request: NestRequest) -> str:
+    params = {
+        "sheet": [request.sheet.width_cm, request.sheet.height_cm, request.sheet.margin_cm],
+        "gap_cm": float(request.gap_cm), "dpi": float(request.dpi), "angles": [int(a) for a in request.angles],
+        "strategy": request.strategy, "time_limit_s": float(request.time_limit_s),
+        "max_trials": int(request.max_trials), "seed": request.seed, "guillotine": bool(request.guillotine),
+    }
+    return digest("nest", *_piece_chunks(request.piece), json.dumps(params, sort_keys=True))
+
+
+def parts_key(request: MultiNestRequest) -> str:
+    chunks: list = ["parts"]
+    for spec in request.parts:
+        chunks += _piece_chunks(spec.piece)
+        chunks += [int(spec.quantity), None if spec.angles is None else [int(a) for a in spec.angles]]
+    params = {
+        "sheet": [request.sheet.width_cm, request.sheet.height_cm, request.sheet.margin_cm],
+        "gap_cm": float(request.gap_cm), "dpi": float(request.dpi), "angles": [int(a) for a in request.angles],
+        "order": request.order, "time_limit_s": float(request.time_limit_s),
+        "remnants": [[r.id, r.width_cm, r.height_cm] for r in request.remnants],
+    }
+    return digest(*chunks, json.dumps(params, sort_keys=True))
+
+
+def alternatives_key(request: AlternativesRequest) -> str:
+    opts = [[o.name, o.sheet.width_cm, o.sheet.height_cm, o.sheet.margin_cm, float(o.price), o.stock]
+            for o in request.options]
+    return digest("alternatives", parts_key(request.request), json.dumps(opts, sort_keys=True))
+
+
+class TieredCache:
+    def __init__(self, root: Path = CACHE_DIR, max_items: int = 64, max_disk_bytes: int = 512 * 2**20):
+        self.root = Path(root)
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._mem: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _path(self, kind: str, key: str, ext: str) -> Path:
+        return self.root / kind / key[:2] / f"{key}{ext}"
+
+    # --- memória ---
+    def _mem_get(self, kind: str, key: str):
+        with self._lock:
+            v = self._mem.get((kind, key))
+            if v is not None:
+                self._mem.move_to_end((kind, key))
+            return v
+
+    def _mem_put(self, kind: str, key: str, value):
+        with self._lock:
+            self._mem[(kind, key)] = value
+            self._mem.move_to_end((kind, key))
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    # --- disco ---
+    def _read(self, path: Path, raw: bool):
+        try:
+            data = path.read_bytes()
+            value = data if raw else pickle.loads(data)
+            os.utime(path)      # conta como uso recente para a poda
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception:
+            path.unlink(missing_ok=True)
+            return None
+
+    def _write(self, path: Path, data: bytes):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return      # disco cheio/só leitura: fica só a memória
+        self._puts += 1
+        if self._puts % 32 == 0:
+            self.prune()
+
+    def prune(self):
+        """Apaga os ficheiros menos usados até o total caber em `max_disk_bytes`."""
+        if not self.root.exists():
+            return
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.rglob("*") if p.is_file()]
+        total = sum(s for _, s, _ in files)
+        for _, size, p in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    # --- API ---
+    def get(self, kind: str, key: str, raw: bool = False):
+        """Objeto da memória ou do disco (promovido à memória); None se não existir."""
+        v = self._mem_get(kind, key)
+        if v is not None:
+            self.hits["memory"] += 1
+            return v
+        v = self._read(self._path(kind, key, ".bin" if raw else ".pkl"), raw)
+        if v is None:
+            self.misses += 1
+            return None
+        self.hits["disk"] += 1
+        self._mem_put(kind, key, v)
+        return v
+
+    def put(self, kind: str, key: str, value, disk_value=None, raw: bool = False):
+        """Guarda `value` na memória e `disk_value` (ou `value`) no disco; `raw` = bytes tal como estão."""
+        self._mem_put(kind, key, value)
+        stored = value if disk_value is None else disk_value
+        self._write(self._path(kind, key, ".bin" if raw else ".pkl"),
+                    stored if raw else pickle.dumps(stored, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def remember(self, kind: str, key: str, value):
+        """Só memória (p.ex. um objeto lido do disco e completado com as texturas)."""
+        self._mem_put(kind, key, value)
+
+    def clear_memory(self):
+        with self._lock:
+            self._mem.clear()
+
+
+NEST_CACHE = TieredCache()
+
+
+# ---------------- Texturas (fora do disco) ----------------
+def _strip(placements: Sequence[Placement]) -> List[Placement]:
+    return [replace(p, image=None) for p in placements]
+
+
+def _attach(placements: Sequence[Placement], texture: Callable[[int, int], Image.Image]) -> List[Placement]:
+    return [replace(p, image=texture(p.part, p.angle)) for p in placements]
+
+
+def _textures(pieces: Sequence, dpi: float) -> Callable[[int, int], Image.Image]:
+    base: Dict[int, Image.Image] = {}
+    rotated: Dict[tuple, Image.Image] = {}
+
+    def texture(part: int, ang: int) -> Image.Image:
+        tex = rotated.get((part, ang))
+        if tex is None:
+            if part not in base:
+                base[part] = scale_piece(pieces[part], dpi)[0]
+            tex = rotated[(part, ang)] = base[part].rotate(ang, expand=True)
+        return tex
+    return texture
+
+
+# ---------------- Funções com cache ----------------
+def detect_cached(data: bytes, cache: TieredCache = NEST_CACHE):
+    """detect_piece sobre os bytes carregados (PNG/JPG), com cache pelo conteúdo do ficheiro."""
+    key = digest("detect", data)
+    hit = cache.get("detect", key)
+    if hit is None:
+        hit = detect_piece(Image.open(io.BytesIO(data)).convert("RGBA"))
+        if hit[0] is not None:
+            cache.put("detect", key, hit)
+    return hit
+
+
+def vector_cached(data: bytes, filename: str, tol_cm: float = FLATTEN_TOL_CM, cache: TieredCache = NEST_CACHE):
+    """load_vector sobre os bytes carregados (SVG/DXF), com cache pelo conteúdo do ficheiro."""
+    key = digest("vector", filename.lower().rsplit(".", 1)[-1], float(tol_cm), data)
+    hit = cache.get("vector", key)
+    if hit is None:
+        hit = load_vector(data, filename, tol_cm)
+        if hit is not None:
+            cache.put("vector", key, hit)
+    return hit
+
+
+def with_textures(placements: Sequence[Placement], pieces: Sequence, dpi: float) -> List[Placement]:
+    """Colocações sem imagem (disco, progresso de um job) com as texturas refeitas a partir das peças."""
+    return _attach(placements, _textures(pieces, dpi))
+
+
+def cached_layout(request: NestRequest, key: Optional[str] = None,
+                  cache: TieredCache = NEST_CACHE) -> Optional[NestResult]:
+    """Layout já calculado para este pedido (memória ou disco), ou None; nunca calcula."""
+    key = key or request_key(request)
+    hit = cache.get("layout", key)
+    if hit is not None and any(p.image is None for p in hit.placements):
+        hit = replace(hit, placements=with_textures(hit.placements, [request.piece], request.dpi))
+        cache.remember("layout", key, hit)
+    return hit
+
+
+def nest_cached(request: NestRequest, key: Optional[str] = None, cache: TieredCache = NEST_CACHE,
+                progress=None) -> NestResult:
+    """nest() com cache; o mesmo pedido devolve o mesmo layout (também nas estratégias aleatórias)."""
+    from app.nesting.engine import nest
+    key = key or request_key(request)
+    hit = cached_layout(request, key, cache)
+    if hit is not None:
+        return hit
+    res = nest(request, progress=progress)
+    cache.put("layout", key, res, disk_value=replace(res, placements=_strip(res.placements)))
+    return res
+
+
+def cached_plan(request: MultiNestRequest, key: Optional[str] = None, cache: TieredCache = NEST_CACHE):
+    """Plano já calculado para este trabalho misto (memória ou disco), ou None; nunca calcula."""
+    key = key or parts_key(request)
+    hit = cache.get("plan", key)
+    if hit is not None and any(p.image is None for l in [*hit.layouts, *(o.placements for o in hit.offcuts)] for p in l):
+        texture = _textures([s.piece for s in request.parts], request.dpi)
+        hit = replace(hit, layouts=[_attach(l, texture) for l in hit.layouts],
+                      offcuts=[replace(o, placements=_attach(o.placements, texture)) for o in hit.offcuts])
+        cache.remember("plan", key, hit)
+    return hit
+
+
+def plan_parts_cached(request: MultiNestRequest, key: Optional[str] = None, cache: TieredCache = NEST_CACHE,
+                      progress=None):
+    """plan_parts() com cache (plano de chapas de um trabalho misto)."""
+    from app.nesting.planner import plan_parts
+    key = key or parts_key(request)
+    hit = cached_plan(request, key, cache)
+    if hit is not None:
+        return hit
+    plan = plan_parts(request, progress=progress)
+    cache.put("plan", key, plan, disk_value=replace(
+        plan, layouts=[_strip(l) for l in plan.layouts],
+        offcuts=[replace(o, placements=_strip(o.placements)) for o in plan.offcuts]))
+    return plan
+
+
+def cached_alternatives(request: AlternativesRequest, key: Optional[str] = None,
+                        cache: TieredCache = NEST_CACHE):
+    """Comparação de chapas já calculada (memória ou disco), ou None; nunca calcula. Sem texturas:
+    a página só mostra a tabela."""
+    return cache.get("alternatives", key or alternatives_key(request))
+
+
+def plan_alternatives_cached(request: AlternativesRequest, key: Optional[str] = None,
+                             cache: TieredCache = NEST_CACHE, progress=None):
+    """plan_alternatives() com cache; os planos guardam-se sem as colocações (só contagens e custos)."""
+    from app.nesting.planner import plan_alternatives
+    key = key or alternatives_key(request)
+    hit = cached_alternatives(request, key, cache)
+    if hit is not None:
+        return hit
+    alts = plan_alternatives(request.request, request.options, progress=progress)
+    stripped = [(opt, replace(plan, layouts=[_strip(l) for l in plan.layouts],
+                              offcuts=[replace(o, placements=_strip(o.placements)) for o in plan.offcuts]))
+                for opt, plan in alts]
+    cache.put("alternatives", key, stripped)
+    return stripped
+
+
+def png_cached(key: str, render: Callable[[], Image.Image], cache: TieredCache = NEST_CACHE) -> bytes:
+    """PNG do layout identificado por `key` (chave do layout + o que mais distinguir a imagem)."""
+    data = cache.get("png", key, raw=True)
+    if data is None:
+        buf = io.BytesIO()
+        render().save(buf, format="PNG")
+        data = buf.getvalue()
+        cache.put("png", key, data, raw=True)
+    return data
@@ -0,0 +1,108 @@
+# app/nesting/cli.py — Correr nesting em lote, sem Streamlit
+#
+#   python -m app.nesting peca.png --chapa 60x40 --peca 12x8 --modo shapely --png layout.png
+#   python -m app.nesting pecas/*.png --chapa 300x200 --peca 20x15 --passo 15 --perfil
+#   python -m app.nesting desenho.dxf --chapa 300x200 --modo nfp       # SVG/DXF: tamanho do ficheiro
+#
+# Escreve uma linha JSON por ficheiro (contagem, aproveitamento, tempo, posições).
+from __future__ import annotations
+import argparse
+import cProfile
+import json
+import pstats
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+from app.nesting.core import NestRequest, Sheet, STRATEGIES
+from app.nesting.detect import piece_from_image
+from app.nesting.engine import AUTO, nest
+from app.nesting.planner import plan_single
+from app.nesting.render import render_layout
+from app.nesting.vector import is_vector, piece_from_vector
+
+
+def _dims(raw: str):
+    try:
+        w, h = raw.lower().replace(",", ".").split("x")
+        return float(w), float(h)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"dimensões inválidas: {raw!r} (use LARGURAxALTURA em cm)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m app.nesting", description="Nesting de peças numa chapa (sem UI).")
+    ap.add_argument("pecas", nargs="+", help="peças: imagens (PNG/JPG, linhas escuras em fundo claro) ou SVG/DXF")
+    ap.add_argument("--chapa", type=_dims, required=True, help="chapa em cm, ex.: 60x40")
+    ap.add_argument("--peca", type=_dims, default=None,
+                    help="peça em cm, ex.: 12x8 (obrigatório para imagens; SVG/DXF usam o tamanho do ficheiro)")
+    ap.add_argument("--dpi", type=float, default=40.0, help="precisão em px/cm (40)")
+    ap.add_argument("--folga-material", type=float, default=0.5, help="folga do material em cm (0.5)")
+    ap.add_argument("--folga", type=float, default=0.4, help="folga entre peças em cm (0.4)")
+    ap.add_argument("--modo", default="shapely", choices=sorted([*STRATEGIES, AUTO]),
+                    help="estratégia (shapely); auto = rect para peças retangulares, orthogonal para as outras")
+    ap.add_argument("--guilhotina", action="store_true", help="modo rect: só cortes de bordo a bordo (serra de painel)")
+    ap.add_argument("--passo", type=int, default=15, help="passo de ângulo em graus (15)")
+    ap.add_argument("--ortogonais", action="store_true", help="só 0/90/180/270")
+    ap.add_argument("--tempo", type=float, default=20.0, help="limite de tempo em s (20)")
+    ap.add_argument("--workers", type=int, default=0, help="processos em paralelo (0 = todos os núcleos, 1 = em série)")
+    ap.add_argument("--qtd", type=int, default=0, help="quantidade total: acrescenta o plano de chapas ao JSON")
+    ap.add_argument("--seed", type=int, default=None, help="semente para resultados reprodutíveis")
+    ap.add_argument("--png", default=None, help="grava o layout em PNG (com várias peças: acrescenta _<nome>)")
+    ap.add_argument("--posicoes", action="store_true", help="inclui a lista de posições no JSON")
+    ap.add_argument("--perfil", action="store_true", help="cProfile de cada job (top 25 para stderr)")
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    angles = [0, 90, 180, 270] if args.ortogonais else list(range(0, 360, max(1, args.passo)))
+    rc = 0
+    for path in args.pecas:
+        size = args.peca or (None, None)
+        if is_vector(path):
+            try:
+                piece = piece_from_vector(Path(path).read_bytes(), path, size[0], size[1], name=Path(path).stem)
+            except ValueError as exc:
+                print(json.dumps({"file": path, "error": str(exc)}, ensure_ascii=False))
+                rc = 1
+                continue
+        elif args.peca is None:
+            print(json.dumps({"file": path, "error": "falta --peca (tamanho em cm) para imagens"}, ensure_ascii=False))
+            rc = 1
+            continue
+        else:
+            piece = piece_from_image(Image.open(path), size[0], size[1], name=Path(path).stem)
+        if piece is None:
+            print(json.dumps({"file": path, "error": "contorno não detetado"}, ensure_ascii=False))
+            rc = 1
+            continue
+        req = NestRequest(
+            piece=piece,
+            sheet=Sheet(args.chapa[0], args.chapa[1], args.folga_material),
+            gap_cm=args.folga, dpi=args.dpi, angles=angles, strategy=args.modo,
+            time_limit_s=args.tempo, seed=args.seed, workers=args.workers, guillotine=args.guilhotina,
+        )
+        prof = cProfile.Profile() if args.perfil else None
+        if prof:
+            prof.enable()
+        res = nest(req)
+        if prof:
+            prof.disable()
+            pstats.Stats(prof, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+
+        out = res.as_dict()
+        if not args.posicoes:
+            out.pop("placements")
+        out["file"] = path
+        if args.qtd > 0:
+            out["plano"] = plan_single(res, args.qtd, req.sheet, args.folga, name=piece.name).as_dict()
+        if args.png:
+            png = Path(args.png)
+            if len(args.pecas) > 1:
+                png = png.with_name(f"{png.stem}_{piece.name}{png.suffix or '.png'}")
+            render_layout(res.placements, *res.sheet_px).save(png)
+            out["png"] = str(png)
+        print(json.dumps(out, ensure_ascii=False))
+    return rc
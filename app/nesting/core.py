@@ -0,0 +1,291 @@
+# app/nesting/core.py — Tipos do pedido/resultado e registo de estratégias
+#
+# Unidades: o pedido é em cm (como na UI); a estratégia trabalha em píxeis à escala `dpi`
+# (px/cm). `prepare` faz a conversão uma única vez e entrega um `Job` pronto a usar.
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import random
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+try:
+    from shapely.affinity import scale as shp_scale
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+# intervalo mínimo entre relatórios de progresso (Job.report)
+REPORT_EVERY_S = 0.5
+# textura das peças vetoriais: enchimento claro e linhas escuras, como um desenho digitalizado
+VECTOR_FILL = (235, 235, 235, 255)
+VECTOR_LINE = (40, 40, 40, 255)
+
+
+@dataclass(frozen=True)
+class Sheet:
+    width_cm: float
+    height_cm: float
+    margin_cm: float = 0.0      # folga do material (em cada lado)
+
+    def usable_px(self, dpi: float) -> Tuple[int, int]:
+        w = max(1, int((self.width_cm - 2 * self.margin_cm) * dpi))
+        h = max(1, int((self.height_cm - 2 * self.margin_cm) * dpi))
+        return w, h
+
+
+@dataclass
+class Piece:
+    """Peça detetada: textura RGBA recortada (alpha = máscara) e polígono nas coords dessa textura.
+
+    `exact`: o polígono vem de um ficheiro vetorial (app.nesting.vector) e é a forma verdadeira; a textura
+    faz-se dele à escala pedida e o NFP usa-o em vez de o refazer a partir da máscara.
+    """
+    image: Image.Image
+    polygon: object             # shapely Polygon (ou None sem shapely)
+    width_cm: float
+    height_cm: float
+    name: str = ""
+    exact: bool = False
+
+    @property
+    def source_size(self) -> Tuple[int, int]:
+        return self.image.size
+
+
+@dataclass
+class NestRequest:
+    piece: Piece
+    sheet: Sheet
+    gap_cm: float = 0.0         # folga entre peças
+    dpi: float = 40.0           # px/cm
+    angles: Sequence[int] = (0, 90, 180, 270)
+    strategy: str = "shapely"
+    time_limit_s: float = 20.0
+    max_trials: int = 60000
+    seed: Optional[int] = None
+    workers: int = 0            # processos para ensaios em paralelo (0 = todos os núcleos, 1 = em série)
+    guillotine: bool = False    # só cortes de bordo a bordo (serra de painel); usado pela estratégia rect
+
+
+@dataclass
+class PartSpec:
+    """Uma peça de um trabalho misto: quantidade pedida e, opcionalmente, os ângulos que aceita."""
+    piece: Piece
+    quantity: int = 1
+    angles: Optional[Sequence[int]] = None      # None = ângulos do pedido
+
+
+@dataclass
+class Remnant:
+    """Sobra retangular, em cm. Num plano: faixa livre da última chapa, medida a partir do canto superior
+    esquerdo da chapa inteira. No inventário (app.db.StockRemnant): `id`/`material_code` preenchidos, x/y = 0."""
+    x_cm: float
+    y_cm: float
+    width_cm: float
+    height_cm: float
+    id: Optional[int] = None
+    material_code: str = ""
+
+    @property
+    def area_cm2(self) -> float:
+        return self.width_cm * self.height_cm
+
+    def as_dict(self) -> dict:
+        d = {"x_cm": round(self.x_cm, 2), "y_cm": round(self.y_cm, 2),
+             "width_cm": round(self.width_cm, 2), "height_cm": round(self.height_cm, 2)}
+        if self.id is not None:
+            d["id"] = self.id
+        return d
+
+
+@dataclass
+class MultiNestRequest:
+    parts: Sequence[PartSpec]
+    sheet: Sheet
+    gap_cm: float = 0.0
+    dpi: float = 40.0
+    angles: Sequence[int] = (0, 90, 180, 270)
+    order: str = "area"         # heurística de ordem (ver app.nesting.multi.ORDERS)
+    time_limit_s: float = 20.0
+    remnants: Sequence[Remnant] = ()    # sobras do inventário a gastar antes de abrir chapas novas
+
+
+@dataclass
+class Placement:
+    x: int                      # canto superior esquerdo (px, coords da chapa útil)
+    y: int
+    angle: int
+    w: int
+    h: int
+    image: Optional[Image.Image] = None
+    part: int = 0               # índice da peça no pedido (trabalhos mistos)
+
+    def as_dict(self) -> dict:
+        return {"x_px": self.x, "y_px": self.y, "angle": self.angle, "w": self.w, "h": self.h, "part": self.part}
+
+
+@dataclass
+class NestResult:
+    placements: List[Placement]
+    utilization: float          # % da chapa útil
+    sheet_px: Tuple[int, int]
+    dpi: float
+    strategy: str
+    elapsed_s: float = 0.0
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        return len(self.placements)
+
+    def sheets_needed(self, qty: int) -> int:
+        if self.count <= 0 or qty <= 0:
+            return 0
+        return -(-int(qty) // self.count)
+
+    def as_dict(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "count": self.count,
+            "utilization": round(self.utilization, 3),
+            "sheet_px": list(self.sheet_px),
+            "dpi": self.dpi,
+            "elapsed_s": round(self.elapsed_s, 4),
+            "stats": self.stats,
+            "placements": [p.as_dict() for p in self.placements],
+        }
+
+
+@dataclass
+class MultiNestResult:
+    placements: List[Placement]
+    utilization: float
+    sheet_px: Tuple[int, int]
+    dpi: float
+    names: List[str]
+    requested: List[int]        # quantidade pedida por peça
+    placed: List[int]           # quantidade colocada por peça
+    elapsed_s: float = 0.0
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        return len(self.placements)
+
+    @property
+    def remaining(self) -> List[int]:
+        return [max(0, q - n) for q, n in zip(self.requested, self.placed)]
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "utilization": round(self.utilization, 3),
+            "sheet_px": list(self.sheet_px),
+            "dpi": self.dpi,
+            "elapsed_s": round(self.elapsed_s, 4),
+            "parts": [{"name": n, "requested": q, "placed": k}
+                      for n, q, k in zip(self.names, self.requested, self.placed)],
+            "stats": self.stats,
+            "placements": [p.as_dict() for p in self.placements],
+        }
+
+
+@dataclass
+class Job:
+    """Pedido já convertido para píxeis; é o que cada estratégia recebe."""
+    request: NestRequest
+    tex: Image.Image            # textura redimensionada para piece_w/h_cm × dpi
+    poly: object                # polígono nas coords de `tex` (ou None)
+    sheet_w: int
+    sheet_h: int
+    gap: int
+    angles: List[int]
+    deadline: float
+    rng: random.Random
+    # (fração do tempo, melhor layout até agora, utilização % ou None); pode levantar exceção para cancelar
+    progress: Optional[Callable[[float, Sequence["Placement"], Optional[float]], None]] = None
+    _reported: float = field(default=0.0, repr=False)
+
+    @property
+    def mask(self) -> np.ndarray:
+        return np.array(self.tex.split()[-1]) > 0
+
+    def expired(self) -> bool:
+        return time.time() > self.deadline
+
+    def report(self, placements: Sequence["Placement"], util: Optional[float] = None, force: bool = False):
+        """Entrega o melhor até agora a quem acompanha o pedido (no máximo a cada REPORT_EVERY_S)."""
+        if self.progress is None:
+            return
+        now = time.time()
+        if not force and now - self._reported < REPORT_EVERY_S:
+            return
+        self._reported = now
+        span = float(self.request.time_limit_s) or 1.0
+        self.progress(min(1.0, max(0.0, 1.0 - (self.deadline - now) / span)), placements, util)
+
+
+def polygon_texture(poly, size: Tuple[int, int]) -> Image.Image:
+    """Textura RGBA de um polígono nas coords da imagem: alpha = contorno exterior; os furos e
+    gravações (anéis interiores) ficam desenhados como linhas, sem abrir a máscara."""
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    width = max(1, round(min(size) / 250))
+    # o píxel (i, j) cobre [i, i+1) × [j, j+1): desloca-se ½ px para encher os píxeis com centro dentro
+    def ring(r):
+        return [(x - 0.5, y - 0.5) for x, y in r.coords]
+
+    draw.polygon(ring(poly.exterior), fill=VECTOR_FILL, outline=VECTOR_LINE, width=width)
+    for hole in poly.interiors:
+        draw.line(ring(hole), fill=VECTOR_LINE, width=width, joint="curve")
+    return img
+
+
+def scale_piece(piece: Piece, dpi: float) -> Tuple[Image.Image, object]:
+    """Textura e polígono da peça à escala `dpi` (px/cm). Peças exatas: textura desenhada do polígono."""
+    tw = max(1, int(piece.width_cm * dpi))
+    th = max(1, int(piece.height_cm * dpi))
+
+    poly = None
+    if piece.polygon is not None and SHAPELY_OK:
+        pw, ph = piece.source_size
+        poly = shp_scale(piece.polygon, xfact=tw / max(1, pw), yfact=th / max(1, ph), origin=(0, 0))
+    if piece.exact and poly is not None:
+        tex = polygon_texture(poly, (tw, th))
+    else:
+        tex = piece.image.convert("RGBA").resize((tw, th), Image.BICUBIC)
+    return tex, poly
+
+
+def prepare(request: NestRequest) -> Job:
+    dpi = float(request.dpi)
+    tex, poly = scale_piece(request.piece, dpi)
+
+    sheet_w, sheet_h = request.sheet.usable_px(dpi)
+    return Job(
+        request=request,
+        tex=tex,
+        poly=poly,
+        sheet_w=sheet_w,
+        sheet_h=sheet_h,
+        gap=max(0, int(request.gap_cm * dpi)),
+        angles=[int(a) for a in request.angles] or [0],
+        deadline=time.time() + float(request.time_limit_s),
+        rng=random.Random(request.seed),
+    )
+
+
+# --- Registo de estratégias ---
+Strategy = Callable[[Job], Tuple[List[Placement], float, dict]]
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def register_strategy(name: str):
+    """Decorador: a função recebe um Job e devolve (placements, utilização %, stats)."""
+    def deco(fn: Strategy) -> Strategy:
+        STRATEGIES[name] = fn
+        return fn
+    return deco
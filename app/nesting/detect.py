@@ -0,0 +1,55 @@
+# app/nesting/detect.py — Deteção do contorno da peça a partir de uma imagem
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from app.nesting.core import Piece
+
+try:
+    from shapely.geometry import Polygon
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+
+def detect_piece(image_rgba: Image.Image):
+    """Textura recortada (alpha = contorno), polígono nas coords do recorte, (w, h) e máscara booleana."""
+    rgb = image_rgba.convert("RGB")
+    arr = np.array(rgb)
+    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    _, th = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
+    cnts, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not cnts:
+        return None, None, None, None
+    cnt = max(cnts, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(cnt)
+
+    cropped = image_rgba.crop((x, y, x + w, y + h)).convert("RGBA")
+    mask_full = np.zeros_like(th)
+    cv2.drawContours(mask_full, [cnt], -1, 255, -1)
+    mask_crop = Image.fromarray(mask_full).crop((x, y, x + w, y + h))
+    cropped.putalpha(mask_crop)
+
+    epsilon = 0.004 * cv2.arcLength(cnt, True)
+    approx = cv2.approxPolyDP(cnt, epsilon, True)
+    pts = [(int(p[0][0]-x), int(p[0][1]-y)) for p in approx]
+    if len(pts) < 3:
+        return None, None, None, None
+    poly = None
+    if SHAPELY_OK:
+        poly = Polygon(pts)
+        if not poly.is_valid:
+            poly = poly.buffer(0)
+    return cropped, poly, (w, h), np.array(mask_crop) > 0
+
+
+def piece_from_image(image: Image.Image, width_cm: float, height_cm: float, name: str = "") -> Optional[Piece]:
+    """Deteta o contorno e devolve uma Piece pronta para NestRequest (None se não houver contorno)."""
+    tex, poly, _size, _mask = detect_piece(image.convert("RGBA"))
+    if tex is None:
+        return None
+    return Piece(image=tex, polygon=poly, width_cm=float(width_cm), height_cm=float(height_cm), name=name)
@@ -0,0 +1,51 @@
+# app/nesting/engine.py — Ponto de entrada: NestRequest → NestResult
+from __future__ import annotations
+from dataclasses import replace
+import time
+
+from app.nesting.core import NestRequest, NestResult, STRATEGIES, prepare
+# As estratégias registam-se ao importar o módulo
+import app.nesting.strategies  # noqa: F401
+import app.nesting.raster  # noqa: F401
+import app.nesting.fftnest  # noqa: F401
+import app.nesting.nfp  # noqa: F401
+import app.nesting.anneal  # noqa: F401
+from app.nesting.rectpack import is_rectangular
+
+# estratégia escolhida pela forma da peça (ver resolve_strategy)
+AUTO = "auto"
+# o que `auto` usa para peças não retangulares: o modo por omissão de antes (rápido e previsível)
+AUTO_FALLBACK = "orthogonal"
+
+
+def resolve_strategy(request: NestRequest) -> str:
+    """`auto`: retângulo → rect (MaxRects/guilhotina); outras formas → AUTO_FALLBACK (alinhamento ortogonal)."""
+    if request.strategy != AUTO:
+        return request.strategy
+    if is_rectangular(request.piece, dpi=request.dpi):
+        return "rect"
+    return AUTO_FALLBACK
+
+
+def nest(request: NestRequest, progress=None) -> NestResult:
+    """Corre a estratégia pedida sem qualquer dependência da UI. `progress` vê o melhor até agora (Job.report)."""
+    strategy = resolve_strategy(request)
+    fn = STRATEGIES.get(strategy)
+    if fn is None:
+        raise ValueError(f"Estratégia desconhecida: {request.strategy!r} "
+                         f"(disponíveis: {', '.join(sorted([*STRATEGIES, AUTO]))})")
+    if strategy != request.strategy:
+        request = replace(request, strategy=strategy)
+    t0 = time.perf_counter()
+    job = prepare(request)
+    job.progress = progress
+    placements, util, stats = fn(job)
+    return NestResult(
+        placements=placements,
+        utilization=float(util),
+        sheet_px=(job.sheet_w, job.sheet_h),
+        dpi=float(request.dpi),
+        strategy=request.strategy,
+        elapsed_s=time.perf_counter() - t0,
+        stats=dict(stats or {}),
+    )
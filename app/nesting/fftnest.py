@@ -0,0 +1,151 @@
+# app/nesting/fftnest.py — Nesting raster por convolução (FFT) com escolha bottom-left
+#
+# Para cada ângulo, a máscara rodada e dilatada pela folga (kernel) é correlacionada com a grelha
+# de ocupação: o resultado dá, de uma vez, o nº de píxeis em conflito para CADA posição possível.
+# As posições a zero são todas as colocações válidas; entre todos os ângulos escolhe-se a que deixa
+# o bordo inferior da peça mais acima e, em empate, a mais à esquerda (bottom-left, com y para baixo).
+# Depois de colocar uma peça só muda a vizinhança dela, por isso o mapa de posições válidas de cada
+# ângulo é atualizado localmente (correlação da peça nova com o kernel, em cache por par de ângulos).
+# Os mapas (um por ângulo, do tamanho da chapa) são grelhas de bits (app/nesting/occupancy.py).
+from __future__ import annotations
+
+import numpy as np
+import cv2
+
+from app.nesting.core import Job, Placement, register_strategy
+from app.nesting.occupancy import BitGrid
+
+
+def _fast_len(n: int) -> int:
+    """Menor m >= n só com fatores 2, 3 e 5 (tamanhos rápidos para a FFT)."""
+    m = max(1, int(n))
+    while True:
+        r = m
+        for p in (2, 3, 5):
+            while r % p == 0:
+                r //= p
+        if r == 1:
+            return m
+        m += 1
+
+
+def correlate_full(a: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """out[y, x] = Σ a[y+i-kh+1, x+j-kw+1]·k[i, j] — forma 'full' (a.h+kh-1, a.w+kw-1), via FFT."""
+    (ah, aw), (kh, kw) = a.shape, k.shape
+    oh, ow = ah + kh - 1, aw + kw - 1
+    s = (_fast_len(oh), _fast_len(ow))
+    fa = np.fft.rfft2(a.astype(np.float32), s)
+    fk = np.fft.rfft2(k[::-1, ::-1].astype(np.float32), s)
+    return np.fft.irfft2(fa * fk, s)[:oh, :ow]
+
+
+def feasible_offsets(occ: np.ndarray, kernel: np.ndarray) -> BitGrid:
+    """Mapa de bits (H-kh+1, W-kw+1): 1 onde o kernel com canto nessa posição não toca `occ`."""
+    (h, w), (kh, kw) = occ.shape, kernel.shape
+    if kh > h or kw > w:
+        return BitGrid(max(0, h - kh + 1), max(0, w - kw + 1))
+    feas = BitGrid(h - kh + 1, w - kw + 1, fill=True)
+    if occ.any():
+        feas.clear_mask(0, 0, correlate_full(occ, kernel)[kh - 1:h, kw - 1:w] >= 0.5)
+    return feas
+
+
+def gap_kernel(mask: np.ndarray, gap: int) -> np.ndarray:
+    """Máscara com `gap` px de margem em cada lado e dilatada por um disco de raio `gap`."""
+    k = np.pad(mask.astype(np.uint8), gap)
+    if gap > 0:
+        disk = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * gap + 1, 2 * gap + 1))
+        k = cv2.dilate(k, disk)
+    return k > 0
+
+
+class _Variant:
+    """Um ângulo: textura, máscara, kernel com folga e mapa de posições válidas."""
+
+    def __init__(self, ang, tex, gap, occ_padded):
+        self.ang = ang
+        self.tex = tex
+        self.mask = np.array(tex.split()[-1]) > 0
+        self.h, self.w = self.mask.shape
+        self.kernel = gap_kernel(self.mask, gap)
+        self.feas = feasible_offsets(occ_padded, self.kernel)
+        self.ptr = 0                      # byte da 1ª posição válida: as posições só deixam de o ser, nunca recua
+        self._hits = {}                   # ângulo da peça colocada → posições bloqueadas (relativas)
+        self.f_mask = self.f_kernel = None
+
+    def spectra(self, size):
+        """Espectros da máscara e do kernel (invertido) num tamanho comum a todos os ângulos."""
+        self.f_mask = np.fft.rfft2(self.mask.astype(np.float32), size)
+        self.f_kernel = np.fft.rfft2(self.kernel[::-1, ::-1].astype(np.float32), size)
+
+    def first(self):
+        hit = self.feas.first_set(self.ptr)
+        if hit is None:
+            self.ptr = self.feas.bits.size
+            return None
+        self.ptr, y, x = hit
+        return y, x
+
+    def block(self, placed: "_Variant", py: int, px: int):
+        """Invalida as posições cujo kernel passa a tocar a peça `placed` colocada em (py, px) (coords com margem)."""
+        if self.feas.h == 0 or self.feas.w == 0:
+            return
+        kh, kw = self.kernel.shape
+        hit = self._hits.get(placed.ang)
+        if hit is None:
+            # todas as cópias são iguais: a correlação só depende do par de ângulos,
+            # e com os espectros já calculados custa uma única FFT inversa
+            size = (self.f_kernel.shape[0], 2 * (self.f_kernel.shape[1] - 1))
+            full = np.fft.irfft2(placed.f_mask * self.f_kernel, size)
+            hit = self._hits[placed.ang] = full[:placed.h + kh - 1, :placed.w + kw - 1] > 0.5
+        y0, x0 = py - kh + 1, px - kw + 1
+        fy0, fx0 = max(0, y0), max(0, x0)
+        fy1 = min(self.feas.h, y0 + hit.shape[0])
+        fx1 = min(self.feas.w, x0 + hit.shape[1])
+        if fy0 >= fy1 or fx0 >= fx1:
+            return
+        self.feas.clear_mask(fx0, fy0, hit[fy0 - y0:fy1 - y0, fx0 - x0:fx1 - x0])
+
+
+@register_strategy("fft")
+def fft_nest(job: Job):
+    """Enche a chapa peça a peça com a melhor posição válida (bottom-left) entre todos os ângulos."""
+    gap = job.gap
+    sheet_w, sheet_h = job.sheet_w, job.sheet_h
+    # A grelha leva `gap` px de margem livre à volta: a folga só conta entre peças, não até ao bordo
+    # (a folga do material já foi descontada na chapa útil). Kernel em (y, x) ⇒ peça em (y, x) na chapa.
+    occ = np.zeros((sheet_h + 2 * gap, sheet_w + 2 * gap), dtype=np.uint8)
+    variants = [_Variant(ang, job.tex.rotate(ang, expand=True), gap, occ) for ang in job.angles]
+    size = (_fast_len(max(v.h for v in variants) + max(v.kernel.shape[0] for v in variants) - 1),
+            _fast_len(max(v.w for v in variants) + max(v.kernel.shape[1] for v in variants) - 1))
+    if size[1] % 2:
+        size = (size[0], _fast_len(size[1] + 1))
+    for v in variants:
+        v.spectra(size)
+
+    placements = []
+    used_px = 0
+    steps = 0
+    area_total = float(sheet_w) * float(sheet_h)
+    while not job.expired():
+        best = None
+        for v in variants:
+            pos = v.first()
+            if pos is None:
+                continue
+            key = (pos[0] + v.h, pos[1])   # bordo inferior mais alto, depois mais à esquerda
+            if best is None or key < best[0]:
+                best = (key, pos, v)
+        if best is None:
+            break
+        _, (y, x), v = best
+        steps += 1
+        occ[y + gap:y + gap + v.h, x + gap:x + gap + v.w] |= v.mask
+        for other in variants:
+            other.block(v, y + gap, x + gap)
+        placements.append(Placement(x, y, v.ang, v.w, v.h, v.tex))
+        used_px += int(v.mask.sum())
+        job.report(placements, used_px / area_total * 100.0)
+
+    util = (used_px / area_total * 100.0) if area_total else 0.0
+    return placements, util, {"steps": steps}
@@ -0,0 +1,190 @@
+# app/nesting/jobs.py — Nesting em segundo plano: fila na tabela `nestjob` + pool local de processos
+#
+# O Streamlit corre a página de cima a baixo em cada interação, por isso um nesting de 60 s não pode
+# correr dentro do script. A página submete o pedido e volta a ler a linha do job em cada rerun:
+# - um job por `slot` (p.ex. a sessão da página): o mesmo pedido (mesma chave) devolve o job que já
+#   existe, em qualquer estado; um pedido diferente cancela o anterior e substitui-o;
+# - o worker escreve o progresso e o melhor layout até agora (Job.report) na linha do job, com sqlite3
+#   direto (nada de app.db / Streamlit nos processos filhos);
+# - o resultado final vai para a cache de nesting (disco), com a chave guardada no job;
+# - cancelar = marcar a linha; o worker vê a marca no relatório seguinte e pára.
+# Os jobs que estavam a correr quando o servidor parou ficam INTERROMPIDO ao arrancar o runner.
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+
+from app.nesting.core import Placement
+
+PENDING, RUNNING, DONE, ERROR, CANCELLED, INTERRUPTED = (
+    "PENDENTE", "A CORRER", "CONCLUIDO", "ERRO", "CANCELADO", "INTERROMPIDO")
+ALIVE = (PENDING, RUNNING)
+
+# jobs em simultâneo (cada job já usa os núcleos todos nos ensaios em paralelo)
+JOB_WORKERS = max(1, int(os.environ.get("APP_NEST_JOB_WORKERS", "1") or 1))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now() -> str:
+    # mesmo formato que o SQLModel grava nas colunas datetime
+    return datetime.utcnow().isoformat(sep=" ")
+
+
+def _connect(db_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(db_path), timeout=5.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _update(conn: sqlite3.Connection, job_id: int, **cols):
+    sets = ", ".join(f"{k} = ?" for k in cols)
+    with conn:
+        conn.execute(f"UPDATE nestjob SET {sets} WHERE id = ?", (*cols.values(), job_id))
+
+
+# ---------------- Lado do worker ----------------
+def _run_job(db_path: str, job_id: int, kind: str, request, key: str):
+    """Corre num processo do pool: nest/plan/alternatives com relatórios para a linha do job."""
+    from app.nesting.cache import nest_cached, plan_alternatives_cached, plan_parts_cached
+
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT status FROM nestjob WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] != PENDING:
+            return
+        _update(conn, job_id, status=RUNNING, started_at=_now(), pid=os.getpid())
+
+        def check_cancel():
+            row = conn.execute("SELECT status FROM nestjob WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] != RUNNING:
+                raise JobCancelled()
+
+        def on_progress(frac: float, placements, util: Optional[float]):
+            check_cancel()
+            _update(conn, job_id, progress=round(float(frac), 4), best_count=len(placements),
+                    best_util=float(util or 0.0), best_json=json.dumps([p.as_dict() for p in placements]))
+
+        def on_sheet(sheets: int, placements):
+            check_cancel()
+            _update(conn, job_id, message=f"chapa {sheets}", best_count=len(placements),
+                    best_json=json.dumps([p.as_dict() for p in placements]))
+
+        def on_option(done: int, total: int):
+            check_cancel()
+            _update(conn, job_id, progress=round(done / total, 4), message=f"chapa {done + 1} de {total}")
+
+        if kind == "plan":
+            plan = plan_parts_cached(request, key, progress=on_sheet)
+            count, util = sum(plan.placed), plan.utilization
+            msg = f"{plan.sheets} chapas" + ("" if plan.complete else f", faltam {sum(plan.remaining)}")
+        elif kind == "alternatives":
+            alts = plan_alternatives_cached(request, key, progress=on_option)
+            count, util, msg = len(alts), 0.0, f"{len(alts)} tamanhos comparados"
+        else:
+            res = nest_cached(request, key, progress=on_progress)
+            count, util, msg = res.count, res.utilization, f"{res.elapsed_s:.1f} s"
+        _update(conn, job_id, status=DONE, progress=1.0, best_count=count, best_util=float(util),
+                message=msg, finished_at=_now())
+    except JobCancelled:
+        _update(conn, job_id, status=CANCELLED, finished_at=_now())
+    except Exception as exc:
+        _update(conn, job_id, status=ERROR, message=f"{type(exc).__name__}: {exc}", finished_at=_now())
+    finally:
+        conn.close()
+
+
+# ---------------- Lado da aplicação ----------------
+class JobRunner:
+    def __init__(self, db_path, workers: int = JOB_WORKERS):
+        self.db_path = str(db_path)
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._conn = _connect(self.db_path)
+        with self._conn:
+            self._conn.execute("UPDATE nestjob SET status = ?, message = 'servidor reiniciado', finished_at = ? "
+                               "WHERE status IN (?, ?)", (INTERRUPTED, _now(), *ALIVE))
+
+    def _row(self, sql: str, args: tuple) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(sql, args).fetchone()
+        return dict(row) if row is not None else None
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return self._row("SELECT * FROM nestjob WHERE id = ?", (job_id,))
+
+    def latest(self, slot: str) -> Optional[dict]:
+        return self._row("SELECT * FROM nestjob WHERE slot = ? ORDER BY id DESC LIMIT 1", (slot,))
+
+    def submit(self, slot: str, kind: str, request, key: str, time_limit_s: float = 0.0) -> int:
+        """Job do slot para este pedido: o último com a mesma chave é reaproveitado, qualquer que seja o
+        estado (um erro não volta a correr sozinho em cada rerun; para repetir, usar outro slot)."""
+        cur = self.latest(slot)
+        if cur is not None and cur["key"] == key:
+            return cur["id"]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("UPDATE nestjob SET status = ?, finished_at = ? WHERE slot = ? AND status IN (?, ?)",
+                                   (CANCELLED, _now(), slot, *ALIVE))
+                # o resultado anterior é substituído: só fica a linha nova do slot
+                self._conn.execute("DELETE FROM nestjob WHERE slot = ? AND status NOT IN (?, ?)", (slot, *ALIVE))
+                job_id = self._conn.execute(
+                    "INSERT INTO nestjob (slot, kind, key, status, progress, message, best_count, best_util, "
+                    "best_json, time_limit_s, created_at) VALUES (?, ?, ?, ?, 0, '', 0, 0, '', ?, ?)",
+                    (slot, kind, key, PENDING, float(time_limit_s), _now()),
+                ).lastrowid
+        fut = self._pool.submit(_run_job, self.db_path, job_id, kind, request, key)
+        self._futures[job_id] = fut
+        fut.add_done_callback(lambda f, j=job_id: self._finished(j, f))
+        return job_id
+
+    def _finished(self, job_id: int, fut: Future):
+        self._futures.pop(job_id, None)
+        exc = None if fut.cancelled() else fut.exception()
+        if exc is not None:
+            # o processo morreu (sem memória, pool partido): o worker não chegou a escrever o erro
+            with self._lock:
+                _update(self._conn, job_id, status=ERROR, message=f"{type(exc).__name__}: {exc}", finished_at=_now())
+
+    def cancel(self, job_id: int):
+        with self._lock:
+            _update(self._conn, job_id, status=CANCELLED, finished_at=_now())
+        fut = self._futures.get(job_id)
+        if fut is not None:
+            fut.cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def best_placements(row: dict) -> List[Placement]:
+    """Melhor layout até agora de uma linha de job (sem imagens; ver cache.with_textures)."""
+    if not row or not row.get("best_json"):
+        return []
+    out = []
+    for d in json.loads(row["best_json"]):
+        out.append(Placement(d["x_px"], d["y_px"], d["angle"], d["w"], d["h"], part=d.get("part", 0)))
+    return out
+
+
+_RUNNERS: Dict[str, JobRunner] = {}
+_RUNNERS_LOCK = threading.Lock()
+
+
+def get_runner(db_path) -> JobRunner:
+    """Um runner por base de dados e por processo (o Streamlit reusa o processo entre sessões)."""
+    key = str(Path(db_path).resolve())
+    with _RUNNERS_LOCK:
+        runner = _RUNNERS.get(key)
+        if runner is None:
+            runner = _RUNNERS[key] = JobRunner(key)
+        return runner
@@ -0,0 +1,104 @@
+# app/nesting/multi.py — Trabalhos mistos: várias peças diferentes, cada uma com quantidade e ângulos
+#
+# Usa o empacotador NFP (app/nesting/nfp.py), que já trata formas diferentes: as regiões livres e a
+# cache de NFPs são por forma, por isso misturar peças não custa mais do que repetir a mesma.
+# As cópias entram por ordem de uma heurística (maiores primeiro); quando uma peça deixa de caber,
+# as cópias seguintes dela são saltadas (a região livre só encolhe) e passa-se à próxima peça.
+from __future__ import annotations
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.nesting.core import MultiNestRequest, MultiNestResult, Placement, scale_piece
+from app.nesting.nfp import NfpPacker, NfpShape, SHAPELY_OK, outline_polygon
+
+
+class _Part:
+    def __init__(self, idx: int, spec, dpi: float, gap: float, default_angles):
+        self.idx = idx
+        self.name = spec.piece.name or f"peça {idx + 1}"
+        self.quantity = max(0, int(spec.quantity))
+        self.angles = [int(a) for a in (spec.angles if spec.angles is not None else default_angles)] or [0]
+        self.tex, poly = scale_piece(spec.piece, dpi)
+        mask = np.array(self.tex.split()[-1]) > 0
+        self.area = float(mask.sum())
+        self.shape = NfpShape(outline_polygon(spec.piece, poly, mask), self.tex.size, gap=gap)
+        self._rotated: Dict[int, object] = {}
+
+    def texture(self, ang: int):
+        tex = self._rotated.get(ang)
+        if tex is None:
+            tex = self._rotated[ang] = self.tex.rotate(ang, expand=True)
+        return tex
+
+
+# chave de ordenação (menor primeiro) por heurística
+ORDERS: Dict[str, Callable[[_Part], tuple]] = {
+    "area": lambda p: (-p.area, p.idx),                                   # maior área primeiro
+    "largest": lambda p: (-max(p.tex.size), -p.area, p.idx),              # maior dimensão primeiro
+    "input": lambda p: (p.idx,),                                          # ordem do pedido
+}
+
+
+def prepare_parts(request: MultiNestRequest) -> List[_Part]:
+    """Texturas à escala e formas NFP de cada peça (feito uma vez; o planeador reusa-as em cada chapa)."""
+    if not SHAPELY_OK:
+        raise RuntimeError("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+    dpi = float(request.dpi)
+    gap = max(0, int(request.gap_cm * dpi))
+    return [_Part(i, spec, dpi, gap, request.angles) for i, spec in enumerate(request.parts)]
+
+
+def fill_sheet(parts: Sequence[_Part], quantities: Sequence[int], sheet_w: int, sheet_h: int,
+               order: str, deadline: float) -> Tuple[List[Placement], List[int], bool, dict]:
+    """Uma chapa vazia: (colocações, nº colocado por peça, esgotou o tempo, stats da cache NFP)."""
+    key = ORDERS.get(order)
+    if key is None:
+        raise ValueError(f"Ordem desconhecida: {order!r} (disponíveis: {', '.join(sorted(ORDERS))})")
+    packer = NfpPacker(sheet_w, sheet_h, deadline=deadline)
+    hits0, misses0 = packer.cache.hits, packer.cache.misses
+    placements: List[Placement] = []
+    placed = [0] * len(parts)
+    timed_out = False
+    for part in sorted(parts, key=key):
+        while placed[part.idx] < quantities[part.idx]:
+            if time.time() > deadline:
+                timed_out = True
+                break
+            p = packer.place(part.shape, part.angles)
+            if p is None:
+                timed_out = packer.expired()    # sem lugar ou sem tempo para ver os ângulos todos
+                break
+            tex = part.texture(p.ang)
+            placements.append(Placement(int(round(p.x)), int(round(p.y)), p.ang, tex.size[0], tex.size[1], tex,
+                                        part=part.idx))
+            placed[part.idx] += 1
+        if timed_out:
+            break
+    stats = {"nfp_cache_hits": packer.cache.hits - hits0, "nfp_cache_misses": packer.cache.misses - misses0}
+    return placements, placed, timed_out, stats
+
+
+def nest_parts(request: MultiNestRequest) -> MultiNestResult:
+    """Enche uma chapa com as quantidades pedidas de cada peça; o que não couber fica em `remaining`."""
+    t0 = time.perf_counter()
+    deadline = time.time() + float(request.time_limit_s)
+    parts = prepare_parts(request)
+    sheet_w, sheet_h = request.sheet.usable_px(float(request.dpi))
+    placements, placed, timed_out, stats = fill_sheet(
+        parts, [p.quantity for p in parts], sheet_w, sheet_h, request.order, deadline)
+
+    area_total = float(sheet_w) * float(sheet_h)
+    used = sum(parts[i].area * n for i, n in enumerate(placed))
+    return MultiNestResult(
+        placements=placements,
+        utilization=(used / area_total * 100.0) if area_total else 0.0,
+        sheet_px=(sheet_w, sheet_h),
+        dpi=float(request.dpi),
+        names=[p.name for p in parts],
+        requested=[p.quantity for p in parts],
+        placed=placed,
+        elapsed_s=time.perf_counter() - t0,
+        stats={"order": request.order, "timed_out": timed_out, **stats},
+    )
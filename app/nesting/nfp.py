@@ -0,0 +1,425 @@
+# app/nesting/nfp.py — Nesting por no-fit polygon (NFP) com colocação bottom-left
+#
+# Referencial de cada peça rodada = canto superior esquerdo da textura rodada (igual ao modo Shapely),
+# por isso uma colocação (x, y) é diretamente a posição onde se cola a textura.
+#
+# - NFP(A, B): posições do referencial de B em que B toca A (com folga). A ⊕ (−B) (soma de Minkowski),
+#   calculada por decomposição convexa: casco convexo de cada par de peças convexas, depois a união.
+# - Rotação: NFP(A rodada a, B rodada b) = Rot_a(A ⊕ −Rot_(b−a) B) + u_a − u_b, logo basta guardar em
+#   cache o núcleo por (forma A, forma B, b − a) e cada par de ângulos sai por rotação + translação.
+# - Inner-fit (IFP) numa chapa retangular: retângulo das posições que mantêm B dentro da chapa.
+# - Posições livres para (forma, ângulo) = IFP − ∪ NFP das peças já colocadas, mantidas por diferença
+#   incremental; escolhe-se o vértice que deixa o bordo inferior mais acima, depois mais à esquerda.
+# - Polígonos nas coords da textura (píxel (i, j) = [i, i+1) × [j, j+1)) e alargados o suficiente para
+#   cobrir os píxeis desenhados na posição arredondada (PIXEL_PAD): com folga 0 as texturas não se tocam.
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import math
+import time
+
+import numpy as np
+import cv2
+
+from app.nesting.core import Job, Piece, Placement, register_strategy
+
+try:
+    import shapely
+    from shapely.affinity import rotate as shp_rotate, translate as shp_translate
+    from shapely.geometry import Polygon, box
+    from shapely.geometry.polygon import orient
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+# contorno de uma máscara simplificado a esta fração do perímetro (mínimo 1 px), ver mask_polygon
+SIMPLIFY_FRAC = 0.002
+# um contorno que enche pelo menos isto do seu casco convexo passa a ser o casco (uma só peça convexa)
+HULL_RATIO = 0.985
+# folga do polígono sobre os centros dos píxeis opacos de bordo: ½ px do próprio píxel e ½ px do
+# arredondamento da posição ao desenhar (int(round(x))), em cada eixo → diagonal de 1 px
+PIXEL_PAD = math.sqrt(2.0)
+
+
+# ---------------- Soma de Minkowski ----------------
+def _ear_clip(coords: np.ndarray) -> List[np.ndarray]:
+    """Triangulação por orelhas de um anel simples em sentido anti-horário (sem ponto de fecho)."""
+    idx = list(range(len(coords)))
+    tris = []
+    guard = 0
+    while len(idx) > 3 and guard < 10 * len(coords):
+        guard += 1
+        n = len(idx)
+        for k in range(n):
+            i0, i1, i2 = idx[k - 1], idx[k], idx[(k + 1) % n]
+            a, b, c = coords[i0], coords[i1], coords[i2]
+            if (b[0]-a[0])*(c[1]-a[1]) - (b[1]-a[1])*(c[0]-a[0]) <= 0:
+                continue  # vértice reflexo
+            inside = False
+            for j in idx:
+                if j in (i0, i1, i2):
+                    continue
+                p = coords[j]
+                d1 = (b[0]-a[0])*(p[1]-a[1]) - (b[1]-a[1])*(p[0]-a[0])
+                d2 = (c[0]-b[0])*(p[1]-b[1]) - (c[1]-b[1])*(p[0]-b[0])
+                d3 = (a[0]-c[0])*(p[1]-c[1]) - (a[1]-c[1])*(p[0]-c[0])
+                if d1 >= 0 and d2 >= 0 and d3 >= 0:
+                    inside = True
+                    break
+            if inside:
+                continue
+            tris.append(np.array([a, b, c]))
+            idx.pop(k)
+            break
+        else:
+            break
+    if len(idx) == 3:
+        tris.append(coords[idx])
+    return tris
+
+
+def _merge_convex(tris: Sequence[np.ndarray]) -> List[np.ndarray]:
+    """Hertel–Mehlhorn: tira as diagonais da triangulação cujos dois extremos continuam convexos
+    (no máximo 4× o nº mínimo de peças convexas, contra n − 2 triângulos)."""
+    polys: Dict[int, list] = {}
+    owner: Dict[tuple, int] = {}            # aresta dirigida (u, v) → peça que a percorre
+    for k, t in enumerate(tris):
+        vs = [(float(x), float(y)) for x, y in t]
+        area2 = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(vs, vs[1:] + vs[:1]))
+        if area2 == 0:
+            continue
+        if area2 < 0:
+            vs.reverse()
+        polys[k] = vs
+        for i in range(len(vs)):
+            owner[(vs[i], vs[(i + 1) % len(vs)])] = k
+
+    def convex(prev, cur, nxt) -> bool:
+        return (cur[0] - prev[0]) * (nxt[1] - cur[1]) - (cur[1] - prev[1]) * (nxt[0] - cur[0]) >= -1e-9
+
+    for u, v in list(owner):
+        a, b = owner.get((u, v)), owner.get((v, u))
+        if a is None or b is None or a == b:
+            continue
+        A, B = polys[a], polys[b]
+        ia, ib = A.index(u), B.index(v)
+        ar = A[ia + 1:] + A[:ia + 1]        # v … u
+        br = B[ib + 1:] + B[:ib + 1]        # u … v
+        if not (convex(ar[-2], u, br[1]) and convex(br[-2], v, ar[1])):
+            continue
+        polys[a] = ar + br[1:-1]
+        del polys[b]
+        del owner[(u, v)], owner[(v, u)]
+        for i in range(len(br) - 1):
+            owner[(br[i], br[i + 1])] = a
+    return [np.asarray(vs) for vs in polys.values()]
+
+
+def convex_parts(poly) -> List[np.ndarray]:
+    """Peças convexas (arrays de vértices) cuja união é o polígono."""
+    poly = orient(poly, 1.0)
+    if poly.area >= poly.convex_hull.area * (1 - 1e-9):
+        return [np.asarray(poly.exterior.coords)[:-1]]
+    cdt = getattr(shapely, "constrained_delaunay_triangles", None)  # Shapely >= 2.1
+    if cdt is not None:
+        tris = [np.asarray(t.exterior.coords)[:-1] for t in shapely.get_parts(cdt(poly)) if t.area > 0]
+    else:
+        tris = _ear_clip(np.asarray(poly.exterior.coords)[:-1])
+    return _merge_convex(tris)
+
+
+def _stack(parts: Sequence[np.ndarray]) -> np.ndarray:
+    """Lista de peças com nº de vértices variável → array (n, k, 2), repetindo o último vértice."""
+    k = max(len(p) for p in parts)
+    return np.stack([np.vstack([p, np.repeat(p[-1:], k - len(p), axis=0)]) for p in parts])
+
+
+def minkowski_sum(parts_a: Sequence[np.ndarray], parts_b: Sequence[np.ndarray]):
+    """A ⊕ B a partir das decomposições convexas: ∪ casco(Ai ⊕ Bj), tudo vetorizado."""
+    a, b = _stack(parts_a), _stack(parts_b)
+    sums = a[:, None, :, None, :] + b[None, :, None, :, :]
+    pts = sums.reshape(len(a) * len(b), a.shape[1] * b.shape[1], 2)
+    hulls = shapely.convex_hull(shapely.multipoints(pts))
+    return shapely.union_all(hulls)
+
+
+# ---------------- Formas, rotações e cache ----------------
+def _rot(xy, ang):
+    """Mesma rotação que shp_rotate(·, -ang, origin=(0, 0)) (graus; y para baixo como nas imagens)."""
+    t = math.radians(-ang)
+    c, s = math.cos(t), math.sin(t)
+    return np.array([xy[0] * c - xy[1] * s, xy[0] * s + xy[1] * c])
+
+
+def rotated_size(w: int, h: int, ang: float) -> Tuple[int, int]:
+    """Tamanho de Image.rotate(ang, expand=True) (mesma conta que o Pillow, incluindo arredondamentos)."""
+    ang = ang % 360.0
+    if ang in (0, 180):
+        return w, h
+    if ang in (90, 270):
+        return h, w
+    t = -math.radians(ang)
+    a, b = round(math.cos(t), 15), round(math.sin(t), 15)
+    d, e = round(-math.sin(t), 15), round(math.cos(t), 15)
+    cx, cy = w / 2, h / 2
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    xs = [a * x + b * y + c for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    ys = [d * x + e * y + f for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    return math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys))
+
+
+@dataclass
+class NfpShape:
+    """Polígono de uma peça no referencial da textura não rodada (W0 × H0)."""
+    poly: object
+    tex_size: Tuple[int, int]
+    gap: float = 0.0
+    key: str = ""
+    _frames: Dict[int, tuple] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        if not self.key:
+            h = hashlib.sha1(shapely.to_wkb(shapely.normalize(self.poly)))
+            h.update(repr((self.tex_size, float(self.gap))).encode())
+            self.key = h.hexdigest()
+        self.poly_gap = self.poly.buffer(self.gap, join_style=2) if self.gap > 0 else self.poly
+        self.parts = convex_parts(self.poly)
+        self.parts_gap = convex_parts(self.poly_gap)
+
+    def frame(self, ang: int):
+        """(u, polígono rodado no referencial da textura rodada, bounds) com u = translação pós-rotação."""
+        fr = self._frames.get(ang)
+        if fr is None:
+            W0, H0 = self.tex_size
+            w_rot, h_rot = rotated_size(W0, H0, ang)
+            center = np.array([W0 / 2.0, H0 / 2.0])
+            u = center - _rot(center, ang) + np.array([(w_rot - W0) / 2.0, (h_rot - H0) / 2.0])
+            poly = shp_translate(shp_rotate(self.poly, -ang, origin=(0, 0)), xoff=u[0], yoff=u[1])
+            fr = self._frames[ang] = (u, poly, poly.bounds)
+        return fr
+
+
+class NfpCache:
+    """Núcleos A_gap ⊕ −Rot_d(B) por (forma A, forma B, d); partilhado entre execuções (LRU)."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._core: "OrderedDict[tuple, object]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def core(self, a: NfpShape, b: NfpShape, d: int):
+        key = (a.key, b.key, d % 360)
+        geom = self._core.get(key)
+        if geom is not None:
+            self._core.move_to_end(key)
+            self.hits += 1
+            return geom
+        self.misses += 1
+        neg_b = [-_rot(p.T, d).T for p in b.parts]
+        geom = minkowski_sum(a.parts_gap, neg_b)
+        self._core[key] = geom
+        if len(self._core) > self.maxsize:
+            self._core.popitem(last=False)
+        return geom
+
+    def nfp(self, a: NfpShape, ang_a: int, b: NfpShape, ang_b: int):
+        """NFP no referencial da chapa para A (ângulo ang_a) colocada na origem e B com ângulo ang_b."""
+        u_a = a.frame(ang_a)[0]
+        u_b = b.frame(ang_b)[0]
+        geom = shp_rotate(self.core(a, b, ang_b - ang_a), -ang_a, origin=(0, 0))
+        off = u_a - u_b
+        return shp_translate(geom, xoff=off[0], yoff=off[1])
+
+
+NFP_CACHE = NfpCache()
+
+
+# ---------------- Empacotador bottom-left ----------------
+@dataclass
+class _Placed:
+    shape: NfpShape
+    ang: int
+    x: float
+    y: float
+
+
+class NfpPacker:
+    """Chapa retangular W × H; coloca peças uma a uma no vértice bottom-left das posições livres."""
+
+    def __init__(self, sheet_w: float, sheet_h: float, cache: Optional[NfpCache] = None,
+                 deadline: Optional[float] = None):
+        self.sheet_w, self.sheet_h = float(sheet_w), float(sheet_h)
+        self.cache = cache or NFP_CACHE
+        self.deadline = deadline                # depois disto place() deixa de calcular ângulos novos
+        self.placed: List[_Placed] = []
+        self._free: Dict[tuple, list] = {}      # (forma, ângulo) → [região livre, nº de peças já subtraídas]
+        self._pair_nfp: Dict[tuple, object] = {}
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+
+    def _ifp(self, shape: NfpShape, ang: int):
+        minx, miny, maxx, maxy = shape.frame(ang)[2]
+        x0, x1 = -minx, self.sheet_w - maxx
+        y0, y1 = -miny, self.sheet_h - maxy
+        if x1 < x0 or y1 < y0:
+            return None
+        return box(x0, y0, x1, y1)
+
+    def _pair(self, a: NfpShape, ang_a: int, b: NfpShape, ang_b: int):
+        key = (a.key, ang_a, b.key, ang_b)
+        g = self._pair_nfp.get(key)
+        if g is None:
+            g = self._pair_nfp[key] = self.cache.nfp(a, ang_a, b, ang_b)
+        return g
+
+    def free_region(self, shape: NfpShape, ang: int):
+        st = self._free.get((shape.key, ang))
+        if st is None:
+            st = self._free[(shape.key, ang)] = [self._ifp(shape, ang), 0]
+        region, done = st
+        if region is not None and done < len(self.placed):
+            new = [shp_translate(self._pair(p.shape, p.ang, shape, ang), xoff=p.x, yoff=p.y)
+                   for p in self.placed[done:]]
+            region = region.difference(shapely.union_all(new))
+            st[0] = None if region.is_empty else region
+            st[1] = len(self.placed)
+        return st[0]
+
+    def best_position(self, shape: NfpShape, angles: Sequence[int]):
+        """(chave, ângulo, x, y) do melhor vértice livre entre os ângulos, ou None se não cabe.
+        Se o prazo passa a meio fica o melhor dos ângulos já vistos (ou None): a região livre de um
+        ângulo novo pode custar vários NFPs."""
+        best = None
+        for ang in angles:
+            if self.expired():
+                break
+            region = self.free_region(shape, ang)
+            if region is None:
+                continue
+            pts = shapely.get_coordinates(region)
+            if not len(pts):
+                continue
+            minx, _miny, _maxx, maxy = shape.frame(ang)[2]
+            # bordo inferior arredondado ao px: diferenças sub-píxel não devem mandar a peça para longe
+            bottom = np.round(pts[:, 1] + maxy)
+            left = pts[:, 0] + minx
+            i = int(np.lexsort((left, bottom))[0])
+            key = (bottom[i], left[i])
+            if best is None or key < best[0]:
+                best = (key, ang, float(pts[i, 0]), float(pts[i, 1]))
+        return best
+
+    def snapshot(self) -> tuple:
+        """Estado atual (as geometrias são imutáveis, basta copiar as listas)."""
+        return tuple(self.placed), {k: (v[0], v[1]) for k, v in self._free.items()}
+
+    def restore(self, snap: tuple):
+        """Volta a um estado de `snapshot()`; os NFPs por par já calculados ficam."""
+        placed, free = snap
+        self.placed = list(placed)
+        self._free = {k: [r, d] for k, (r, d) in free.items()}
+
+    def place(self, shape: NfpShape, angles: Sequence[int]) -> Optional[_Placed]:
+        best = self.best_position(shape, angles)
+        if best is None:
+            return None
+        _, ang, x, y = best
+        p = _Placed(shape, ang, x, y)
+        self.placed.append(p)
+        return p
+
+
+def _contour(mask: np.ndarray) -> Optional[np.ndarray]:
+    """Contorno exterior da máscara (pontos nos centros dos píxeis de bordo, coords da textura)."""
+    cnts, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not cnts:
+        return None
+    return max(cnts, key=cv2.contourArea)
+
+
+def _cover(poly, cnt: np.ndarray):
+    """Alarga `poly` o que for preciso para conter os píxeis do contorno `cnt` (centros em i + ½) desenhados
+    numa posição arredondada: distância do ponto mais de fora + PIXEL_PAD."""
+    centers = cnt.reshape(-1, 2).astype(float) + 0.5
+    out = float(shapely.distance(poly, shapely.points(centers)).max())
+    poly = poly.buffer(out + PIXEL_PAD, join_style=2)
+    if poly.geom_type != "Polygon":
+        poly = max(shapely.get_parts(poly), key=lambda g: g.area)
+    return Polygon(poly.exterior.coords)
+
+
+def mask_polygon(mask: np.ndarray, tol: Optional[float] = None):
+    """Polígono que cobre todos os píxeis da máscara, com poucos vértices (cada NFP custa ~ nº de peças
+    convexas de A × de B): contorno simplificado a `tol` px (por omissão SIMPLIFY_FRAC do perímetro),
+    trocado pelo casco convexo se o enche quase todo (HULL_RATIO), e alargado só o que for preciso para
+    voltar a cobrir os píxeis (_cover). Coordenadas como as da textura: o píxel (i, j) é [i, i+1) × [j, j+1),
+    as mesmas da rotação em NfpShape.frame e do Image.rotate."""
+    cnt = _contour(mask)
+    if cnt is None:
+        return None
+    if tol is None:
+        tol = max(1.0, SIMPLIFY_FRAC * cv2.arcLength(cnt, True))
+    pts = cv2.approxPolyDP(cnt, tol, True).reshape(-1, 2).astype(float) + 0.5
+    if len(pts) < 3:
+        x, y, w, h = cv2.boundingRect(cnt)
+        return _cover(box(x, y, x + w, y + h), cnt)
+    poly = Polygon(pts)
+    if not poly.is_valid:
+        poly = max(shapely.get_parts(poly.buffer(0)), key=lambda g: g.area)
+    hull = poly.convex_hull
+    if poly.area >= HULL_RATIO * hull.area:
+        poly = hull
+    return _cover(poly, cnt)
+
+
+def outline_polygon(piece: Piece, poly, mask: np.ndarray):
+    """Polígono de uma peça já à escala (`poly`, `mask` de scale_piece) para o NFP.
+
+    Peça vetorial: o polígono exato (a textura foi desenhada a partir dele), sem os anéis interiores,
+    alargado para cobrir os píxeis desenhados (traço do contorno incluído) e o arredondamento da posição.
+    Imagem: o polígono do detect_piece é uma aproximação do contorno na imagem original e pode ficar
+    1–2 px aquém da textura já escalada; aqui não há verificação raster, por isso usa-se a máscara.
+    """
+    if piece.exact and poly is not None:
+        cnt = _contour(mask)
+        outer = Polygon(poly.exterior)
+        return outer if cnt is None else _cover(outer, cnt)
+    outline = mask_polygon(mask)
+    if outline is None:
+        outline = box(0, 0, mask.shape[1], mask.shape[0])
+    return outline
+
+
+def shape_from_job(job: Job) -> NfpShape:
+    return NfpShape(outline_polygon(job.request.piece, job.poly, job.mask), job.tex.size, gap=float(job.gap))
+
+
+@register_strategy("nfp")
+def nfp_nest(job: Job):
+    """Enche a chapa com cópias da peça por NFP; posições exatas (sem grelha de píxeis)."""
+    if not SHAPELY_OK:
+        raise RuntimeError("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+    shape = shape_from_job(job)
+    packer = NfpPacker(job.sheet_w, job.sheet_h, deadline=job.deadline)
+    hits0, misses0 = packer.cache.hits, packer.cache.misses
+    textures = {}
+    placements = []
+    area = float(job.mask.sum())
+    area_total = float(job.sheet_w) * float(job.sheet_h)
+    while not job.expired():
+        p = packer.place(shape, job.angles)
+        if p is None:
+            break
+        if p.ang not in textures:
+            textures[p.ang] = job.tex.rotate(p.ang, expand=True)
+        tex = textures[p.ang]
+        placements.append(Placement(int(round(p.x)), int(round(p.y)), p.ang, tex.size[0], tex.size[1], tex))
+        job.report(placements, len(placements) * area / area_total * 100.0)
+
+    util = (len(placements) * area / area_total * 100.0) if area_total else 0.0
+    return placements, util, {"nfp_cache_hits": packer.cache.hits - hits0,
+                              "nfp_cache_misses": packer.cache.misses - misses0}
@@ -0,0 +1,178 @@
+# app/nesting/occupancy.py — Grelhas de ocupação: bits empacotados + imagem integral por faixa de linhas
+#
+# BitGrid: 8 células por byte (coluna 0 = bit mais alto, como np.packbits). Uma chapa de 3×2 m a 0,1 mm
+# (30000×20000 células) ocupa 75 MB em vez de 600 MB com uint8. Colisão de uma máscara = AND dos bytes
+# da janela com a máscara empacotada já deslocada para o bit certo (8 versões, uma por x % 8), e colocar
+# é um OR; nenhum dos dois copia a grelha.
+#
+# IntegralOccupancy: os nesters raster varrem a chapa de cima para baixo e cada teste de colisão é um
+# retângulo [x0,x1)×[y0,y1) cuja faixa de linhas [y0,y1) muda devagar. Em vez de uma tabela de somas 2D
+# completa (cada colocação teria de atualizar tudo abaixo/à direita), guardamos:
+#   - col[x]  = nº de células ocupadas na coluna x dentro da faixa atual
+#   - pref[x] = soma de col[:x]  (a linha y1 da imagem integral menos a linha y0)
+# Um teste custa 2 leituras de `pref`; mudar de faixa só lê (desempacota) as linhas que entram/saem;
+# uma colocação atualiza `col` nas suas colunas e refaz `pref` em O(largura).
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# nº de bits a 1 em cada byte
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# posição do primeiro bit a 1 (0 = bit mais alto) de cada byte; 8 para o zero
+_FIRST_BIT = np.array([8] + [8 - i.bit_length() for i in range(1, 256)], dtype=np.uint8)
+# linhas desempacotadas de cada vez (limita a memória temporária em chapas muito largas)
+_UNPACK_ROWS = 256
+
+
+def popcount(block: np.ndarray) -> int:
+    return int(_POPCOUNT[block].sum(dtype=np.int64))
+
+
+def pack_rows(mask: np.ndarray, shift: int = 0, nbytes: Optional[int] = None) -> np.ndarray:
+    """Linhas de `mask` (bool) empacotadas 8 por byte, com `shift` bits vazios à esquerda."""
+    h, w = mask.shape
+    nb = nbytes if nbytes is not None else (shift + w + 7) // 8
+    padded = np.zeros((h, nb * 8), dtype=bool)
+    padded[:, shift:shift + w] = mask
+    return np.packbits(padded, axis=1)
+
+
+class PackedMask:
+    """Máscara de uma peça empacotada nas 8 posições de bit (x % 8), todas com a mesma largura em bytes."""
+
+    def __init__(self, mask: np.ndarray):
+        mask = np.asarray(mask, dtype=bool)
+        self.h, self.w = mask.shape
+        self.nb = (self.w + 7 + 7) // 8
+        self.shifts: List[np.ndarray] = [pack_rows(mask, s, self.nb) for s in range(8)]
+        self.cells = int(np.count_nonzero(mask))
+
+
+class BitGrid:
+    def __init__(self, h: int, w: int, fill: bool = False):
+        self.h, self.w = int(h), int(w)
+        self.nb = (self.w + 7) // 8
+        # +1 byte por linha: uma máscara deslocada pode passar para lá do último byte útil
+        self.bits = np.zeros((self.h, self.nb + 1), dtype=np.uint8)
+        if fill and self.w:
+            self.bits[:, :self.nb] = 0xFF
+            if self.w % 8:
+                self.bits[:, self.nb - 1] = (0xFF << (8 - self.w % 8)) & 0xFF
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.bits.nbytes)
+
+    def count(self) -> int:
+        return sum(popcount(self.bits[r:r + _UNPACK_ROWS]) for r in range(0, self.h, _UNPACK_ROWS))
+
+    def column_counts(self, y0: int, y1: int) -> np.ndarray:
+        """Nº de células a 1 por coluna nas linhas [y0,y1)."""
+        out = np.zeros(self.w, dtype=np.int64)
+        for r in range(y0, y1, _UNPACK_ROWS):
+            rows = self.bits[r:min(y1, r + _UNPACK_ROWS), :self.nb]
+            out += np.unpackbits(rows, axis=1, count=self.w).sum(axis=0, dtype=np.int64)
+        return out
+
+    # --- máscaras pré-empacotadas (teste + colocação repetidos com a mesma peça) ---
+    def collides(self, pm: PackedMask, x: int, y: int) -> bool:
+        b0 = x >> 3
+        win = self.bits[y:y + pm.h, b0:b0 + pm.nb]
+        return bool(np.bitwise_and(win, pm.shifts[x & 7]).any())
+
+    def paint(self, pm: PackedMask, x: int, y: int) -> int:
+        """OR da máscara em (x, y); devolve o nº de células que passaram a ocupadas."""
+        return popcount(self._or(y, x >> 3, pm.shifts[x & 7]))
+
+    # --- máscaras avulsas ---
+    def paint_mask(self, x: int, y: int, mask: np.ndarray) -> np.ndarray:
+        """OR de `mask` (bool) em (x, y); devolve os bits novos empacotados a partir do byte x // 8."""
+        return self._or(y, x >> 3, pack_rows(mask, x & 7))
+
+    def clear_mask(self, x: int, y: int, mask: np.ndarray):
+        block = pack_rows(mask, x & 7)
+        b0 = x >> 3
+        self.bits[y:y + block.shape[0], b0:b0 + block.shape[1]] &= ~block
+
+    def first_set(self, start: int = 0) -> Optional[Tuple[int, int, int]]:
+        """Primeira célula a 1 em ordem de linhas a partir do byte `start` (índice plano):
+        (byte, y, x) ou None."""
+        flat = self.bits.reshape(-1)
+        if start >= flat.size:
+            return None
+        i = start + int(np.argmax(flat[start:] != 0))
+        if not flat[i]:
+            return None
+        y, b = divmod(i, self.nb + 1)
+        return i, y, b * 8 + int(_FIRST_BIT[flat[i]])
+
+    def _or(self, y: int, b0: int, block: np.ndarray) -> np.ndarray:
+        win = self.bits[y:y + block.shape[0], b0:b0 + block.shape[1]]
+        added = block & ~win
+        win |= block
+        return added
+
+
+class IntegralOccupancy:
+    def __init__(self, h: int, w: int):
+        self.h, self.w = int(h), int(w)
+        self.grid = BitGrid(self.h, self.w)
+        self.used = 0
+        self._band = (0, 0)
+        self._col = np.zeros(self.w, dtype=np.int64)
+        self._pref = np.zeros(self.w + 1, dtype=np.int64)
+
+    def _rows(self, y0: int, y1: int) -> np.ndarray:
+        return self.grid.column_counts(y0, y1)
+
+    def _refresh(self):
+        np.cumsum(self._col, out=self._pref[1:])
+
+    def band(self, y0: int, y1: int):
+        """Move a faixa para [y0,y1), lendo só as linhas que entram ou saem."""
+        b0, b1 = self._band
+        if (y0, y1) == (b0, b1):
+            return
+        if y0 >= b1 or y1 <= b0:
+            self._col[:] = self._rows(y0, y1)
+        else:
+            if y0 > b0:
+                self._col -= self._rows(b0, y0)
+            elif y0 < b0:
+                self._col += self._rows(y0, b0)
+            if y1 > b1:
+                self._col += self._rows(b1, y1)
+            elif y1 < b1:
+                self._col -= self._rows(y1, b1)
+        self._band = (y0, y1)
+        self._refresh()
+
+    def free_row(self, y0: int, y1: int, x0: np.ndarray, x1: np.ndarray) -> np.ndarray:
+        """Vetorizado: para a faixa [y0,y1) e vários intervalos [x0[i], x1[i]), True onde está livre."""
+        self.band(y0, y1)
+        return self._pref[x1] == self._pref[x0]
+
+    def is_free(self, x0: int, y0: int, x1: int, y1: int) -> bool:
+        self.band(y0, y1)
+        return self._pref[x1] == self._pref[x0]
+
+    def fill(self, x0: int, y0: int, x1: int, y1: int, values=1):
+        """Marca como ocupadas as células de [x0,x1)×[y0,y1) onde `values` ≠ 0 (escalar ou array do
+        tamanho do retângulo) e mantém a faixa atual coerente."""
+        if x1 <= x0 or y1 <= y0:
+            return
+        mask = np.broadcast_to(np.asarray(values) != 0, (y1 - y0, x1 - x0))
+        added = self.grid.paint_mask(x0, y0, mask)
+        n = popcount(added)
+        if n == 0:
+            return
+        self.used += n
+        b0, b1 = self._band
+        r0, r1 = max(y0, b0), min(y1, b1)
+        if r0 < r1:
+            c0 = (x0 >> 3) * 8
+            cols = np.unpackbits(added[r0 - y0:r1 - y0], axis=1).sum(axis=0, dtype=np.int64)
+            c1 = min(self.w, c0 + cols.size)
+            self._col[c0:c1] += cols[:c1 - c0]
+            self._refresh()
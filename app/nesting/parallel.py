@@ -0,0 +1,107 @@
+# app/nesting/parallel.py — Ensaios independentes (ângulos, sementes) num ProcessPoolExecutor
+#
+# - Um único pool por processo, reutilizado entre pedidos (o Streamlit reusa o processo).
+# - Processos por "spawn": o servidor do Streamlit tem várias threads e fork com threads é frágil.
+# - Máscaras/texturas vão por memória partilhada; os argumentos pequenos seguem por pickle.
+# - O prazo é absoluto (time.time()), partilhado por todos os workers: cada ensaio pára sozinho
+#   quando o tempo acaba e devolve o que já tem.
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context, shared_memory
+from typing import Callable, List, Optional, Sequence
+import atexit
+import os
+import threading
+import time
+
+import numpy as np
+
+# tempo extra para os workers devolverem o parcial depois do prazo
+GRACE_S = 1.0
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+def resolve_workers(workers: int) -> int:
+    """0 (ou negativo) = todos os núcleos."""
+    n = int(workers or 0)
+    return max(1, n if n > 0 else (os.cpu_count() or 1))
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _POOL_SIZE = workers
+        return _POOL
+
+
+def shutdown_pool():
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL, _POOL_SIZE = None, 0
+
+
+atexit.register(shutdown_pool)
+
+
+class SharedArray:
+    """Cópia de um array NumPy em memória partilhada; `spec` é o que se envia aos workers."""
+
+    def __init__(self, arr: np.ndarray):
+        arr = np.ascontiguousarray(arr)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, arr.dtype, buffer=self._shm.buf)[...] = arr
+        self.spec = (self._shm.name, arr.shape, arr.dtype.str)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec) -> np.ndarray:
+    """Lado do worker: lê o array partilhado (cópia local; o segmento é do processo principal)."""
+    name, shape, dtype = spec
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: o worker regista o nome no resource_tracker do pai (herdado no spawn), que já o tem;
+        # não se desregista aqui, senão o unlink do pai falha no tracker
+        shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, np.dtype(dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+def run_trials(fn: Callable, arg_list: Sequence[tuple], deadline: Optional[float], workers: int) -> List[Optional[object]]:
+    """Corre fn(*args) para cada args no pool; devolve os resultados pela ordem (None se não acabou a tempo)."""
+    pool = get_pool(workers)
+    futs = [pool.submit(fn, *args) for args in arg_list]
+    timeout = None if deadline is None else max(0.0, deadline - time.time()) + GRACE_S
+    done, pending = wait(futs, timeout=timeout)
+    for f in pending:
+        f.cancel()
+    out = []
+    for f in futs:
+        if f in done:
+            exc = f.exception()
+            if exc is not None:
+                raise exc
+            out.append(f.result())
+        else:
+            out.append(None)
+    return out
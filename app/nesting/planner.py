@@ -0,0 +1,315 @@
+# app/nesting/planner.py — Plano de chapas para a quantidade total do trabalho
+#
+# Em vez de ceil(qtd / peças por chapa), empacota a quantidade pedida chapa a chapa:
+# - peça única: repete o layout já calculado (qualquer estratégia) e a última chapa leva só o resto;
+# - trabalho misto: enche cada chapa com o que falta (NFP, app/nesting/multi.py); quando uma chapa sai
+#   igual à anterior e ainda há quantidade para a repetir, o layout é reutilizado sem recalcular.
+# A última chapa fica parcial e a faixa livre (em baixo ou à direita) é devolvida como sobra reutilizável.
+# Sobras do inventário no pedido (MultiNestRequest.remnants, vindas de app.db.find_remnants) são gastas
+# primeiro, da menor para a maior, antes de abrir chapas novas; fora de `sheets`, ficam em `offcuts`.
+# Tamanhos alternativos vêm dos materiais de área (Material.largura_cm/altura_cm), passados pela página.
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import time
+
+from app.nesting.core import MultiNestRequest, NestResult, Placement, Remnant, Sheet
+from app.nesting.multi import fill_sheet, prepare_parts
+
+# teto de chapas por plano (evita ciclos enormes com quantidades absurdas)
+MAX_SHEETS = 1000
+
+
+@dataclass
+class RemnantUse:
+    """Sobra do inventário gasta no plano: colocações nela e o que ainda sobra depois."""
+    remnant: Remnant
+    sheet_px: Tuple[int, int]
+    placements: List[Placement]
+    used_px: float
+    leftover: Optional[Remnant] = None
+
+    def as_dict(self) -> dict:
+        return {"remnant": self.remnant.as_dict(), "count": len(self.placements),
+                "utilization": round(self.used_px / (float(self.sheet_px[0]) * self.sheet_px[1]) * 100.0, 3),
+                "leftover": self.leftover.as_dict() if self.leftover is not None else None}
+
+
+@dataclass
+class SheetPlan:
+    sheet: Sheet
+    dpi: float
+    sheet_px: Tuple[int, int]
+    layouts: List[List[Placement]]      # uma lista de colocações por chapa (layouts repetidos partilham a lista)
+    used_px: List[float]                # área ocupada por chapa (px²)
+    names: List[str]
+    requested: List[int]
+    placed: List[int]
+    remnant: Optional[Remnant] = None
+    elapsed_s: float = 0.0
+    stats: dict = field(default_factory=dict)
+    offcuts: List[RemnantUse] = field(default_factory=list)
+
+    @property
+    def sheets(self) -> int:
+        return len(self.layouts)
+
+    @property
+    def remaining(self) -> List[int]:
+        return [max(0, q - n) for q, n in zip(self.requested, self.placed)]
+
+    @property
+    def complete(self) -> bool:
+        return not any(self.remaining)
+
+    @property
+    def utilization(self) -> float:
+        """% ocupada do total das chapas usadas (área útil)."""
+        area = float(self.sheet_px[0]) * float(self.sheet_px[1]) * self.sheets
+        return (sum(self.used_px) / area * 100.0) if area else 0.0
+
+    @property
+    def sheets_used(self) -> float:
+        """Chapas gastas contando a sobra como devolvida ao stock (fração na última chapa)."""
+        if not self.sheets:
+            return 0.0
+        full = self.sheet.width_cm * self.sheet.height_cm
+        rem = self.remnant.area_cm2 if self.remnant is not None else 0.0
+        return self.sheets - (rem / full if full else 0.0)
+
+    def as_dict(self) -> dict:
+        return {
+            "sheet_cm": [self.sheet.width_cm, self.sheet.height_cm],
+            "sheets": self.sheets,
+            "sheets_used": round(self.sheets_used, 4),
+            "utilization": round(self.utilization, 3),
+            "complete": self.complete,
+            "parts": [{"name": n, "requested": q, "placed": k}
+                      for n, q, k in zip(self.names, self.requested, self.placed)],
+            "per_sheet": [len(l) for l in self.layouts],
+            "remnant": self.remnant.as_dict() if self.remnant is not None else None,
+            "offcuts": [o.as_dict() for o in self.offcuts],
+            "elapsed_s": round(self.elapsed_s, 4),
+            "stats": self.stats,
+        }
+
+
+@dataclass(frozen=True)
+class SheetOption:
+    """Tamanho de chapa candidato (p.ex. um Material de área) com preço por chapa e stock."""
+    name: str
+    sheet: Sheet
+    price: float = 0.0
+    stock: Optional[float] = None
+
+
+@dataclass
+class AlternativesRequest:
+    """Pedido de comparação de tamanhos de chapa (plan_alternatives), para correr como job."""
+    request: MultiNestRequest
+    options: List[SheetOption]
+
+    @property
+    def time_limit_s(self) -> float:
+        return float(self.request.time_limit_s)
+
+    @property
+    def dpi(self) -> float:
+        return float(self.request.dpi)
+
+
+def sheet_options(materials: Iterable, margin_cm: float = 0.0) -> List[SheetOption]:
+    """Opções a partir de registos Material (tipo AREA com largura/altura); sem depender de app.db."""
+    out = []
+    for m in materials:
+        if str(getattr(m, "tipo", "AREA") or "AREA").upper() != "AREA":
+            continue
+        w = float(getattr(m, "largura_cm", 0.0) or 0.0)
+        h = float(getattr(m, "altura_cm", 0.0) or 0.0)
+        if w <= 2 * margin_cm or h <= 2 * margin_cm:
+            continue
+        name = getattr(m, "code", "") or getattr(m, "nome_pt", "") or f"{w:g}×{h:g}"
+        out.append(SheetOption(name=name, sheet=Sheet(w, h, margin_cm),
+                               price=float(getattr(m, "preco_compra_un", 0.0) or 0.0),
+                               stock=getattr(m, "quantidade", None)))
+    return out
+
+
+# ---------------- Sobra ----------------
+def _extent(p: Placement, boxes: Dict[int, tuple]) -> Tuple[int, int]:
+    """(direita, baixo) dos píxeis opacos da colocação, em coords da chapa útil."""
+    if p.image is None:
+        return p.x + p.w, p.y + p.h
+    b = boxes.get(id(p.image))
+    if b is None:
+        b = boxes[id(p.image)] = p.image.getchannel("A").getbbox() or (0, 0, 0, 0)
+    return p.x + b[2], p.y + b[3]
+
+
+def last_sheet(placements: Sequence[Placement], rest: int, sheet: Sheet, dpi: float,
+               gap_px: int) -> List[Placement]:
+    """`rest` colocações de um layout cheio que deixam a maior sobra: as de bordo de baixo mais acima (faixa
+    livre em baixo) ou as de bordo direito mais à esquerda (faixa à direita). A ordem das colocações não
+    serve: shapely/fft/nfp não colocam de cima para baixo."""
+    boxes: Dict[int, tuple] = {}
+    ext = {id(p): _extent(p, boxes) for p in placements}
+    by_bottom = sorted(placements, key=lambda p: (ext[id(p)][1], ext[id(p)][0]))[:rest]
+    by_right = sorted(placements, key=lambda p: (ext[id(p)][0], ext[id(p)][1]))[:rest]
+
+    def area(l):
+        r = find_remnant(l, sheet, dpi, gap_px)
+        return r.area_cm2 if r is not None else 0.0
+    return max((by_bottom, by_right), key=area)
+
+
+def find_remnant(placements: Sequence[Placement], sheet: Sheet, dpi: float, gap_px: int) -> Optional[Remnant]:
+    """Maior faixa livre a toda a largura (em baixo) ou a toda a altura (à direita) da chapa."""
+    if not placements:
+        return Remnant(0.0, 0.0, sheet.width_cm, sheet.height_cm)
+    boxes: Dict[int, tuple] = {}
+    ext = [_extent(p, boxes) for p in placements]
+    cut_x = sheet.margin_cm + (max(e[0] for e in ext) + gap_px) / dpi
+    cut_y = sheet.margin_cm + (max(e[1] for e in ext) + gap_px) / dpi
+    bottom = Remnant(0.0, cut_y, sheet.width_cm, max(0.0, sheet.height_cm - cut_y))
+    right = Remnant(cut_x, 0.0, max(0.0, sheet.width_cm - cut_x), sheet.height_cm)
+    best = max(bottom, right, key=lambda r: r.area_cm2)
+    return best if best.area_cm2 > 0 else None
+
+
+# ---------------- Planos ----------------
+def plan_single(result: NestResult, qty: int, sheet: Sheet, gap_cm: float = 0.0, name: str = "") -> SheetPlan:
+    """Peça única: o layout de `result` repetido; a última chapa leva as `resto` colocações que deixam a
+    maior sobra (last_sheet)."""
+    t0 = time.perf_counter()
+    qty = max(0, int(qty))
+    per = result.count
+    W, H = result.sheet_px
+    per_piece = (result.utilization / 100.0 * W * H / per) if per else 0.0
+    gap_px = max(0, int(gap_cm * result.dpi))
+    layouts: List[List[Placement]] = []
+    if per and qty:
+        full, rest = divmod(qty, per)
+        layouts = [result.placements] * full
+        if rest:
+            layouts.append(last_sheet(result.placements, rest, sheet, result.dpi, gap_px))
+    placed = min(qty, per * len(layouts)) if per else 0
+    return SheetPlan(
+        sheet=sheet, dpi=result.dpi, sheet_px=(W, H), layouts=layouts,
+        used_px=[len(l) * per_piece for l in layouts],
+        names=[name], requested=[qty], placed=[placed],
+        remnant=find_remnant(layouts[-1], sheet, result.dpi, gap_px) if layouts else None,
+        elapsed_s=time.perf_counter() - t0,
+        stats={"strategy": result.strategy, "per_sheet": per},
+    )
+
+
+def _repeatable(prev_q: Sequence[int], prev_placed: Sequence[int], q: Sequence[int]) -> bool:
+    """A chapa anterior sai igual com as quantidades `q`? Sim se cada peça parou pelo mesmo motivo:
+    por não caber (e ainda há pelo menos o mesmo a colocar) ou por atingir a quota (e a quota é a mesma)."""
+    for qp, n, qn in zip(prev_q, prev_placed, q):
+        if n < qp:
+            if qn < n:
+                return False
+        elif qn != n:
+            return False
+    return True
+
+
+def plan_parts(request: MultiNestRequest, max_sheets: int = MAX_SHEETS,
+               progress: Optional[Callable[[int, Sequence[Placement]], None]] = None) -> SheetPlan:
+    """Trabalho misto: sobras do pedido primeiro, depois chapas até colocar tudo, até uma peça não caber
+    numa chapa vazia ou até ao tempo. `progress(nº de chapas, layout da última)` é chamado a cada chapa fechada."""
+    t0 = time.perf_counter()
+    deadline = time.time() + float(request.time_limit_s)
+    dpi = float(request.dpi)
+    parts = prepare_parts(request)
+    gap_px = max(0, int(request.gap_cm * dpi))
+    W, H = request.sheet.usable_px(dpi)
+    left = [p.quantity for p in parts]
+    offcuts, left, timed_out = _fill_remnants(request, parts, left, deadline, gap_px)
+    layouts: List[List[Placement]] = []
+    used: List[float] = []
+    prev = None         # (quantidades, colocadas, layout, área)
+    reused = 0
+    while any(left) and len(layouts) < max_sheets and not timed_out:
+        if prev is not None and _repeatable(prev[0], prev[1], left):
+            q, placed, placements, area = prev
+            reused += 1
+        else:
+            q = list(left)
+            placements, placed, timed_out, _ = fill_sheet(parts, q, W, H, request.order, deadline)
+            area = sum(parts[i].area * n for i, n in enumerate(placed))
+            if timed_out and not placements:
+                break
+        if not placements:
+            break           # o que falta não cabe numa chapa vazia
+        layouts.append(placements)
+        used.append(area)
+        left = [a - b for a, b in zip(left, placed)]
+        if progress is not None:
+            progress(len(layouts), placements)
+        prev = None if timed_out else (q, placed, placements, area)
+        if timed_out:
+            break
+
+    return SheetPlan(
+        sheet=request.sheet, dpi=dpi, sheet_px=(W, H), layouts=layouts, used_px=used,
+        names=[p.name for p in parts],
+        requested=[p.quantity for p in parts],
+        placed=[p.quantity - l for p, l in zip(parts, left)],
+        remnant=find_remnant(layouts[-1], request.sheet, dpi, gap_px) if layouts else None,
+        elapsed_s=time.perf_counter() - t0,
+        stats={"order": request.order, "timed_out": timed_out, "reused_layouts": reused},
+        offcuts=offcuts,
+    )
+
+
+def _fill_remnants(request: MultiNestRequest, parts, left: Sequence[int], deadline: float,
+                   gap_px: int) -> Tuple[List[RemnantUse], List[int], bool]:
+    """Enche as sobras do pedido, da menor para a maior; devolve (sobras usadas, o que falta, esgotou o tempo)."""
+    dpi = float(request.dpi)
+    left = list(left)
+    out: List[RemnantUse] = []
+    for rem in sorted(request.remnants, key=lambda r: (r.area_cm2, r.id or 0)):
+        if not any(left):
+            break
+        sheet = Sheet(rem.width_cm, rem.height_cm, request.sheet.margin_cm)
+        if rem.width_cm <= 2 * sheet.margin_cm or rem.height_cm <= 2 * sheet.margin_cm:
+            continue
+        w, h = sheet.usable_px(dpi)
+        placements, placed, timed_out, _ = fill_sheet(parts, left, w, h, request.order, deadline)
+        if placements:
+            out.append(RemnantUse(
+                remnant=rem, sheet_px=(w, h), placements=placements,
+                used_px=sum(parts[i].area * n for i, n in enumerate(placed)),
+                leftover=find_remnant(placements, sheet, dpi, gap_px),
+            ))
+            left = [a - b for a, b in zip(left, placed)]
+        if timed_out:
+            return out, left, True
+    return out, left, False
+
+
+def plan_alternatives(request: MultiNestRequest, options: Sequence[SheetOption],
+                      max_sheets: int = MAX_SHEETS,
+                      progress: Optional[Callable[[int, int], None]] = None) -> List[Tuple[SheetOption, SheetPlan]]:
+    """Um plano por tamanho de chapa, o tempo do pedido repartido entre eles. Ordem: completos primeiro,
+    depois menor custo (preço × chapas gastas) ou, sem preços, menor área de material gasta.
+    `progress(feitas, total)` é chamado antes de cada opção (e pode interromper com uma exceção)."""
+    if not options:
+        return []
+    budget = float(request.time_limit_s) / len(options)
+    out = []
+    for i, opt in enumerate(options):
+        if progress is not None:
+            progress(i, len(options))
+        # as sobras do pedido são do material atual, não das alternativas
+        out.append((opt, plan_parts(replace(request, sheet=opt.sheet, time_limit_s=budget, remnants=()), max_sheets)))
+    priced = all(opt.price > 0 for opt, _ in out)
+
+    def key(item):
+        opt, plan = item
+        cost = opt.price * plan.sheets_used if priced else opt.sheet.width_cm * opt.sheet.height_cm * plan.sheets_used
+        return (not plan.complete, sum(plan.remaining), cost, plan.sheets)
+
+    return sorted(out, key=key)
@@ -0,0 +1,164 @@
+# app/nesting/raster.py — Nesting raster guloso com varrimento de ângulos
+from __future__ import annotations
+from typing import Iterable, Optional
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.nesting.core import Job, Placement, register_strategy
+from app.nesting.occupancy import IntegralOccupancy
+from app.nesting.parallel import SharedArray, attach, resolve_workers, run_trials
+
+
+def raster_sweep(mask: Image.Image, sw_px: int, sh_px: int, gap_px: int, angles: Iterable[int],
+                 deadline: Optional[float] = None, stride: Optional[int] = None):
+    """Para cada ângulo enche a grelha de ocupação do zero e fica com o melhor.
+
+    A colisão é testada numa tabela de somas (IntegralOccupancy, grelha de bits), uma linha de candidatos
+    de cada vez. Cada ângulo usa uma grelha nova e só a do ângulo em curso está viva (1 bit por célula).
+    Com `deadline`, o ângulo em curso pára na linha em que o tempo acaba (o parcial conta).
+    `stride` fixa o passo em px (por omissão 20% do maior lado da peça rodada).
+    Devolve (placements [dicts x_px/y_px/angle/w/h], células ocupadas no vencedor, nº de testes).
+    """
+    best_used = None
+    best_placements = []
+    probes = 0
+
+    expired = False
+    for ang in angles:
+        if expired:
+            break
+        m = mask.rotate(ang, expand=True, fillcolor=0)
+        m_arr = np.array(m) // 255  # 0/1
+        mh, mw = m_arr.shape
+        occ = IntegralOccupancy(sh_px, sw_px)
+        placements_tmp = []
+        # step size: choose small stride for better fill vs speed
+        step = max(1, int(stride or max(mw, mh) * 0.2))
+        xs = np.arange(0, sw_px - mw + 1, step)
+        if xs.size == 0:
+            continue
+        # janela de colisão (peça + folga) para cada x candidato
+        wx0 = np.maximum(0, xs - gap_px)
+        wx1 = np.minimum(sw_px, xs + mw + gap_px)
+        for y in range(0, sh_px - mh + 1, step):
+            if deadline is not None and time.time() > deadline:
+                # fica com o que já foi colocado (layout válido) e não começa outros ângulos
+                expired = True
+                break
+            y0 = max(0, y - gap_px); y1 = min(sh_px, y + mh + gap_px)
+            i = 0
+            while i < xs.size:
+                # testa de uma vez todos os x restantes da linha (O(1) cada via tabela de somas)
+                free = occ.free_row(y0, y1, wx0[i:], wx1[i:])
+                probes += free.size
+                hit = np.flatnonzero(free)
+                if hit.size == 0:
+                    break
+                i += int(hit[0])
+                x = int(xs[i])
+                # draw piece
+                occ.fill(x, y, x + mw, y + mh, m_arr)
+                # add gap border
+                if gap_px > 0:
+                    occ.fill(int(wx0[i]), y0, int(wx1[i]), y1, 1)
+                placements_tmp.append({"x_px": x, "y_px": y, "angle": ang, "w": mw, "h": mh})
+                i += 1
+        if best_used is None or len(placements_tmp) > len(best_placements):
+            best_used = occ.used
+            best_placements = placements_tmp
+
+    return best_placements, best_used or 0, probes
+
+
+def _sweep_task(mask_spec, sw_px, sh_px, gap_px, ang, deadline, stride):
+    """Worker: um ângulo. Devolve (placements, células ocupadas, nº de testes)."""
+    mask = Image.fromarray(attach(mask_spec), mode="L")
+    return raster_sweep(mask, sw_px, sh_px, gap_px, [ang], deadline=deadline, stride=stride)
+
+
+def parallel_raster_sweep(mask: Image.Image, sw_px: int, sh_px: int, gap_px: int, angles: Iterable[int],
+                          deadline: Optional[float] = None, stride: Optional[int] = None, workers: int = 0):
+    """raster_sweep com um ângulo por processo. Devolve (placements, células ocupadas, nº de testes).
+
+    O vencedor é o mesmo do varrimento em série: mais peças, e em empate o primeiro ângulo da lista.
+    """
+    angles = list(angles)
+    workers = resolve_workers(workers)
+    if workers <= 1 or len(angles) <= 1:
+        return raster_sweep(mask, sw_px, sh_px, gap_px, angles, deadline=deadline, stride=stride)
+
+    with SharedArray(np.array(mask.convert("L"))) as shared:
+        results = run_trials(_sweep_task, [(shared.spec, sw_px, sh_px, gap_px, ang, deadline, stride)
+                                           for ang in angles], deadline, workers)
+    best_placements, best_used, probes = [], 0, 0
+    for res in results:
+        if res is None:
+            continue
+        found, used, n = res
+        probes += n
+        if len(found) > len(best_placements):
+            best_placements, best_used = found, used
+    return best_placements, best_used, probes
+
+
+# --- Greedy free-rotation nesting (angle sweep) ---
+# memória máxima da grelha de ocupação (bits) antes de baixar a resolução: 3×2 m a 0,1 mm = 75 MB
+MAX_GRID_BYTES = 96 * 2**20
+PREVIEW_MAX_PX = 2000
+
+
+def greedy_nest(mask: Image.Image, sheet_w_cm: float, sheet_h_cm: float, dpi: int, gap_cm: float, border_cm: float, angle_step: int = 10, max_px: Optional[int] = None, workers: int = 0):
+    # scale sheet
+    sw_px = max(1, int(max(0.0, sheet_w_cm - 2*border_cm) * dpi))
+    sh_px = max(1, int(max(0.0, sheet_h_cm - 2*border_cm) * dpi))
+    # a grelha tem 1 bit por célula: só se baixa a resolução acima de MAX_GRID_BYTES (ou de max_px, se dado)
+    scale_factor = 1.0
+    if sw_px * sh_px / 8 > MAX_GRID_BYTES:
+        scale_factor = (MAX_GRID_BYTES * 8 / (sw_px * sh_px)) ** 0.5
+    if max_px is not None and max(sw_px, sh_px) * scale_factor > max_px:
+        scale_factor = max_px / max(sw_px, sh_px)
+    if scale_factor < 1.0:
+        sw_px = int(sw_px * scale_factor); sh_px = int(sh_px * scale_factor)
+        dpi = int(dpi * scale_factor)
+
+    gap_px = max(0, int(gap_cm * dpi))
+
+    # normalize mask size by requested piece cm (caller must resize before)
+    best_placements, used, _probes = parallel_raster_sweep(mask, sw_px, sh_px, gap_px, range(0, 360, angle_step), workers=workers)
+    best_total = len(best_placements)
+
+    # Create preview image (white background, colored pieces); em alta resolução fica reduzida a
+    # PREVIEW_MAX_PX no lado maior (a grelha é em bits, uma imagem RGB do tamanho dela não seria)
+    k = min(1.0, PREVIEW_MAX_PX / max(sw_px, sh_px))
+    preview = Image.new("RGB", (max(1, int(sw_px * k)), max(1, int(sh_px * k))), "white")
+    # draw colored rectangles approximating placements (for speed)
+    draw = ImageDraw.Draw(preview)
+    rng_colors = [(255, 77, 77), (77, 166, 255), (77, 255, 166), (255, 166, 77), (180, 77, 255), (255, 226, 77)]
+    for i, p in enumerate(best_placements):
+        color = rng_colors[i % len(rng_colors)]
+        # draw bounding box; faster than pasting rotated alpha
+        draw.rectangle([p["x_px"]*k, p["y_px"]*k, (p["x_px"]+p["w"]-1)*k, (p["y_px"]+p["h"]-1)*k], outline=color, width=2)
+
+    utilization = float(used)/(sw_px*sh_px) if (sw_px*sh_px)>0 else 0.0
+    return preview, best_placements, best_total, utilization, (sw_px, sh_px), dpi, scale_factor
+
+
+@register_strategy("raster")
+def raster_nest(job: Job):
+    """greedy_nest sobre o Job: máscara da textura, sem limite max_px (a escala é a do pedido)."""
+    mask = Image.fromarray((job.mask * 255).astype(np.uint8), mode="L")
+    found, _used, probes = parallel_raster_sweep(mask, job.sheet_w, job.sheet_h, job.gap, job.angles,
+                                                 deadline=job.deadline, workers=job.request.workers)
+    textures = {}
+    placements = []
+    piece_px = float(job.mask.sum())
+    for p in found:
+        ang = p["angle"]
+        if ang not in textures:
+            textures[ang] = job.tex.rotate(ang, expand=True)
+        placements.append(Placement(p["x_px"], p["y_px"], ang, p["w"], p["h"], textures[ang]))
+    area_total = float(job.sheet_w) * float(job.sheet_h)
+    util = (len(placements) * piece_px / area_total * 100.0) if area_total else 0.0
+    return placements, util, {"probes": probes}
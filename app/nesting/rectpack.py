@@ -0,0 +1,239 @@
+# app/nesting/rectpack.py — Peças retangulares: MaxRects e guilhotina com orientações mistas
+#
+# Para retângulos não é preciso raster nem NFP: cada peça é o seu retângulo (a textura) mais a folga.
+# - MaxRects: lista de retângulos livres maximais (sobrepostos); cada colocação parte os que interseta
+#   em até 4 e descarta os contidos noutros. Heurísticas BSSF/BLSF/BAF/BL.
+# - Guilhotina: retângulos livres disjuntos; cada colocação corta o livre em 2 com um corte de lado a
+#   lado, por isso o layout sai sempre com cortes retos de bordo a bordo (serra de painel).
+#   `NestRequest.guillotine` limita a estratégia a este modo.
+# - Grelhas uniformes (tudo a 0° ou tudo a 90°) entram como ponto de partida: nunca fica pior que
+#   utils.rect_pack_count.
+# Folga: cada peça ocupa (w + folga) × (h + folga) numa chapa de (W + folga) × (H + folga), o que dá
+# a folga entre peças sem a exigir nos bordos (como nos outros modos).
+# Todas as peças são iguais, por isso um retângulo livre onde a peça não cabe em nenhuma orientação
+# nunca mais serve e sai logo da lista (a lista fica pequena mesmo com milhares de peças).
+from __future__ import annotations
+from typing import List, Optional, Sequence, Tuple
+import time
+
+import numpy as np
+
+from app.nesting.core import Job, Piece, Placement, register_strategy, scale_piece
+
+try:
+    from shapely.geometry import Polygon
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+# a máscara (alpha) que preenche pelo menos isto da textura conta como retângulo (bordos antialiased,
+# cantos ligeiramente arredondados). Decide-se pela máscara e não pelo contorno simplificado: os vértices do
+# approxPolyDP andam 1–2 px ao lado e um retângulo limpo de 180×100 px ficava abaixo dos 0.97.
+RECT_FILL = 0.97
+
+MAXRECTS_RULES = ("bssf", "blsf", "baf", "bl")
+GUILLOTINE_FITS = ("baf", "bssf", "bl")
+GUILLOTINE_SPLITS = ("slas", "llas", "minas", "maxas")
+
+# (ângulo, largura, altura) das orientações possíveis, já com folga
+Orientation = Tuple[int, int, int]
+
+
+def is_rectangular(piece: Piece, fill: float = RECT_FILL, dpi: Optional[float] = None) -> bool:
+    """A peça é (quase) um retângulo alinhado com a textura? Peças exatas (SVG/DXF): área do polígono face à
+    sua bbox; as outras: fração opaca da textura, à escala `dpi` se for dada (a que o nesting vai usar)."""
+    if piece.exact and piece.polygon is not None and SHAPELY_OK:
+        outer = Polygon(piece.polygon.exterior) if hasattr(piece.polygon, "exterior") else piece.polygon.convex_hull
+        env = outer.envelope.area
+        return env > 0 and outer.area / env >= fill
+    tex = scale_piece(piece, dpi)[0] if dpi else piece.image.convert("RGBA")
+    alpha = np.array(tex.getchannel("A")) > 0
+    return alpha.size > 0 and alpha.mean() >= fill
+
+
+def _orientations(job: Job) -> List[Orientation]:
+    """0° e, se o pedido admite rodar a peça (qualquer ângulo além de 0/180), 90°."""
+    w, h = job.tex.size
+    g = job.gap
+    angs = {int(a) % 360 for a in job.angles} or {0}
+    out = [(180 if 0 not in angs and 180 in angs else 0, w + g, h + g)]
+    if w != h and any(a % 180 for a in angs):
+        out.append((270 if 90 not in angs and 270 in angs else 90, h + g, w + g))
+    return out
+
+
+# ---------------- Grelha uniforme ----------------
+def _grid(orients: Sequence[Orientation], BW: int, BH: int) -> List[Tuple[int, int, int]]:
+    best: List[Tuple[int, int, int]] = []
+    for ang, iw, ih in orients:
+        nx, ny = BW // iw, BH // ih
+        if nx * ny > len(best):
+            best = [(x * iw, y * ih, ang) for y in range(ny) for x in range(nx)]
+    return best
+
+
+# ---------------- MaxRects ----------------
+def _score(rule: str, free: np.ndarray, iw: int, ih: int):
+    """(chave primária, secundária) por retângulo livre; menor é melhor."""
+    lw = free[:, 2] - iw
+    lh = free[:, 3] - ih
+    if rule == "bssf":
+        return np.minimum(lw, lh), np.maximum(lw, lh)
+    if rule == "blsf":
+        return np.maximum(lw, lh), np.minimum(lw, lh)
+    if rule == "baf":
+        return free[:, 2] * free[:, 3] - iw * ih, np.minimum(lw, lh)
+    return free[:, 1] + ih, free[:, 0]          # bl: bordo inferior mais acima, depois mais à esquerda
+
+
+def _choose(rule: str, free: np.ndarray, orients: Sequence[Orientation]):
+    """Melhor (índice do livre, orientação) ou None se a peça já não cabe."""
+    best = None
+    for o, (_, iw, ih) in enumerate(orients):
+        fits = np.nonzero((free[:, 2] >= iw) & (free[:, 3] >= ih))[0]
+        if not len(fits):
+            continue
+        k1, k2 = _score(rule, free[fits], iw, ih)
+        i = np.lexsort((k2, k1))[0]
+        cand = (int(k1[i]), int(k2[i]), int(fits[i]), o)
+        if best is None or cand[:2] < best[:2]:
+            best = cand
+    return None if best is None else (best[2], best[3])
+
+
+def _usable(rects: np.ndarray, min_w: int, min_h: int) -> np.ndarray:
+    """Só os livres onde a peça ainda cabe nalguma orientação (min_w/min_h = lado menor/maior)."""
+    short = np.minimum(rects[:, 2], rects[:, 3])
+    long_ = np.maximum(rects[:, 2], rects[:, 3])
+    return rects[(short >= min_w) & (long_ >= min_h)]
+
+
+def _maxrects(rule: str, orients: Sequence[Orientation], BW: int, BH: int, deadline: float):
+    side_min = min(min(iw, ih) for _, iw, ih in orients)
+    side_max = min(max(iw, ih) for _, iw, ih in orients)
+    free = np.array([[0, 0, BW, BH]], dtype=np.int64)
+    placed: List[Tuple[int, int, int]] = []
+    while len(free):
+        if len(placed) % 256 == 255 and time.time() > deadline:
+            return None
+        pick = _choose(rule, free, orients)
+        if pick is None:
+            break
+        fi, o = pick
+        ang, iw, ih = orients[o]
+        px, py = int(free[fi, 0]), int(free[fi, 1])
+        placed.append((px, py, ang))
+
+        x, y, w, h = free[:, 0], free[:, 1], free[:, 2], free[:, 3]
+        hit = (x < px + iw) & (x + w > px) & (y < py + ih) & (y + h > py)
+        keep, cut = free[~hit], free[hit]
+        x, y, w, h = cut[:, 0], cut[:, 1], cut[:, 2], cut[:, 3]
+        right, bottom = np.full_like(x, px + iw), np.full_like(y, py + ih)
+        parts = [
+            np.stack([x, y, px - x, h], 1)[px > x],                                 # esquerda
+            np.stack([right, y, x + w - right, h], 1)[right < x + w],               # direita
+            np.stack([x, y, w, py - y], 1)[py > y],                                 # cima
+            np.stack([x, bottom, w, y + h - bottom], 1)[bottom < y + h],            # baixo
+        ]
+        new = _usable(np.concatenate(parts), side_min, side_max)
+        if len(new):
+            # um livre novo é parte de um antigo que foi cortado, por isso nunca contém um antigo que
+            # ficou; basta tirar os novos contidos noutro (antigo ou novo; nos iguais fica o primeiro)
+            allr = np.concatenate([keep, new])
+            nx, ny, nw, nh = (new[:, i:i + 1] for i in range(4))
+            ax, ay, aw, ah = (allr[None, :, i] for i in range(4))
+            inside = (ax <= nx) & (ay <= ny) & (ax + aw >= nx + nw) & (ay + ah >= ny + nh)
+            same = (ax == nx) & (ay == ny) & (aw == nw) & (ah == nh)
+            idx = np.arange(len(allr))[None, :]
+            me = (len(keep) + np.arange(len(new)))[:, None]
+            dominated = (inside & ~same).any(1) | (same & (idx < me)).any(1)
+            new = new[~dominated]
+        free = np.concatenate([keep, new]) if len(new) else keep
+    return placed
+
+
+# ---------------- Guilhotina ----------------
+def _split(rule: str, fx, fy, fw, fh, iw, ih) -> List[Tuple[int, int, int, int]]:
+    """Corta o livre (fx, fy, fw, fh) depois de pôr a peça no canto: em baixo + à direita."""
+    lw, lh = fw - iw, fh - ih
+    if rule == "slas":
+        horizontal = lw <= lh
+    elif rule == "llas":
+        horizontal = lw > lh
+    elif rule == "minas":
+        horizontal = iw * lh > lw * ih          # fica com o maior dos dois pedaços inteiro
+    else:
+        horizontal = iw * lh <= lw * ih
+    if horizontal:      # corte a toda a largura por baixo da peça
+        return [(fx, fy + ih, fw, lh), (fx + iw, fy, lw, ih)]
+    return [(fx + iw, fy, lw, fh), (fx, fy + ih, iw, lh)]
+
+
+def _guillotine(fit: str, split: str, orients: Sequence[Orientation], BW: int, BH: int, deadline: float):
+    side_min = min(min(iw, ih) for _, iw, ih in orients)
+    side_max = min(max(iw, ih) for _, iw, ih in orients)
+    free = np.array([[0, 0, BW, BH]], dtype=np.int64)
+    placed: List[Tuple[int, int, int]] = []
+    while len(free):
+        if len(placed) % 256 == 255 and time.time() > deadline:
+            return None
+        pick = _choose(fit, free, orients)
+        if pick is None:
+            break
+        fi, o = pick
+        ang, iw, ih = orients[o]
+        fx, fy, fw, fh = (int(v) for v in free[fi])
+        placed.append((fx, fy, ang))
+        new = np.array(_split(split, fx, fy, fw, fh, iw, ih), dtype=np.int64)
+        free = np.concatenate([np.delete(free, fi, 0), _usable(new, side_min, side_max)])
+    return placed
+
+
+# ---------------- Estratégia ----------------
+def _extent(placed, orients) -> int:
+    """Área da bbox ocupada (desempate: mais compacto deixa mais sobra)."""
+    size = {ang: (iw, ih) for ang, iw, ih in orients}
+    if not placed:
+        return 0
+    return max(x + size[a][0] for x, _, a in placed) * max(y + size[a][1] for _, y, a in placed)
+
+
+def pack_rects(job: Job, guillotine: bool = False):
+    """Melhor layout de retângulos iguais: (lista de (x, y, ângulo), nome do método, nº de corridas)."""
+    orients = _orientations(job)
+    BW, BH = job.sheet_w + job.gap, job.sheet_h + job.gap
+    runs = [("grid", lambda: _grid(orients, BW, BH))]
+    runs += [(f"guillotine-{f}-{s}", lambda f=f, s=s: _guillotine(f, s, orients, BW, BH, job.deadline))
+             for f in GUILLOTINE_FITS for s in GUILLOTINE_SPLITS]
+    if not guillotine:
+        runs += [(f"maxrects-{r}", lambda r=r: _maxrects(r, orients, BW, BH, job.deadline))
+                 for r in MAXRECTS_RULES]
+    size = {ang: (iw - job.gap, ih - job.gap) for ang, iw, ih in orients}
+    best, method, done = [], "grid", 0
+    for name, run in runs:
+        if done and job.expired():
+            break
+        placed = run()
+        if placed is None:
+            continue        # corrida cortada pelo prazo
+        done += 1
+        if (len(placed), -_extent(placed, orients)) > (len(best), -_extent(best, orients)):
+            best, method = placed, name
+        job.report([Placement(x, y, a, *size[a]) for x, y, a in best])
+    return best, method, done
+
+
+@register_strategy("rect")
+def rect_nest(job: Job):
+    """Peças retangulares: MaxRects/guilhotina com a peça a 0° e 90° misturadas."""
+    placed, method, runs = pack_rects(job, job.request.guillotine)
+    textures = {}
+    placements = []
+    for x, y, ang in sorted(placed, key=lambda p: (p[1], p[0])):   # de cima para baixo (ver planner)
+        if ang not in textures:
+            textures[ang] = job.tex.rotate(ang, expand=True)
+        tex = textures[ang]
+        placements.append(Placement(x, y, ang, tex.size[0], tex.size[1], tex))
+    area = float(job.mask.sum())
+    util = len(placements) * area / float(job.sheet_w * job.sheet_h) * 100.0
+    return placements, util, {"method": method, "runs": runs, "guillotine": job.request.guillotine}
@@ -0,0 +1,20 @@
+# app/nesting/render.py — Imagem final do layout com numeração
+from __future__ import annotations
+from typing import Iterable
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.nesting.core import Placement
+
+
+def render_layout(placements: Iterable[Placement], sheet_w: int, sheet_h: int) -> Image.Image:
+    canvas = Image.new("RGBA", (sheet_w, sheet_h), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(canvas)
+    font = ImageFont.load_default()
+    for idx, p in enumerate(placements, start=1):
+        if p.image is not None:
+            canvas.paste(p.image, (p.x, p.y), p.image)
+        else:
+            draw.rectangle([p.x, p.y, p.x + p.w - 1, p.y + p.h - 1], outline=(77, 166, 255), width=2)
+        draw.text((p.x + 5, p.y + 5), str(idx), fill=(255, 0, 0), font=font)
+    return canvas
@@ -0,0 +1,63 @@
+# app/nesting/spatial.py — Índice espacial incremental dos polígonos já colocados
+#
+# Grelha uniforme (hash por célula) sobre as caixas envolventes: o STRtree do Shapely 2 é imutável
+# e teria de ser reconstruído a cada peça. Com células do tamanho de uma peça, cada caixa cai em
+# ≤ 4 células, cada consulta lê ≤ 4 células e o custo não cresce com o nº de peças colocadas.
+# A geometria do candidato só é construída (e preparada) se alguma caixa vizinha se sobrepuser.
+from __future__ import annotations
+from collections import defaultdict
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+import shapely
+
+Bounds = Tuple[float, float, float, float]
+
+
+class PlacedIndex:
+    def __init__(self, cell: float):
+        self.cell = max(1.0, float(cell))
+        self._geoms: List[object] = []
+        self._bounds: List[Bounds] = []
+        self._cells = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._geoms)
+
+    def _keys(self, b: Bounds):
+        c = self.cell
+        for i in range(int(b[0] // c), int(b[2] // c) + 1):
+            for j in range(int(b[1] // c), int(b[3] // c) + 1):
+                yield i, j
+
+    def add(self, geom, bounds: Bounds = None):
+        b = tuple(bounds if bounds is not None else geom.bounds)
+        k = len(self._geoms)
+        self._geoms.append(geom)
+        self._bounds.append(b)
+        for key in self._keys(b):
+            self._cells[key].append(k)
+
+    def candidates(self, b: Bounds) -> List[int]:
+        """Peças cuja caixa toca a caixa `b` (inclui contacto, como `intersects`)."""
+        seen = set()
+        out = []
+        for key in self._keys(b):
+            for k in self._cells.get(key, ()):
+                if k in seen:
+                    continue
+                seen.add(k)
+                o = self._bounds[k]
+                if o[0] <= b[2] and b[0] <= o[2] and o[1] <= b[3] and b[1] <= o[3]:
+                    out.append(k)
+        return out
+
+    def intersects_any(self, bounds: Bounds, make_geom: Callable[[], object]) -> bool:
+        """Caixas primeiro; `make_geom()` só é chamado se houver candidatos para o teste exato."""
+        near = self.candidates(bounds)
+        if not near:
+            return False
+        geom = make_geom()
+        shapely.prepare(geom)
+        others: Sequence = np.asarray([self._geoms[k] for k in near], dtype=object)
+        return bool(np.any(shapely.intersects(geom, others)))
@@ -0,0 +1,181 @@
+# app/nesting/strategies.py — Estratégias de colocação (alinhamento ortogonal e Shapely)
+from __future__ import annotations
+
+from dataclasses import replace
+import random
+
+import numpy as np
+from PIL import Image
+
+from app.nesting.core import Job, Placement, register_strategy
+from app.nesting.occupancy import BitGrid, PackedMask
+from app.nesting.parallel import SharedArray, attach, resolve_workers, run_trials
+
+try:
+    import shapely
+    from shapely.affinity import rotate as shp_rotate, translate as shp_translate
+    from app.nesting.spatial import PlacedIndex
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+
+# ================== MODO 1: Alinhamento ortogonal (sem encaixe) ==================
+@register_strategy("orthogonal")
+def orthogonal_pack(job: Job):
+    """Coloca peças em linhas/colunas usando apenas 0/90/180/270, sem tentar encaixar recortes."""
+    tex, sheet_w, sheet_h, gap_px = job.tex, job.sheet_w, job.sheet_h, job.gap
+    rotated = [(ang, tex.rotate(ang, expand=True)) for ang in (0, 90, 180, 270)]
+    placements = []
+    y = 0
+    while y < sheet_h:
+        x = 0
+        linha_altura = 0
+        while x < sheet_w:
+            placed = False
+            for ang, t in rotated:
+                w, h = t.size
+                if x + w <= sheet_w and y + h <= sheet_h:
+                    placements.append(Placement(x, y, ang, w, h, t))
+                    x += w + gap_px
+                    linha_altura = max(linha_altura, h)
+                    placed = True
+                    break
+            if not placed:
+                # não cabe em x → salta para próxima linha
+                break
+        if linha_altura == 0:
+            break
+        y += linha_altura + gap_px
+
+    # % de aproveitamento aproximada por bbox da textura
+    area_total = sheet_w * sheet_h
+    area_peca = tex.size[0] * tex.size[1]
+    util = (len(placements) * area_peca / area_total * 100.0) if area_total else 0.0
+    return placements, util, {}
+
+
+# ================== MODO 2: Nesting Avançado (Shapely) ==================
+def candidate_positions(sheet_w, sheet_h, step, rng):
+    pts = [(x, y) for y in range(0, sheet_h, step) for x in range(0, sheet_w, step)]
+    rng.shuffle(pts)
+    return pts
+
+
+def shapely_trial(job: Job):
+    """
+    - Roda polígono no mesmo centro do bitmap, com ângulo NEGATIVO (coords shapely vs imagem).
+    - Mantém a ordem de 'angles' (se queres só 0/90/180/270, passa [0,90,180,270]).
+    - Verificação raster para zero sobreposição + verificação geométrica da folga (índice espacial).
+    """
+    if not SHAPELY_OK or job.poly is None:
+        raise RuntimeError("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+    tex_base, poly_base = job.tex, job.poly
+    sheet_w, sheet_h, gap_px = job.sheet_w, job.sheet_h, job.gap
+    max_trials = job.request.max_trials
+
+    W0, H0 = tex_base.size
+    center = (W0/2.0, H0/2.0)
+
+    angle_variants = []
+    cell = 1.0
+    for ang in job.angles:
+        tex_rot = tex_base.rotate(ang, expand=True)
+        w_rot, h_rot = tex_rot.size
+        # polígono no referencial do bitmap rodado (expand=True recentra a imagem)
+        poly_rot = shp_rotate(poly_base, -ang, origin=center, use_radians=False)
+        poly_rot_00 = shp_translate(poly_rot, xoff=(w_rot - W0) / 2.0, yoff=(h_rot - H0) / 2.0)
+        # a folga não depende da posição: buffer uma vez por ângulo e depois só translações
+        gap_rot_00 = poly_rot_00.buffer(gap_px, join_style=2)
+        gminx, gminy, gmaxx, gmaxy = gap_rot_00.bounds
+        cell = max(cell, gmaxx - gminx, gmaxy - gminy)
+        # máscara empacotada nas 8 posições de bit: o teste de colisão é um AND byte a byte
+        alpha = PackedMask(np.array(tex_rot.split()[-1]) > 0)
+        angle_variants.append((ang, tex_rot, poly_rot_00.area, gap_rot_00, (gminx, gminy, gmaxx, gmaxy),
+                               w_rot, h_rot, alpha))
+
+    occ = BitGrid(sheet_h, sheet_w)
+    placements = []
+    index = PlacedIndex(cell=cell)
+    occ_area = 0.0
+
+    base_step = max(2, min(W0, H0) // 6)
+    trials = 0
+    stuck = 0
+    area_total = float(sheet_w) * float(sheet_h)
+
+    for (cx, cy) in candidate_positions(sheet_w, sheet_h, base_step, job.rng):
+        if job.expired() or trials > max_trials:
+            break
+        placed = False
+        # TENTA ANGULOS NA ORDEM DADA (sem baralhar)
+        for ang, tex_rot, area, gap_rot_00, (gminx, gminy, gmaxx, gmaxy), w_rot, h_rot, alpha in angle_variants:
+            trials += 1
+            if cx + w_rot > sheet_w or cy + h_rot > sheet_h:
+                continue
+            # a chapa é um retângulo: caixa com folga dentro dela ⇔ polígono com folga contido nela
+            gb = (cx + gminx, cy + gminy, cx + gmaxx, cy + gmaxy)
+            if gb[0] < 0 or gb[1] < 0 or gb[2] > sheet_w or gb[3] > sheet_h:
+                continue
+            # sobreposição de píxeis primeiro: é o teste mais barato e o que mais rejeita numa chapa cheia
+            if occ.collides(alpha, cx, cy):
+                continue
+            # folga: só se translada o polígono quando há vizinhos cujas caixas se sobrepõem
+            offset = np.array([cx, cy], dtype=float)
+            if index.intersects_any(gb, lambda: shapely.transform(gap_rot_00, lambda c: c + offset)):
+                continue
+            # OK
+            occ.paint(alpha, cx, cy)
+            index.add(shapely.transform(gap_rot_00, lambda c: c + offset), gb)
+            placements.append(Placement(cx, cy, ang, w_rot, h_rot, tex_rot))
+            occ_area += area
+            placed = True
+            job.report(placements, occ_area / area_total * 100.0)
+            break
+        if placed:
+            stuck = 0
+        else:
+            stuck += 1
+            if stuck >= 3:
+                base_step = max(1, base_step // 2); stuck = 0
+
+    util = (occ_area / area_total * 100.0) if area_total else 0.0
+    return placements, util, {"trials": trials}
+
+
+def _shapely_task(tex_spec, poly_wkb, request, sheet_w, sheet_h, gap, angles, deadline, seed):
+    """Worker: um ensaio com a sua semente (as imagens não voltam; o pai reaplica as texturas)."""
+    job = Job(
+        request=request, tex=Image.fromarray(attach(tex_spec), mode="RGBA"), poly=shapely.from_wkb(poly_wkb),
+        sheet_w=sheet_w, sheet_h=sheet_h, gap=gap, angles=angles, deadline=deadline, rng=random.Random(seed),
+    )
+    placements, util, stats = shapely_trial(job)
+    return [replace(p, image=None) for p in placements], util, stats
+
+
+@register_strategy("shapely")
+def advanced_nest_shapely(job: Job):
+    """Um ensaio aleatório por worker (sementes seed, seed+1, …), todos com o mesmo prazo; fica o melhor."""
+    workers = resolve_workers(job.request.workers)
+    if workers <= 1 or not SHAPELY_OK or job.poly is None:
+        return shapely_trial(job)
+
+    base = job.request.seed if job.request.seed is not None else job.rng.randrange(2**31)
+    light = replace(job.request, piece=None)
+    with SharedArray(np.array(job.tex)) as shared:
+        args = [(shared.spec, shapely.to_wkb(job.poly), light, job.sheet_w, job.sheet_h, job.gap,
+                 job.angles, job.deadline, base + i) for i in range(workers)]
+        results = [r for r in run_trials(_shapely_task, args, job.deadline, workers) if r is not None]
+    if not results:
+        return [], 0.0, {"trials": 0, "runs": 0}
+
+    best_i = max(range(len(results)), key=lambda i: (len(results[i][0]), results[i][1], -i))
+    placements, util, stats = results[best_i]
+    textures = {}
+    for p in placements:
+        if p.angle not in textures:
+            textures[p.angle] = job.tex.rotate(p.angle, expand=True)
+        p.image = textures[p.angle]
+    stats = dict(stats, runs=len(results), seed=base + best_i,
+                 trials=sum(r[2].get("trials", 0) for r in results))
+    return placements, util, stats
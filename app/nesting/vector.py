@@ -0,0 +1,668 @@
+# app/nesting/vector.py — Peças vetoriais (SVG/DXF) lidas direto para polígonos Shapely, sem raster
+#
+#   piece = piece_from_vector(open("peca.dxf", "rb").read(), "peca.dxf")      # tamanho do ficheiro
+#   piece = piece_from_vector(data, "peca.svg", width_cm=12, height_cm=8)     # ou forçado
+#
+# - Curvas (Bézier, arcos, bulges, elipses, splines) viram segmentos com desvio ≤ `tol_cm` da curva.
+# - Unidades: SVG pelo width/height com unidades + viewBox (sem unidades = px CSS, 96 por polegada);
+#   DXF pelo $INSUNITS (sem unidades = mm). O y sai para baixo, como nas imagens (o DXF é espelhado).
+# - Laços fechados: o de maior área é o contorno da peça; os que ficam dentro dele (furos, gravações)
+#   entram como anéis interiores, que a textura desenha como linhas. Troços abertos que se tocam nas
+#   pontas (LINE + ARC de um DXF, paths partidos) são encadeados em laços.
+# - Ignorado: texto, cotas, hatch, blocos (INSERT/<use>) e o que está em <defs>; DXF binário.
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+import math
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from app.nesting.core import Piece, polygon_texture
+
+try:
+    import shapely
+    from shapely.affinity import scale as shp_scale, translate as shp_translate
+    from shapely.geometry import Polygon
+    SHAPELY_OK = True
+except Exception:
+    SHAPELY_OK = False
+
+VECTOR_SUFFIXES = (".svg", ".dxf")
+# desvio máximo entre a curva e os segmentos (0,05 mm)
+FLATTEN_TOL_CM = 0.005
+# lado maior da imagem de origem da peça (pré-visualização; o nesting redesenha-a à escala pedida)
+SOURCE_MAX_PX = 1000
+
+SVG_UNITS_CM = {"px": 2.54 / 96, "pt": 2.54 / 72, "pc": 2.54 / 6, "in": 2.54,
+                "mm": 0.1, "cm": 1.0, "m": 100.0, "q": 0.025}
+# $INSUNITS → cm (0 = sem unidades, lido como mm)
+DXF_UNITS_CM = {0: 0.1, 1: 2.54, 2: 30.48, 4: 0.1, 5: 1.0, 6: 100.0, 9: 0.00254, 10: 91.44,
+                13: 1e-4, 14: 10.0}
+
+Point = Tuple[float, float]
+# (pontos, fechado?)
+Path = Tuple[List[Point], bool]
+
+
+@dataclass
+class VectorOutline:
+    """Contorno lido de um ficheiro vetorial: polígono em cm com o canto da bbox em (0, 0)."""
+    polygon: object
+    width_cm: float
+    height_cm: float
+    dropped: int = 0            # laços fechados fora do contorno maior (outras peças no mesmo ficheiro)
+
+    def piece(self, width_cm: Optional[float] = None, height_cm: Optional[float] = None, name: str = "") -> Piece:
+        """Piece exata; sem tamanho dado fica com o do ficheiro."""
+        k = SOURCE_MAX_PX / max(self.width_cm, self.height_cm)
+        size = (max(1, round(self.width_cm * k)), max(1, round(self.height_cm * k)))
+        poly = shp_scale(self.polygon, xfact=size[0] / self.width_cm, yfact=size[1] / self.height_cm, origin=(0, 0))
+        return Piece(image=polygon_texture(poly, size), polygon=poly,
+                     width_cm=float(width_cm or self.width_cm), height_cm=float(height_cm or self.height_cm),
+                     name=name, exact=True)
+
+
+# ---------------- Curvas ----------------
+def _chord_dev(p: Point, a: Point, b: Point) -> float:
+    """Distância de p ao segmento a–b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    den = dx * dx + dy * dy
+    t = 0.0 if den == 0 else max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / den))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def flatten(fn: Callable[[float], Point], t0: float, t1: float, tol: float, start: int = 8) -> List[Point]:
+    """Pontos da curva fn(t) em ]t0, t1] com desvio ≤ tol: parte em `start` troços e subdivide cada um
+    enquanto um dos pontos a ¼, ½ e ¾ ficar longe da corda."""
+    out: List[Point] = []
+    ts = np.linspace(t0, t1, start + 1)
+    stack = []
+    for a, b in zip(ts[-2::-1], ts[:0:-1]):         # do fim para o início: a pilha sai por ordem
+        stack.append((float(a), fn(float(a)), float(b), fn(float(b)), 0))
+    while stack:
+        a, pa, b, pb, depth = stack.pop()
+        m = (a + b) / 2
+        pm = fn(m)
+        if depth < 14 and max(_chord_dev(pm, pa, pb), _chord_dev(fn((a + m) / 2), pa, pb),
+                              _chord_dev(fn((m + b) / 2), pa, pb)) > tol:
+            stack.append((m, pm, b, pb, depth + 1))
+            stack.append((a, pa, m, pm, depth + 1))
+        else:
+            out.append(pb)
+    return out
+
+
+def _arc_fn(cx: float, cy: float, rx: float, ry: float, phi: float, a0: float, sweep: float):
+    cos_p, sin_p = math.cos(phi), math.sin(phi)
+
+    def fn(t: float) -> Point:
+        a = a0 + sweep * t
+        x, y = rx * math.cos(a), ry * math.sin(a)
+        return cx + x * cos_p - y * sin_p, cy + x * sin_p + y * cos_p
+    return fn
+
+
+def _arc_steps(sweep: float) -> int:
+    return max(2, int(math.ceil(abs(sweep) / (math.pi / 4))))
+
+
+def _bulge_arc(p0: Point, p1: Point, bulge: float, tol: float) -> List[Point]:
+    """Troço de polilinha DXF com bulge (tan(¼ do ângulo); > 0 = anti-horário): pontos depois de p0."""
+    d = math.hypot(p1[0] - p0[0], p1[1] - p0[1])
+    if bulge == 0 or d == 0:
+        return [p1]
+    theta = 4 * math.atan(bulge)
+    ux, uy = (p1[0] - p0[0]) / d, (p1[1] - p0[1]) / d
+    h = d / (2 * math.tan(theta / 2))               # do meio da corda ao centro, para a esquerda
+    cx, cy = (p0[0] + p1[0]) / 2 - uy * h, (p0[1] + p1[1]) / 2 + ux * h
+    r = math.hypot(p0[0] - cx, p0[1] - cy)
+    a0 = math.atan2(p0[1] - cy, p0[0] - cx)
+    pts = flatten(_arc_fn(cx, cy, r, r, 0.0, a0, theta), 0.0, 1.0, tol, _arc_steps(theta))
+    pts[-1] = p1
+    return pts
+
+
+def _bezier(points: Sequence[Point]):
+    if len(points) == 3:
+        (x0, y0), (x1, y1), (x2, y2) = points
+
+        def fn(t: float) -> Point:
+            u = 1 - t
+            return u * u * x0 + 2 * u * t * x1 + t * t * x2, u * u * y0 + 2 * u * t * y1 + t * t * y2
+        return fn
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = points
+
+    def fn(t: float) -> Point:
+        u = 1 - t
+        a, b, c, e = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+        return a * x0 + b * x1 + c * x2 + e * x3, a * y0 + b * y1 + c * y2 + e * y3
+    return fn
+
+
+# ---------------- SVG ----------------
+_TOKEN = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_SKIP_TAGS = {"defs", "clipPath", "mask", "symbol", "marker", "pattern", "metadata", "title", "desc",
+              "text", "style", "script", "use", "image"}
+# matriz afim SVG (a, b, c, d, e, f): x' = a·x + c·y + e, y' = b·x + d·y + f
+Matrix = Tuple[float, float, float, float, float, float]
+IDENTITY: Matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _mul(m: Matrix, n: Matrix) -> Matrix:
+    """m · n (n aplica-se primeiro)."""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2, a * c2 + c * d2, b * c2 + d * d2,
+            a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def _parse_transform(raw: str) -> Matrix:
+    m = IDENTITY
+    for name, args in _TRANSFORM.findall(raw or ""):
+        v = [float(x) for x in _NUMBER.findall(args)]
+        if name == "matrix" and len(v) == 6:
+            t = tuple(v)
+        elif name == "translate" and v:
+            t = (1.0, 0.0, 0.0, 1.0, v[0], v[1] if len(v) > 1 else 0.0)
+        elif name == "scale" and v:
+            t = (v[0], 0.0, 0.0, v[1] if len(v) > 1 else v[0], 0.0, 0.0)
+        elif name == "rotate" and v:
+            a = math.radians(v[0])
+            t = (math.cos(a), math.sin(a), -math.sin(a), math.cos(a), 0.0, 0.0)
+            if len(v) == 3:
+                t = _mul(_mul((1.0, 0.0, 0.0, 1.0, v[1], v[2]), t), (1.0, 0.0, 0.0, 1.0, -v[1], -v[2]))
+        elif name == "skewX" and v:
+            t = (1.0, 0.0, math.tan(math.radians(v[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and v:
+            t = (1.0, math.tan(math.radians(v[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        m = _mul(m, t)
+    return m
+
+
+def _norm(m: Matrix) -> float:
+    """Maior fator de escala da matriz (para passar a tolerância para coordenadas locais)."""
+    return float(np.linalg.norm([[m[0], m[2]], [m[1], m[3]]], 2)) or 1.0
+
+
+def _length(raw: Optional[str], default: float = 0.0) -> float:
+    found = _NUMBER.match((raw or "").strip())
+    return float(found.group()) if found else default
+
+
+class _Tokens:
+    def __init__(self, d: str):
+        self.toks = _TOKEN.findall(d)
+        self.i = 0
+
+    def more_numbers(self) -> bool:
+        return self.i < len(self.toks) and not self.toks[self.i].isalpha()
+
+    def num(self) -> float:
+        if not self.more_numbers():
+            raise ValueError("path SVG inválido: faltam coordenadas")
+        self.i += 1
+        return float(self.toks[self.i - 1])
+
+    def flag(self) -> bool:
+        """Flags dos arcos podem vir coladas ("a5 5 0 01 10 10"): consome só o primeiro dígito."""
+        if not self.more_numbers():
+            raise ValueError("path SVG inválido: faltam flags do arco")
+        tok = self.toks[self.i]
+        if len(tok) > 1 and tok[0] in "01":
+            self.toks[self.i] = tok[1:]
+        else:
+            self.i += 1
+        return tok[0] == "1"
+
+
+def _svg_arc(p0: Point, rx: float, ry: float, rot: float, large: bool, sweep: bool, p1: Point, tol: float):
+    """Arco elíptico SVG (parametrização pelos extremos, SVG 1.1 F.6.5): pontos depois de p0."""
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or p0 == p1:
+        return [p1]
+    phi = math.radians(rot)
+    cos_p, sin_p = math.cos(phi), math.sin(phi)
+    dx, dy = (p0[0] - p1[0]) / 2, (p0[1] - p1[1]) / 2
+    x1, y1 = cos_p * dx + sin_p * dy, -sin_p * dx + cos_p * dy
+    lam = (x1 / rx) ** 2 + (y1 / ry) ** 2
+    if lam > 1:
+        rx, ry = rx * math.sqrt(lam), ry * math.sqrt(lam)
+    num = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+    coef = math.sqrt(max(0.0, num) / (rx * rx * y1 * y1 + ry * ry * x1 * x1))
+    if large == sweep:
+        coef = -coef
+    cx1, cy1 = coef * rx * y1 / ry, -coef * ry * x1 / rx
+    cx = cos_p * cx1 - sin_p * cy1 + (p0[0] + p1[0]) / 2
+    cy = sin_p * cx1 + cos_p * cy1 + (p0[1] + p1[1]) / 2
+    a0 = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    a1 = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx)
+    da = a1 - a0
+    if sweep and da < 0:
+        da += 2 * math.pi
+    elif not sweep and da > 0:
+        da -= 2 * math.pi
+    pts = flatten(_arc_fn(cx, cy, rx, ry, phi, a0, da), 0.0, 1.0, tol, _arc_steps(da))
+    pts[-1] = p1
+    return pts
+
+
+def svg_path(d: str, tol: float) -> List[Path]:
+    """Subpaths de um atributo `d` (coordenadas do utilizador), curvas já em segmentos."""
+    tk = _Tokens(d)
+    paths: List[Path] = []
+    pts: List[Point] = []
+    cur = start = (0.0, 0.0)
+    ctrl: Optional[Point] = None       # último ponto de controlo (para S/T)
+    cmd = prev = ""
+
+    def finish(closed: bool):
+        nonlocal pts
+        if len(pts) > 1:
+            paths.append((pts, closed))
+        pts = []
+
+    while tk.i < len(tk.toks):
+        if tk.toks[tk.i].isalpha():
+            cmd = tk.toks[tk.i]
+            tk.i += 1
+        elif not cmd:
+            raise ValueError("path SVG inválido: começa sem comando")
+        elif cmd in "Mm":
+            cmd = "l" if cmd == "m" else "L"       # coordenadas a seguir a um M são L implícitos
+        rel = cmd.islower()
+        ox, oy = cur if rel else (0.0, 0.0)
+        c = cmd.upper()
+        if c == "Z":
+            if pts:
+                finish(True)
+            cur, ctrl, prev = start, None, "Z"
+            continue
+        if not pts:
+            pts = [cur]
+        if c == "M":
+            finish(False)
+            cur = start = (ox + tk.num(), oy + tk.num())
+            pts = [cur]
+            ctrl = None
+        elif c == "L":
+            cur = (ox + tk.num(), oy + tk.num())
+            pts.append(cur)
+            ctrl = None
+        elif c == "H":
+            cur = (ox + tk.num(), cur[1])
+            pts.append(cur)
+            ctrl = None
+        elif c == "V":
+            cur = (cur[0], oy + tk.num())
+            pts.append(cur)
+            ctrl = None
+        elif c in "CS":
+            if c == "C":
+                c1 = (ox + tk.num(), oy + tk.num())
+            else:
+                c1 = (2 * cur[0] - ctrl[0], 2 * cur[1] - ctrl[1]) if ctrl and prev in "CS" else cur
+            c2 = (ox + tk.num(), oy + tk.num())
+            end = (ox + tk.num(), oy + tk.num())
+            pts += flatten(_bezier([cur, c1, c2, end]), 0.0, 1.0, tol)
+            cur, ctrl = end, c2
+        elif c in "QT":
+            if c == "Q":
+                c1 = (ox + tk.num(), oy + tk.num())
+            else:
+                c1 = (2 * cur[0] - ctrl[0], 2 * cur[1] - ctrl[1]) if ctrl and prev in "QT" else cur
+            end = (ox + tk.num(), oy + tk.num())
+            pts += flatten(_bezier([cur, c1, end]), 0.0, 1.0, tol)
+            cur, ctrl = end, c1
+        elif c == "A":
+            rx, ry, rot = tk.num(), tk.num(), tk.num()
+            large, sweep = tk.flag(), tk.flag()
+            end = (ox + tk.num(), oy + tk.num())
+            pts += _svg_arc(cur, rx, ry, rot, large, sweep, end, tol)
+            cur, ctrl = end, None
+        else:
+            raise ValueError(f"path SVG inválido: comando {cmd!r}")
+        prev = c
+    finish(False)
+    return paths
+
+
+def _svg_element_path(tag: str, el) -> Optional[str]:
+    """Formas básicas como `d` equivalente (para passar pelo mesmo parser)."""
+    g = el.get
+    if tag == "path":
+        return g("d", "")
+    if tag == "rect":
+        x, y, w, h = _length(g("x")), _length(g("y")), _length(g("width")), _length(g("height"))
+        if w <= 0 or h <= 0:
+            return None
+        rx, ry = g("rx"), g("ry")
+        rx, ry = _length(rx if rx is not None else ry), _length(ry if ry is not None else rx)
+        rx, ry = min(rx, w / 2), min(ry, h / 2)
+        if rx <= 0 or ry <= 0:
+            return f"M{x},{y} H{x + w} V{y + h} H{x} Z"
+        return (f"M{x + rx},{y} H{x + w - rx} A{rx},{ry} 0 0 1 {x + w},{y + ry} V{y + h - ry} "
+                f"A{rx},{ry} 0 0 1 {x + w - rx},{y + h} H{x + rx} A{rx},{ry} 0 0 1 {x},{y + h - ry} "
+                f"V{y + ry} A{rx},{ry} 0 0 1 {x + rx},{y} Z")
+    if tag in ("circle", "ellipse"):
+        cx, cy = _length(g("cx")), _length(g("cy"))
+        rx = _length(g("r")) if tag == "circle" else _length(g("rx"))
+        ry = _length(g("r")) if tag == "circle" else _length(g("ry"))
+        if rx <= 0 or ry <= 0:
+            return None
+        return f"M{cx - rx},{cy} A{rx},{ry} 0 1 0 {cx + rx},{cy} A{rx},{ry} 0 1 0 {cx - rx},{cy} Z"
+    if tag == "line":
+        return f"M{_length(g('x1'))},{_length(g('y1'))} L{_length(g('x2'))},{_length(g('y2'))}"
+    if tag in ("polyline", "polygon"):
+        nums = _NUMBER.findall(g("points", ""))
+        if len(nums) < 4:
+            return None
+        return "M" + " ".join(nums) + (" Z" if tag == "polygon" else "")
+    return None
+
+
+def _svg_scale(root) -> float:
+    """cm por unidade do utilizador, pelo width/height da raiz e o viewBox."""
+    vb = [float(v) for v in _NUMBER.findall(root.get("viewBox", ""))]
+    for attr, i in (("width", 2), ("height", 3)):
+        raw = (root.get(attr) or "").strip().lower()
+        found = re.fullmatch(r"([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)\s*([a-z]*)", raw)
+        if not found or float(found.group(1)) <= 0:
+            continue
+        size_cm = float(found.group(1)) * SVG_UNITS_CM.get(found.group(2) or "px", SVG_UNITS_CM["px"])
+        if len(vb) == 4 and vb[i] > 0:
+            return size_cm / vb[i]
+        return SVG_UNITS_CM.get(found.group(2) or "px", SVG_UNITS_CM["px"])
+    return SVG_UNITS_CM["px"]
+
+
+def svg_paths(data: bytes, tol_cm: float) -> List[Path]:
+    """Todos os caminhos do SVG em cm (y para baixo)."""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as exc:
+        raise ValueError(f"SVG inválido: {exc}") from None
+    s = _svg_scale(root)
+    out: List[Path] = []
+
+    def walk(el, m: Matrix):
+        tag = el.tag.rsplit("}", 1)[-1]
+        if tag in _SKIP_TAGS or "display:none" in (el.get("style") or "").replace(" ", "") \
+                or el.get("display") == "none":
+            return
+        m = _mul(m, _parse_transform(el.get("transform")))
+        d = _svg_element_path(tag, el)
+        if d:
+            a, b, c, dd, e, f = m
+            for pts, closed in svg_path(d, tol_cm / _norm(m)):
+                out.append(([(a * x + c * y + e, b * x + dd * y + f) for x, y in pts], closed))
+        for child in el:
+            walk(child, m)
+
+    walk(root, (s, 0.0, 0.0, s, 0.0, 0.0))
+    return out
+
+
+# ---------------- DXF ----------------
+def _dxf_pairs(data: bytes) -> Iterator[Tuple[int, str]]:
+    if data.startswith(b"AutoCAD Binary DXF"):
+        raise ValueError("DXF binário não suportado: exporte em DXF ASCII.")
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    for i in range(0, len(lines) - 1, 2):
+        try:
+            code = int(lines[i].strip())
+        except ValueError:
+            raise ValueError(f"DXF inválido na linha {i + 1}") from None
+        yield code, lines[i + 1].strip()
+
+
+def _dxf_entities(data: bytes) -> Tuple[List[Tuple[str, List[Tuple[int, str]]]], int]:
+    """(entidades da secção ENTITIES como (tipo, [(código, valor)]), $INSUNITS)."""
+    units = 0
+    section = None
+    entities: List[Tuple[str, List[Tuple[int, str]]]] = []
+    var = None
+    expect_name = False
+    for code, value in _dxf_pairs(data):
+        if code == 0 and value == "SECTION":
+            expect_name = True
+            continue
+        if expect_name and code == 2:
+            section, expect_name = value, False
+            continue
+        if code == 0 and value == "ENDSEC":
+            section = None
+            continue
+        if section == "HEADER":
+            if code == 9:
+                var = value
+            elif var == "$INSUNITS" and code == 70:
+                units = int(value)
+        elif section == "ENTITIES":
+            if code == 0:
+                entities.append((value, []))
+            elif entities:
+                entities[-1][1].append((code, value))
+    return entities, units
+
+
+def _floats(tags, code: int) -> List[float]:
+    return [float(v) for c, v in tags if c == code]
+
+
+def _first(tags, code: int, default: float = 0.0) -> float:
+    for c, v in tags:
+        if c == code:
+            return float(v)
+    return default
+
+
+def _polyline(vertices: Sequence[Tuple[float, float, float]], closed: bool, tol: float) -> Optional[Path]:
+    """Vértices (x, y, bulge) de uma LWPOLYLINE/POLYLINE → pontos, com os arcos já em segmentos."""
+    if len(vertices) < 2:
+        return None
+    pts: List[Point] = [vertices[0][:2]]
+    n = len(vertices)
+    for i in range(n if closed else n - 1):
+        x0, y0, b = vertices[i]
+        x1, y1, _ = vertices[(i + 1) % n]
+        pts += _bulge_arc((x0, y0), (x1, y1), b, tol)
+    return pts, closed
+
+
+def _lwpolyline(tags, tol: float) -> Optional[Path]:
+    vertices: List[List[float]] = []
+    for c, v in tags:
+        if c == 10:
+            vertices.append([float(v), 0.0, 0.0])
+        elif c == 20 and vertices:
+            vertices[-1][1] = float(v)
+        elif c == 42 and vertices:
+            vertices[-1][2] = float(v)
+    return _polyline([tuple(v) for v in vertices], bool(int(_first(tags, 70)) & 1), tol)
+
+
+def _spline(tags, tol: float) -> Optional[Path]:
+    """B-spline (racional ou não) pelo algoritmo de De Boor; sem pontos de controlo usa os de ajuste."""
+    p = int(_first(tags, 71, 3))
+    knots = np.array(_floats(tags, 40))
+    ctrl = np.c_[_floats(tags, 10), _floats(tags, 20)] if _floats(tags, 10) else np.zeros((0, 2))
+    closed = bool(int(_first(tags, 70)) & 1)
+    if len(ctrl) <= p or len(knots) != len(ctrl) + p + 1:
+        fit = list(zip(_floats(tags, 11), _floats(tags, 21)))
+        return (fit, closed) if len(fit) > 1 else None
+    w = np.array(_floats(tags, 41)) if len(_floats(tags, 41)) == len(ctrl) else np.ones(len(ctrl))
+    hom = np.c_[ctrl * w[:, None], w]
+    n = len(ctrl)
+
+    def fn(t: float) -> Point:
+        k = min(max(int(np.searchsorted(knots, t, side="right")) - 1, p), n - 1)
+        d = [hom[j + k - p].copy() for j in range(p + 1)]
+        for r in range(1, p + 1):
+            for j in range(p, r - 1, -1):
+                den = knots[j + 1 + k - r] - knots[j + k - p]
+                a = 0.0 if den == 0 else (t - knots[j + k - p]) / den
+                d[j] = (1 - a) * d[j - 1] + a * d[j]
+        return float(d[p][0] / d[p][2]), float(d[p][1] / d[p][2])
+
+    spans = [float(t) for t in np.unique(knots[p:n + 1])]
+    pts: List[Point] = [fn(spans[0])]
+    for t0, t1 in zip(spans[:-1], spans[1:]):
+        pts += flatten(fn, t0, t1, tol, 4)
+    return pts, closed
+
+
+def _dxf_path(kind: str, tags, tol: float) -> Optional[Path]:
+    if kind == "LWPOLYLINE":
+        return _lwpolyline(tags, tol)
+    if kind == "LINE":
+        return [(_first(tags, 10), _first(tags, 20)), (_first(tags, 11), _first(tags, 21))], False
+    if kind in ("ARC", "CIRCLE"):
+        cx, cy, r = _first(tags, 10), _first(tags, 20), _first(tags, 40)
+        if r <= 0:
+            return None
+        a0 = math.radians(_first(tags, 50)) if kind == "ARC" else 0.0
+        sweep = (math.radians(_first(tags, 51)) - a0) % (2 * math.pi) if kind == "ARC" else 2 * math.pi
+        sweep = sweep or 2 * math.pi
+        fn = _arc_fn(cx, cy, r, r, 0.0, a0, sweep)
+        return [fn(0.0)] + flatten(fn, 0.0, 1.0, tol, _arc_steps(sweep)), kind == "CIRCLE"
+    if kind == "ELLIPSE":
+        cx, cy = _first(tags, 10), _first(tags, 20)
+        mx, my = _first(tags, 11), _first(tags, 21)
+        ratio = _first(tags, 40, 1.0)
+        t0, t1 = _first(tags, 41, 0.0), _first(tags, 42, 2 * math.pi)
+        sweep = (t1 - t0) % (2 * math.pi) or 2 * math.pi
+        rx = math.hypot(mx, my)
+        if rx == 0:
+            return None
+        fn = _arc_fn(cx, cy, rx, rx * ratio, math.atan2(my, mx), t0, sweep)
+        return [fn(0.0)] + flatten(fn, 0.0, 1.0, tol, _arc_steps(sweep)), abs(sweep - 2 * math.pi) < 1e-9
+    if kind == "SPLINE":
+        return _spline(tags, tol)
+    return None
+
+
+def dxf_paths(data: bytes, tol_cm: float) -> List[Path]:
+    """Todos os caminhos do DXF (entidades 2D da secção ENTITIES) em cm, com o y espelhado."""
+    entities, units = _dxf_entities(data)
+    k = DXF_UNITS_CM.get(units, DXF_UNITS_CM[0])
+    tol = tol_cm / k
+    raw: List[Path] = []
+    i = 0
+    while i < len(entities):
+        kind, tags = entities[i]
+        i += 1
+        if kind == "POLYLINE":
+            flags = int(_first(tags, 70))
+            vertices = []
+            while i < len(entities) and entities[i][0] == "VERTEX":
+                vt = entities[i][1]
+                if not int(_first(vt, 70)) & 16:          # 16 = ponto de controlo de spline ajustada
+                    vertices.append((_first(vt, 10), _first(vt, 20), _first(vt, 42)))
+                i += 1
+            if i < len(entities) and entities[i][0] == "SEQEND":
+                i += 1
+            path = None if flags & (16 | 64) else _polyline(vertices, bool(flags & 1), tol)   # malhas 3D fora
+        else:
+            path = _dxf_path(kind, tags, tol)
+        if path is not None:
+            raw.append(path)
+    return [([(x * k, -y * k) for x, y in pts], closed) for pts, closed in raw]
+
+
+# ---------------- Contorno ----------------
+def chain(paths: Sequence[Path], tol: float) -> List[List[Point]]:
+    """Laços fechados: os já fechados e os abertos encadeados pelas pontas (distância ≤ tol)."""
+    loops: List[List[Point]] = []
+    opened: List[List[Point]] = []
+    for pts, closed in paths:
+        if len(pts) < 2:
+            continue
+        if closed or math.dist(pts[0], pts[-1]) <= tol:
+            loops.append(list(pts))
+        else:
+            opened.append(list(pts))
+    while opened:
+        cur = opened.pop()
+        grown = True
+        while grown and math.dist(cur[0], cur[-1]) > tol:
+            grown = False
+            for j, other in enumerate(opened):
+                if math.dist(cur[-1], other[0]) <= tol:
+                    cur += other[1:]
+                elif math.dist(cur[-1], other[-1]) <= tol:
+                    cur += other[-2::-1]
+                elif math.dist(cur[0], other[-1]) <= tol:
+                    cur = other[:-1] + cur
+                elif math.dist(cur[0], other[0]) <= tol:
+                    cur = other[:0:-1] + cur
+                else:
+                    continue
+                opened.pop(j)
+                grown = True
+                break
+        if math.dist(cur[0], cur[-1]) <= tol:
+            loops.append(cur)
+    return loops
+
+
+def outline_from_paths(paths: Sequence[Path], tol_cm: float = FLATTEN_TOL_CM) -> Optional[VectorOutline]:
+    """Maior laço fechado como contorno (com os laços de dentro como anéis interiores); None se não há."""
+    if not SHAPELY_OK:
+        raise RuntimeError("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+    polys = []
+    for pts in chain(paths, tol_cm):
+        if len(pts) < 3:
+            continue
+        poly = Polygon(pts)
+        if not poly.is_valid:
+            poly = poly.buffer(0)           # laço que se cruza: fica com as partes
+        polys += [p for p in shapely.get_parts(poly) if p.area > tol_cm * tol_cm]
+    if not polys:
+        return None
+    polys.sort(key=lambda p: p.area, reverse=True)
+    shell = Polygon(polys[0].exterior)
+    inner = [p for p in polys[1:] if shell.contains(p)]
+    dropped = sum(1 for p in polys[1:] if not shell.intersects(p))
+    poly = Polygon(shell.exterior, [p.exterior for p in inner])
+    if not poly.is_valid:                   # anéis interiores que se tocam: une-os
+        cut = shell.difference(shapely.unary_union(inner))
+        poly = cut if cut.geom_type == "Polygon" else shell
+    minx, miny, maxx, maxy = poly.bounds
+    if maxx - minx <= 0 or maxy - miny <= 0:
+        return None
+    poly = shp_translate(poly, xoff=-minx, yoff=-miny)
+    return VectorOutline(poly, maxx - minx, maxy - miny, dropped)
+
+
+def is_vector(filename: str) -> bool:
+    return filename.lower().endswith(VECTOR_SUFFIXES)
+
+
+def load_vector(data: bytes, filename: str, tol_cm: float = FLATTEN_TOL_CM) -> Optional[VectorOutline]:
+    """Contorno de um SVG/DXF (pela extensão); None se não houver nenhum laço fechado."""
+    name = filename.lower()
+    if name.endswith(".svg"):
+        paths = svg_paths(data, tol_cm)
+    elif name.endswith(".dxf"):
+        paths = dxf_paths(data, tol_cm)
+    else:
+        raise ValueError(f"Formato vetorial não suportado: {filename} (use SVG ou DXF).")
+    return outline_from_paths(paths, tol_cm)
+
+
+def piece_from_vector(data: bytes, filename: str, width_cm: Optional[float] = None,
+                      height_cm: Optional[float] = None, name: str = "",
+                      tol_cm: float = FLATTEN_TOL_CM) -> Optional[Piece]:
+    """Piece exata a partir de um SVG/DXF (None se não houver contorno fechado).
+
+    Sem `width_cm`/`height_cm` fica com o tamanho do desenho nas unidades do ficheiro."""
+    outline = load_vector(data, filename, tol_cm)
+    if outline is None:
+        return None
+    return outline.piece(width_cm, height_cm, name)
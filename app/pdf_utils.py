@@ -7,11 +7,7 @@ from reportlab.platypus import Table, TableStyle
 from reportlab.lib.units import mm
 import os
 
-# Pequena ajuda para margens (se estiveres a usar)
-def price_with_tiered_margin(base_value: float, percent_uso: float, margins=None) -> float:
-    # Se tiveres a função “real” noutro sítio, remove esta e faz import de lá.
-    # Aqui deixo um passthrough para não partir nada.
-    return float(base_value or 0.0)
+from app.pricing import PricingParams, price_items
 
 def _get(o, name, default=None):
     # Lê atributo tanto em objetos SQLModel como em dicionários
@@ -19,7 +15,7 @@ def _get(o, name, default=None):
         return o.get(name, default)
     return getattr(o, name, default)
 
-def gerar_pdf_orcamento(cfg, quote, cliente, itens, *, incluir_logo=True) -> bytes:
+def gerar_pdf_orcamento(cfg, quote, cliente, itens, *, incluir_logo=True, snapshots=None) -> bytes:
     """
     Gera o PDF do cliente (layout unificado para Orçamentos e Planeamento).
     - Oculta coluna 'Desc.' se não houver descontos.
@@ -31,6 +27,7 @@ def gerar_pdf_orcamento(cfg, quote, cliente, itens, *, incluir_logo=True) -> byt
       quote: objeto Quote OU dicionário materializado
       cliente: objeto Client
       itens: lista de QuoteItem (objetos)
+      snapshots: PricingSnapshot dos itens (app.db.load_pricing_snapshots), para as linhas sem subtotal gravado
     """
     buf = BytesIO()
     c = canvas.Canvas(buf, pagesize=A4)
@@ -109,27 +106,21 @@ def gerar_pdf_orcamento(cfg, quote, cliente, itens, *, incluir_logo=True) -> byt
     header = ["Categoria","Nome","Código","Qtd","Un.","Total linha"] if not has_disc else ["Categoria","Nome","Código","Qtd","Un.","Desc.","Total linha"]
     data = [header]
 
-    uv_price = float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0)
+    # total por linha: motor de preços (o mesmo valor que aparece em Orçamentos)
+    lines = price_items(itens, PricingParams.from_settings(cfg), snapshots=snapshots)
     lang = (_get(quote,'lingua','PT') or 'PT').upper()
     subtotal = 0.0
 
-    for it in itens:
+    for it, tl in zip(itens, lines["line_client"]):
         nome_item = getattr(it,'nome_pt','') or ''
         if lang == 'EN' and (getattr(it,'nome_en','') or ''):
             nome_item = getattr(it,'nome_en')
         elif lang == 'FR' and (getattr(it,'nome_fr','') or ''):
             nome_item = getattr(it,'nome_fr')
 
-        if it.unidade == 'min':
-            part = float(getattr(it,'preco_unitario_cliente',0.0) or 0.0) * float(getattr(it,'quantidade',0.0) or 0.0)
-        else:
-            part = float(getattr(it,'preco_unitario_cliente',0.0) or 0.0) * (float(getattr(it,'percent_uso',0.0) or 0.0)/100.0) * float(getattr(it,'quantidade',0.0) or 0.0)
-
-        tl = max(0.0, part - float(getattr(it,'desconto_item',0.0) or 0.0))
-
+        tl = float(tl)
         tinta_ml = float(getattr(it,'ink_ml',0.0) or 0.0)
         if tinta_ml > 0:
-            tl += uv_price * tinta_ml
             nome_item = f"{nome_item} (Tinta UV: {tinta_ml:.1f} ml)"
 
         subtotal += tl
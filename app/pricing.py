@@ -0,0 +1,314 @@
+# app/pricing.py — Motor de preços vetorizado (NumPy/pandas)
+#
+# Regra única usada por Orçamentos, Planeamento, Arquivo, Análises, quote_totals e PDF:
+# - parte: preço un. cliente × %uso × qtd (ou preço × qtd se unidade == 'min')
+# - linha cliente: parte × (1 + margem por escalão de %uso) − desconto do item + tinta UV (ml × €/ml), nunca < 0
+#   (se o item tiver subtotal_cliente gravado, esse valor prevalece)
+# - custo material: preço de compra (snapshot) × %uso × qtd (materiais, unidade ≠ 'min')
+# - custo serviço: custo/min × min/un × qtd (× %uso se unidade ≠ 'min') + custo extra + fornecedor + tinta UV
+# Itens com pricing_snapshot_id usam as margens, o preço da tinta e o custo/min das máquinas desse snapshot
+# (parâmetros no momento em que foram adicionados); os restantes usam os parâmetros atuais.
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable, Optional
+import json
+
+import numpy as np
+import pandas as pd
+
+ITEM_COLUMNS = (
+    "id", "quote_id", "tipo_item", "ref_id", "unidade", "quantidade", "percent_uso",
+    "preco_unitario_cliente", "desconto_item", "ink_ml", "subtotal_cliente", "preco_compra_unitario",
+    "pricing_snapshot_id",
+)
+SERVICE_COLUMNS = ("custo_por_minuto", "minutos_por_unidade", "custo_extra", "custo_fornecedor")
+SERVICE_MACHINE_COLUMNS = ("machine_id", "machine_type")
+SNAPSHOT_COLUMNS = (
+    "margin_0_15", "margin_16_30", "margin_31_70", "margin_71_plus",
+    "uv_ink_price_eur_ml", "energy_cost_eur_kwh", "machines_json",
+)
+QUOTE_COLUMNS = ("desconto_total", "desconto_percent", "iva_percent")
+TOTAL_COLUMNS = (
+    "items_count", "items_subtotal", "discount", "net_subtotal", "vat", "total",
+    "material_cost", "service_cost", "ink_ml", "ink_cost", "profit",
+)
+
+
+@dataclass
+class PricingParams:
+    margin_0_15: float = 0.50
+    margin_16_30: float = 0.30
+    margin_31_70: float = 0.25
+    margin_71_plus: float = 0.0
+    uv_ink_price_eur_ml: float = 0.0
+
+    @classmethod
+    def from_settings(cls, cfg) -> "PricingParams":
+        if cfg is None:
+            return cls()
+        return cls(**{k: float(_get(cfg, k, 0.0) or 0.0) for k in cls.__dataclass_fields__})
+
+
+def _get(o, name, default=None):
+    # Lê atributo tanto em objetos SQLModel como em dicionários
+    if isinstance(o, dict):
+        return o.get(name, default)
+    return getattr(o, name, default)
+
+
+def _num(s: pd.Series, fill: Optional[float] = 0.0) -> np.ndarray:
+    a = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+    return a if fill is None else np.nan_to_num(a, nan=fill)
+
+
+# --- Construção dos frames ---
+def items_frame(items: Iterable) -> pd.DataFrame:
+    """QuoteItem (objetos, dicts ou tuplos na ordem de ITEM_COLUMNS) → DataFrame colunar."""
+    if isinstance(items, pd.DataFrame):
+        return items
+    rows = [tuple(it) if isinstance(it, (tuple, list)) else tuple(_get(it, c) for c in ITEM_COLUMNS)
+            for it in items]
+    return pd.DataFrame.from_records(rows, columns=list(ITEM_COLUMNS))
+
+
+def services_frame(services) -> pd.DataFrame:
+    """Service (lista de objetos, dict {id: obj} ou tuplos (id, *SERVICE_COLUMNS)) → DataFrame indexado por id.
+    Dos objetos vêm também machine_id/machine_type (custo/min das máquinas dos snapshots)."""
+    if isinstance(services, pd.DataFrame):
+        return services
+    if isinstance(services, dict):
+        services = services.values()
+    services = list(services or ())
+    if services and isinstance(services[0], (tuple, list)):
+        return pd.DataFrame.from_records([tuple(sv) for sv in services], columns=["id", *SERVICE_COLUMNS]).set_index("id")
+    cols = (*SERVICE_COLUMNS, *SERVICE_MACHINE_COLUMNS)
+    rows = [(_get(sv, "id"),) + tuple(_get(sv, c) for c in cols) for sv in services]
+    return pd.DataFrame.from_records(rows, columns=["id", *cols]).set_index("id")
+
+
+def snapshots_frame(snapshots) -> pd.DataFrame:
+    """PricingSnapshot (objetos ou tuplos (id, *SNAPSHOT_COLUMNS)) → DataFrame indexado por id."""
+    if isinstance(snapshots, pd.DataFrame):
+        return snapshots
+    rows = [tuple(sn) if isinstance(sn, (tuple, list)) else (_get(sn, "id"),) + tuple(_get(sn, c) for c in SNAPSHOT_COLUMNS)
+            for sn in (snapshots or ())]
+    return pd.DataFrame.from_records(rows, columns=["id", *SNAPSHOT_COLUMNS]).set_index("id")
+
+
+def quotes_frame(quotes) -> pd.DataFrame:
+    """Quote (objetos ou tuplos (id, *QUOTE_COLUMNS)) → DataFrame indexado por id."""
+    if isinstance(quotes, pd.DataFrame):
+        return quotes
+    rows = [tuple(q) if isinstance(q, (tuple, list)) else (_get(q, "id"),) + tuple(_get(q, c) for c in QUOTE_COLUMNS)
+            for q in quotes]
+    return pd.DataFrame.from_records(rows, columns=["id", *QUOTE_COLUMNS]).set_index("id")
+
+
+# --- Cálculo ---
+def _tiers(percent_uso, m0_15, m16_30, m31_70, m71_plus) -> np.ndarray:
+    pct = np.asarray(percent_uso, dtype=float)
+    return np.select([pct <= 15, pct <= 30, pct <= 70], [m0_15, m16_30, m31_70], m71_plus).astype(float)
+
+
+def margin_rate(percent_uso, params: PricingParams) -> np.ndarray:
+    """Margem por escalão (vetorizado); mesmo corte que utils.pick_margin."""
+    return _tiers(percent_uso, params.margin_0_15, params.margin_16_30, params.margin_31_70, params.margin_71_plus)
+
+
+def machine_cpm(machine, energy_cost_eur_kwh: float) -> float:
+    """(energia + desgaste) + lucro por minuto de uma máquina (objeto Machine ou dict de um snapshot)."""
+    try:
+        energia_min = float(_get(machine, "power_watts", 0.0) or 0.0) / 1000.0 / 60.0 * float(energy_cost_eur_kwh or 0.0)
+        base_min = energia_min + float(_get(machine, "wear_cost_eur_per_min", 0.0) or 0.0)
+        return max(0.0, base_min * (1.0 + float(_get(machine, "markup_percent", 0.0) or 0.0) / 100.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _machine_target(services: pd.DataFrame, cpm_by_id: dict, cpm_by_name: dict) -> pd.Series:
+    """Custo/min da máquina de cada serviço: primeiro machine_id, depois machine_type = nome; NaN se não houver."""
+    by_id = pd.to_numeric(services["machine_id"], errors="coerce").map(cpm_by_id)
+    by_name = services["machine_type"].astype(str).map(cpm_by_name)
+    target = pd.to_numeric(by_id.fillna(by_name), errors="coerce")
+    return target.where(target > 0)
+
+
+def _snapshot_cpm(snap_ids: np.ndarray, snapshots: pd.DataFrame, sv: pd.DataFrame) -> np.ndarray:
+    """Custo/min por linha com as máquinas do snapshot do item (NaN sem snapshot ou sem máquina)."""
+    out = np.full(len(sv), np.nan)
+    for sid, row in snapshots.iterrows():
+        mask = snap_ids == sid
+        if not mask.any():
+            continue
+        try:
+            machines = json.loads(row["machines_json"] or "[]")
+        except (TypeError, ValueError):
+            continue
+        if not machines:
+            continue    # snapshots migrados do snapshot_json antigo não têm máquinas
+        cpm = {int(m["id"]): machine_cpm(m, row["energy_cost_eur_kwh"]) for m in machines if m.get("id") is not None}
+        by_name = {str(m.get("name")): machine_cpm(m, row["energy_cost_eur_kwh"]) for m in machines}
+        out[mask] = _machine_target(sv[mask], cpm, by_name).to_numpy(dtype=float)
+    return out
+
+
+def price_items(items, params: PricingParams, services=None, use_stored: bool = True,
+                snapshots=None) -> pd.DataFrame:
+    """Preço e custo por linha, numa só passagem.
+
+    Devolve o frame dos itens com as colunas: part, margin_rate, ink_eur, line_client_calc
+    (regra atual), line_client (subtotal gravado ou regra), material_cost, service_minutes,
+    service_cost, ink_cost, line_cost e line_margin (cliente − custo).
+    Com use_stored=False ignora subtotal_cliente (reprecificação com `params`).
+    `snapshots` (PricingSnapshot dos itens): quem tiver pricing_snapshot_id usa as margens, a tinta e o
+    custo/min das máquinas do seu snapshot em vez de `params`/custo atual do serviço.
+    """
+    df = items_frame(items).copy()
+    if df.empty:
+        for c in ("part", "margin_rate", "ink_eur", "line_client_calc", "line_client", "material_cost",
+                  "service_minutes", "service_cost", "ink_cost", "line_cost", "line_margin"):
+            df[c] = pd.Series(dtype=float)
+        return df
+
+    qty = _num(df["quantidade"])
+    pct = _num(df["percent_uso"])
+    preco = _num(df["preco_unitario_cliente"])
+    desc = _num(df["desconto_item"])
+    ink = _num(df["ink_ml"])
+    stored = _num(df["subtotal_cliente"], fill=None)
+    compra = _num(df["preco_compra_unitario"], fill=None)
+    tipo = df["tipo_item"].to_numpy(dtype=object)
+    is_min = df["unidade"].to_numpy(dtype=object) == "min"
+    is_mat = tipo == "MATERIAL"
+    is_srv = tipo == "SERVICO"
+
+    snap = snapshots_frame(snapshots) if snapshots is not None else None
+    if snap is not None and not snap.empty and "pricing_snapshot_id" in df:
+        snap_ids = _num(df["pricing_snapshot_id"], fill=None)
+        snap_rows = snap.reindex(snap_ids)
+    else:
+        snap = None
+
+    def param(name: str):
+        # valor do snapshot do item, se tiver; senão o atual
+        current = float(getattr(params, name))
+        if snap is None:
+            return current
+        v = _num(snap_rows[name], fill=None)
+        return np.where(np.isnan(v), current, v)
+
+    ink_price = param("uv_ink_price_eur_ml")
+    scale = np.where(is_min, 1.0, pct / 100.0)
+    part = preco * scale * qty
+    rate = _tiers(pct, param("margin_0_15"), param("margin_16_30"), param("margin_31_70"), param("margin_71_plus"))
+    ink_eur = np.where(ink > 0, ink * ink_price, 0.0)
+    calc = np.maximum(0.0, np.maximum(0.0, part) * (1.0 + rate) - desc + ink_eur)
+    client = np.where(np.isnan(stored) | (not use_stored), calc, np.maximum(0.0, stored))
+
+    mat_ok = is_mat & ~is_min & ~np.isnan(compra)
+    material_cost = np.where(mat_ok, np.nan_to_num(compra) * (pct / 100.0) * qty, 0.0)
+
+    svc = services_frame(services) if services is not None else services_frame(())
+    sv = svc.reindex(pd.to_numeric(df["ref_id"], errors="coerce"))
+    cpm = _num(sv["custo_por_minuto"])
+    if snap is not None and set(SERVICE_MACHINE_COLUMNS) <= set(sv.columns):
+        snap_cpm = _snapshot_cpm(snap_ids, snap, sv)
+        cpm = np.where(np.isnan(snap_cpm), cpm, snap_cpm)
+    minutos_un = _num(sv["minutos_por_unidade"])
+    extras = _num(sv["custo_extra"]) + _num(sv["custo_fornecedor"])
+    minutes = np.where(is_srv, minutos_un * qty * scale, 0.0)
+    ink_cost = ink * ink_price
+    service_cost = np.where(is_srv, cpm * minutes + extras + ink_cost, 0.0)
+
+    line_cost = material_cost + service_cost
+    df["part"] = part
+    df["margin_rate"] = rate
+    df["ink_eur"] = ink_eur
+    df["line_client_calc"] = calc
+    df["line_client"] = client
+    df["material_cost"] = material_cost
+    df["service_minutes"] = minutes
+    df["service_cost"] = service_cost
+    df["ink_cost"] = ink_cost
+    df["line_cost"] = line_cost
+    df["line_margin"] = client - line_cost
+    return df
+
+
+def quotes_summary(lines: pd.DataFrame, quotes, params: PricingParams) -> pd.DataFrame:
+    """Totais por orçamento (colunas TOTAL_COLUMNS), indexado por quote_id.
+
+    `lines` vem de price_items; `quotes` dá desconto/IVA por orçamento (orçamentos sem itens ficam a zero).
+    """
+    qf = quotes_frame(quotes)
+    g = lines.assign(_n=1.0).groupby("quote_id")[
+        ["_n", "line_client", "material_cost", "service_cost", "ink_ml", "ink_cost"]].sum()
+    g = g.reindex(qf.index).fillna(0.0)
+    sub = g["line_client"].to_numpy(float)
+    desc_pct = _num(qf["desconto_percent"], fill=None)
+    discount = np.where(np.isnan(desc_pct), _num(qf["desconto_total"]), sub * np.nan_to_num(desc_pct) / 100.0)
+    net = sub - discount
+    vat = net * _num(qf["iva_percent"]) / 100.0
+    mat = g["material_cost"].to_numpy(float)
+    srv = g["service_cost"].to_numpy(float)
+    ink_ml = _num(g["ink_ml"])
+    return pd.DataFrame({
+        "items_count": g["_n"].to_numpy(float).astype(int),
+        "items_subtotal": sub,
+        "discount": discount,
+        "net_subtotal": net,
+        "vat": vat,
+        "total": net + vat,
+        "material_cost": mat,
+        "service_cost": srv,
+        "ink_ml": ink_ml,
+        "ink_cost": _num(g["ink_cost"]),
+        "profit": np.maximum(0.0, net - (mat + srv)),
+    }, index=qf.index)
+
+
+def quote_summary(lines: pd.DataFrame, desconto_percent: Optional[float] = None, desconto_total: float = 0.0,
+                  iva_percent: float = 0.0, params: Optional[PricingParams] = None) -> dict:
+    """Totais de um único orçamento a partir das linhas já calculadas."""
+    qf = pd.DataFrame({"desconto_total": [desconto_total], "desconto_percent": [desconto_percent],
+                       "iva_percent": [iva_percent]}, index=pd.Index([0], name="id"))
+    one = lines.assign(quote_id=0) if not lines.empty else lines
+    row = quotes_summary(one, qf, params or PricingParams()).iloc[0]
+    return {k: (int(row[k]) if k == "items_count" else float(row[k])) for k in TOTAL_COLUMNS}
+
+
+# --- Simulação (what-if) ---
+def services_with_machine_cpm(services: pd.DataFrame, cpm_by_id: dict, cpm_by_name: dict) -> pd.DataFrame:
+    """Cópia de `services` (com colunas machine_id/machine_type) com custo_por_minuto vindo das máquinas.
+
+    Mesma regra de Parâmetros: primeiro machine_id, depois machine_type = nome da máquina; só valores > 0.
+    """
+    out = services.copy()
+    target = _machine_target(out, cpm_by_id, cpm_by_name)
+    ok = target.notna()
+    out.loc[ok, "custo_por_minuto"] = target[ok]
+    return out
+
+
+def simulate_quotes(items, quotes, services, base: PricingParams, candidate: PricingParams,
+                    candidate_services=None) -> pd.DataFrame:
+    """Reprecifica todas as linhas com os parâmetros atuais e os candidatos (duas passagens vetorizadas).
+
+    Devolve, por orçamento, receita s/IVA (após desconto global), custo e lucro antes/depois e os deltas.
+    Os subtotais gravados são ignorados nos dois lados, para o delta refletir só a mudança de parâmetros.
+    """
+    df = items_frame(items)
+    cand_services = services if candidate_services is None else candidate_services
+    a = quotes_summary(price_items(df, base, services, use_stored=False), quotes, base)
+    b = quotes_summary(price_items(df, candidate, cand_services, use_stored=False), quotes, candidate)
+    out = pd.DataFrame({
+        "revenue": a["net_subtotal"],
+        "revenue_new": b["net_subtotal"],
+        "cost": a["material_cost"] + a["service_cost"],
+        "cost_new": b["material_cost"] + b["service_cost"],
+    }, index=a.index)
+    out["profit"] = out["revenue"] - out["cost"]
+    out["profit_new"] = out["revenue_new"] - out["cost_new"]
+    for c in ("revenue", "cost", "profit"):
+        out[f"delta_{c}"] = out[f"{c}_new"] - out[c]
+    return out
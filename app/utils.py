@@ -63,79 +63,8 @@ def binarize_image(im: Image.Image, threshold: int = 200) -> Image.Image:
     mask = (arr < threshold).astype(np.uint8) * 255
     return Image.fromarray(mask, mode="L")
 
-# --- Greedy free-rotation nesting (angle sweep) ---
-def greedy_nest(mask: Image.Image, sheet_w_cm: float, sheet_h_cm: float, dpi: int, gap_cm: float, border_cm: float, angle_step: int = 10, max_px: int = 900):
-    # scale sheet
-    sw_eff_cm, sh_eff_cm = subtract_border_from_sheet(sheet_w_cm, sheet_h_cm, border_cm)
-    sw_px = max(1, int(sw_eff_cm * dpi))
-    sh_px = max(1, int(sh_eff_cm * dpi))
-    # limit resolution for performance
-    scale_factor = 1.0
-    if max(sw_px, sh_px) > max_px:
-        scale_factor = max_px / max(sw_px, sh_px)
-        sw_px = int(sw_px * scale_factor); sh_px = int(sh_px * scale_factor)
-        dpi = int(dpi * scale_factor)
-
-    gap_px = max(0, int(gap_cm * dpi))
-
-    # bin canvas for occupancy
-    occ = np.zeros((sh_px, sw_px), dtype=np.uint8)
-
-    # normalize mask size by requested piece cm (caller must resize before)
-    placements = []
-    best_total = 0
-    best_snapshot = None
-
-    # Try angle sweep
-    for ang in range(0, 360, angle_step):
-        m = mask.rotate(ang, expand=True, fillcolor=0)
-        m_arr = np.array(m) // 255  # 0/1
-        mh, mw = m_arr.shape
-        count = 0
-        occ_copy = occ.copy()
-        placements_tmp = []
-        # step size: choose small stride for better fill vs speed
-        step = max(1, int(max(mw, mh) * 0.2))
-        for y in range(0, sh_px - mh + 1, step):
-            for x in range(0, sw_px - mw + 1, step):
-                # expand area by gap
-                x0 = max(0, x - gap_px); y0 = max(0, y - gap_px)
-                x1 = min(sw_px, x + mw + gap_px); y1 = min(sh_px, y + mh + gap_px)
-                # check collision in area
-                if np.any(occ_copy[y0:y1, x0:x1] != 0):
-                    continue
-                # place mask
-                slice_view = occ_copy[y:y+mh, x:x+mw]
-                if np.any(slice_view != 0):
-                    continue
-                # draw piece
-                slice_view[:] = slice_view | m_arr
-                # add gap border
-                if gap_px>0:
-                    occ_copy[y0:y1, x0:x1] = np.maximum(occ_copy[y0:y1, x0:x1], 1)
-                placements_tmp.append({"x_px": x, "y_px": y, "angle": ang, "w": mw, "h": mh})
-                count += 1
-        if count > best_total:
-            best_total = count
-            best_snapshot = occ_copy
-            best_placements = placements_tmp
-
-    if best_snapshot is None:
-        best_snapshot = occ
-        best_placements = []
-
-    # Create preview image (white background, colored pieces)
-    preview = Image.new("RGB", (sw_px, sh_px), "white")
-    # draw colored rectangles approximating placements (for speed)
-    draw = ImageDraw.Draw(preview)
-    rng_colors = [(255, 77, 77), (77, 166, 255), (77, 255, 166), (255, 166, 77), (180, 77, 255), (255, 226, 77)]
-    for i, p in enumerate(best_placements):
-        color = rng_colors[i % len(rng_colors)]
-        # draw bounding box; faster than pasting rotated alpha
-        draw.rectangle([p["x_px"], p["y_px"], p["x_px"]+p["w"]-1, p["y_px"]+p["h"]-1], outline=color, width=2)
-
-    utilization = float(best_snapshot.sum())/(sw_px*sh_px) if (sw_px*sh_px)>0 else 0.0
-    return preview, best_placements, best_total, utilization, (sw_px, sh_px), dpi, scale_factor
+# --- Greedy free-rotation nesting (angle sweep) — vive em app/nesting/raster.py ---
+from app.nesting.raster import greedy_nest  # noqa: E402,F401
 
 # ==========================
 # Inputs numéricos robustos
@@ -63,7 +63,9 @@ st.caption("Atalhos rápidos e visão geral do sistema.")
 try:
     from datetime import date, timedelta
     from sqlmodel import select
-    from app.db import get_session, Quote, Material
+    from app.db import get_session, ensure_schema, load_quote_totals, Quote, Material
+
+    ensure_schema()
 
     today = date.today()
     week_start = today - timedelta(days=today.weekday())  # segunda
@@ -92,7 +94,7 @@ try:
 
         entregas_semana = sum(1 for o in curso if _entrega_in_semana(o))
 
-        # € aprovados por receber (€): soma de (total_final - pago) quando estado == APROVADO
+        # € aprovados por receber (€): soma de (total - pago_valor) quando estado == APROVADO
         def _as_float(x):
             try:
                 return float(x or 0)
@@ -100,11 +102,18 @@ try:
                 return 0.0
 
         aprovados = [o for o in curso if getattr(o, "estado", "") == "APROVADO"]
+        # totais materializados (quote_totals) — sem recalcular itens
+        tot_map = load_quote_totals(s, [o.id for o in aprovados])
+
+        def _por_receber(o) -> float:
+            t = tot_map.get(o.id)
+            total_final = _as_float(t.total if t is not None else 0)
+            pago = _as_float(getattr(o, "pago_valor", 0))
+            return max(0.0, total_final - pago)
+
         por_receber = 0.0
         for o in aprovados:
-            total_final = _as_float(getattr(o, "total_final", getattr(o, "valor_total", 0)))
-            pago = _as_float(getattr(o, "pago", getattr(o, "valor_pago", 0)))
-            por_receber += max(0.0, total_final - pago)
+            por_receber += _por_receber(o)
 
         # € aprovados por faturar esta semana (aprovados cuja data_entrega_prevista está nesta semana)
         aprovados_faturar_semana = 0.0
@@ -115,9 +124,7 @@ try:
             except Exception:
                 d = None
             if (d is not None) and (week_start <= d <= week_end):
-                total_final = _as_float(getattr(o, "total_final", getattr(o, "valor_total", 0)))
-                pago = _as_float(getattr(o, "pago", getattr(o, "valor_pago", 0)))
-                aprovados_faturar_semana += max(0.0, total_final - pago)
+                aprovados_faturar_semana += _por_receber(o)
 
         # Orçamentos atrasados (entrega < hoje e não arquivado)
         def _is_atrasado(o) -> bool:
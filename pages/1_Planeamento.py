@@ -9,10 +9,10 @@ from app.utils import money_input
 
 
 from app.db import (
-    get_session, Quote, Client, QuoteItem, Settings,
-    upgrade_quotes_metrics, upgrade_quoteitem_snapshot,
-    upgrade_quote_stock_flag, upgrade_stock_movements_table, apply_stock_on_archive
+    get_session, get_settings, Quote, Client, QuoteItem, Service,
+    ensure_schema, apply_stock_on_archive, next_quote_number, load_quote_totals, load_pricing_snapshots
 )
+from app.pricing import PricingParams, price_items
 
 # helper para números (evita erros com strings tipo "€ 1.234,56")
 def to_float0(v):
@@ -33,118 +33,13 @@ def to_float0(v):
 
 
 
-# === Helpers de cálculo (alinhados com Orçamentos) ===
-def _uv_price(cfg):
-    try:
-        return float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0)
-    except Exception:
-        return 0.0
-
-# tenta obter um "mínimo eficaz" do item, considerando vários nomes possíveis
-_MIN_KEYS = (
-    'min_ef', 'min_eficaz', 'min_ef_total', 'minimo_eficaz', 'minimo_eficaz_total',
-    'min_eficacia', 'min_eficaz_eur', 'min_eficaz_valor'
-)
-
-
-def _get_minimo_eficaz(it):
-    for k in _MIN_KEYS:
-        if hasattr(it, k):
-            try:
-                v = getattr(it, k)
-                if v is not None:
-                    return float(v)
-            except Exception:
-                continue
-    return None
-
-# margem automática (procura em vários campos, item>settings)
-def _get_markup_percent(it, cfg):
-    # 1) margem definida no próprio item
-    for name in (
-        'margem_percent', 'markup_percent', 'margem', 'markup',
-        'client_markup_percent', 'client_margin_percent'
-    ):  # noqa: E231
-        if hasattr(it, name) and getattr(it, name) is not None:
-            try:
-                return float(getattr(it, name) or 0.0)
-            except Exception:
-                pass
-    # 2) regras por tipo
-    is_service = (getattr(it, 'unidade', '') == 'min')
-    cand = []
-    if is_service:
-        cand = [
-            'margem_servico_percent', 'markup_servico_percent', 'service_markup_percent',
-            'margem_servicos_percent', 'markup_servicos_percent'
-        ]
-    else:
-        cand = [
-            'margem_material_percent', 'markup_material_percent', 'material_markup_percent',
-            'margem_padrao_percent', 'markup_padrao_percent', 'default_markup_percent'
-        ]
-    for name in cand:
-        if cfg is not None and hasattr(cfg, name) and getattr(cfg, name) is not None:
-            try:
-                return float(getattr(cfg, name) or 0.0)
-            except Exception:
-                pass
-    return 0.0
-
-def item_total_cliente(it, cfg, lang="PT"):
-    """
-    Total do item para o cliente (mesma regra do PDF/Orçamentos):
-    - preço unitário × %uso × qtd (ou × minutos se unidade == 'min')
-    - – desconto por item
-    - + tinta UV (ml × preço/ml)
-    - aplica mínimo eficaz se existir
-    - aplica margem automática se necessário
-    - prefere subtotal gravado se existir
-    """
-    try:
-        # 0) se já existir um subtotal gravado no item, usa-o
-        for stored_name in ('subtotal_cliente', 'total_cliente', 'preco_total_cliente'):
-            if hasattr(it, stored_name) and getattr(it, stored_name) is not None:
-                return float(getattr(it, stored_name) or 0.0)
-
-        is_service = (getattr(it, 'unidade', '') == 'min')
-        uv     = _uv_price(cfg)
-        ink_ml = to_float0(getattr(it, 'ink_ml', 0.0))
-
-        if is_service:
-            # Serviços: preço do cliente = minutos * custo_interno_min * (1 + margem)  [+ tinta UV]
-            mins   = to_float0(getattr(it, 'minutos', getattr(it, 'quantidade', 0.0)))
-            cin_m  = getattr(it, 'custo_interno_min', None)
-            if cin_m is None:
-                cin_m = getattr(it, 'preco_servico_min', None)  # fallback
-            base_cost = to_float0(cin_m) * mins
-            markup_pct = _get_markup_percent(it, cfg)
-            total = base_cost * (1.0 + (markup_pct/100.0))
-        else:
-            # Materiais: preço unitário do cliente × %uso × qtd (já contém margem na maioria dos casos)
-            base = (
-                to_float0(getattr(it, 'preco_unitario_cliente', 0.0))
-                * (to_float0(getattr(it, 'percent_uso', 0.0)) / 100.0)
-                * to_float0(getattr(it, 'quantidade', 0.0))
-            )
-            # Se parecer um preço "de custo", aplica margem inferred
-            inferred = base
-            if inferred and inferred <= to_float0(getattr(it, 'preco_compra_unitario', getattr(it,'preco_compra_un', 0.0))) * to_float0(getattr(it,'quantidade',1.0)):
-                inferred *= (1.0 + (_get_markup_percent(it, cfg)/100.0))
-            total = inferred
-
-        # desconto
-        total = max(0.0, total - to_float0(getattr(it, 'desconto_item', 0.0)))
-        # tinta UV
-        if ink_ml > 0 and uv > 0:
-            total += uv * ink_ml
-        # mínimo eficaz
-        mef = _get_minimo_eficaz(it)
-        if mef is not None:
-            total = max(total, float(mef))
-        return float(total)
-    except Exception:
-        return 0.0
+# === Helpers de cálculo (motor de preços partilhado com Orçamentos/Arquivo/PDF) ===
+def quote_lines(s, quote_id):
+    """Itens do orçamento e respetivo preço/custo por linha (app.pricing)."""
+    itens = s.exec(select(QuoteItem).where(QuoteItem.quote_id == quote_id)).all()
+    srvs = s.exec(select(Service)).all()
+    return itens, price_items(itens, PricingParams.from_settings(get_settings()), srvs,
+                              snapshots=load_pricing_snapshots(s, itens))
 
 from app.pdf_utils import gerar_pdf_orcamento
 
@@ -161,11 +56,8 @@ except Exception:
 show_sidebar()
 
 st.title("🗂️ Planeamento — Orçamentos em curso")
-# garantir que as colunas novas existem (migracoes leves)
-upgrade_quotes_metrics()
-upgrade_quoteitem_snapshot()
-upgrade_quote_stock_flag()
-upgrade_stock_movements_table()
+# garantir que as colunas novas existem (migrações versionadas; no-op após a 1ª vez)
+ensure_schema()
 
 # ---------- helpers ----------
 STATES = ["RASCUNHO","ENVIADO","APROVADO","EM EXECUÇÃO","ENTREGUE","REJEITADO","EXPIRADO","ARQUIVADO"]
@@ -175,6 +67,10 @@ def fmt_dt(v):
     if isinstance(v, date):     return v.isoformat()
     return str(v or "")
 
+
+# totais materializados (quote_totals), carregados com a lista de orçamentos
+totals_cache = {}
+
 def get_total(o):
     src = o if isinstance(o, dict) else o.__dict__
     # 1) prefer valor final persistido (novo campo)
@@ -184,7 +80,11 @@ def get_total(o):
             return float(v or 0.0)
     except Exception:
         pass
-    # 2) variantes legadas
+    # 2) total calculado pelo motor de preços (quote_totals)
+    t = totals_cache.get(src.get('id'))
+    if t is not None:
+        return float(t.total or 0.0)
+    # 3) variantes legadas
     for fld in ("total", "valor_total", "total_final", "total_sem_iva", "total_final_eur"):
         try:
             val = src.get(fld) if isinstance(src, dict) else getattr(o, fld)
@@ -213,16 +113,8 @@ def ensure_number_if_needed(session, quote, new_state):
         return
     if getattr(quote, "numero", None):
         return
-    yy = datetime.utcnow().strftime("%y")
-    existentes = session.exec(select(Quote).where(Quote.numero.like(f"{yy}%"))).all()
-    last = 0
-    for q in existentes:
-        try:
-            if q.numero and len(q.numero) >= 6:
-                last = max(last, int(q.numero[2:]))
-        except Exception:
-            pass
-    quote.numero = f"{yy}{last+1:04d}"
+    # sequência por ano, reservada na mesma transação (ver app.db.next_quote_number)
+    quote.numero = next_quote_number(session)
 
 def validations_ready(o, total_val):
     """Return True only if ALL validation checkboxes exist AND are True,
@@ -271,6 +163,8 @@ with get_session() as s:
     except Exception:
         pass
 
+    totals_cache.update(load_quote_totals(s, [q.id for q in _rows]))
+
     # cache clientes (objetos ainda ligados à sessão, mas vamos só ler nome/número)
     clients_cache = {}
     for q in _rows:
@@ -415,33 +309,12 @@ with st.expander("🛠️ Reparar dados antigos (agregados e aprovação)"):
                         oo.approved_at = base_dt; changed = True
                     # custos e métricas se ARQUIVADO
                     if (getattr(oo, 'estado','') or '').upper() == 'ARQUIVADO':
-                        itens = sfix.exec(select(QuoteItem).where(QuoteItem.quote_id == oo.id)).all()
-                        # material
-                        mat_cost = 0.0
-                        for it in itens:
-                            if getattr(it,'unidade','') == 'min':
-                                continue
-                            unit_cost = getattr(it,'preco_compra_unitario', getattr(it,'preco_compra_un', None))
-                            if unit_cost is None:
-                                continue
-                            perc = to_float0(getattr(it,'percent_uso',0.0)) / 100.0
-                            qty  = to_float0(getattr(it,'quantidade',0.0))
-                            mat_cost += to_float0(unit_cost) * perc * qty
+                        # custos de material e serviços (motor de preços)
+                        _, lines_fix = quote_lines(sfix, oo.id)
+                        mat_cost = float(lines_fix["material_cost"].sum())
                         if getattr(oo,'total_material_cost_eur', None) is None and mat_cost > 0:
                             oo.total_material_cost_eur = float(mat_cost); changed = True
-                        # serviços
-                        srv_cost = 0.0
-                        for it in itens:
-                            if getattr(it,'unidade','') != 'min':
-                                continue
-                            mins = to_float0(getattr(it,'minutos', getattr(it,'quantidade',0.0)))
-                            unit_srv = getattr(it,'custo_interno_min', getattr(it,'preco_servico_min', None))
-                            if unit_srv is not None:
-                                srv_cost += to_float0(unit_srv) * mins
-                            else:
-                                cit = getattr(it, 'custo_interno_total', None)
-                                if cit is not None:
-                                    srv_cost += to_float0(cit)
+                        srv_cost = float(lines_fix["service_cost"].sum())
                         if getattr(oo,'total_service_internal_cost_eur', None) is None and srv_cost > 0:
                             oo.total_service_internal_cost_eur = float(srv_cost); changed = True
                         # consolidação
@@ -576,34 +449,33 @@ for o in fqs:
                 st.info("Não consegui mudar de página automaticamente. Vai à página 'Orçamentos' no menu; o orçamento já está selecionado.")
                 st.rerun()
         if ac2.button("🧾 Gerar PDF Cliente", key=f"pdf_{o['id']}"):
+            cfg = get_settings()
             with get_session() as spdf:
-                cfg = spdf.exec(select(Settings)).first()
                 cliente_full = clients_cache.get(o.get('cliente_id'))
                 itens = spdf.exec(select(QuoteItem).where(QuoteItem.quote_id == o['id'])).all()
-            pdf_bytes = gerar_pdf_orcamento(cfg, o, cliente_full, itens)
+                snapshots = load_pricing_snapshots(spdf, itens)
+            pdf_bytes = gerar_pdf_orcamento(cfg, o, cliente_full, itens, snapshots=snapshots)
             st.download_button("⬇️ Download PDF", data=pdf_bytes, file_name=f"orcamento_{o.get('numero') or 'rascunho'}.pdf", mime="application/pdf", key=f"dl_{o['id']}")
 
         st.markdown("---")
         st.markdown("**Itens do orçamento (consulta)**")
         with get_session() as s_it:
-            itens = s_it.exec(select(QuoteItem).where(QuoteItem.quote_id == o['id'])).all()
-            cfg = s_it.exec(select(Settings)).first()
+            itens, lines_it = quote_lines(s_it, o['id'])
         if not itens:
             st.info("Este orçamento ainda não tem itens.")
         else:
             rows_it = []
-            uv_price = _uv_price(cfg)
             lang = (o.get('lingua','PT') or 'PT').upper()
             total_estimado = 0.0
-            for it in itens:
+            for it, tl in zip(itens, lines_it["line_client"]):
                 # escolher nome pela língua
                 nome_item = getattr(it, 'nome_pt', '') or ''
                 if lang == 'EN' and (getattr(it,'nome_en', '') or ''):
                     nome_item = getattr(it, 'nome_en')
                 elif lang == 'FR' and (getattr(it,'nome_fr', '') or ''):
                     nome_item = getattr(it, 'nome_fr')
-                # subtotal alinhado com Orçamentos (mínimos + tinta UV)
-                tl = item_total_cliente(it, cfg, lang)
+                # subtotal da linha: motor de preços (igual a Orçamentos/PDF)
+                tl = float(tl)
                 tinta_ml = float(getattr(it,'ink_ml',0.0) or 0.0)  # mantemos a coluna informativa
                 total_estimado += tl
                 rows_it.append({
@@ -676,45 +548,11 @@ for o in fqs:
                     oo.final_total_eur = float(total_after or 0.0)
                     # Calcular custos: material + serviços internos
                     try:
-                        itens = s.exec(select(QuoteItem).where(QuoteItem.quote_id == oo.id)).all()
-                        # 1) Custo de material
-                        mat_cost = 0.0
-                        for it in itens:
-                            if getattr(it, 'unidade', '') == 'min':
-                                continue  # serviços não entram no custo de material
-                            unit_cost = getattr(it, 'preco_compra_unitario', None)
-                            if unit_cost is None:
-                                unit_cost = getattr(it, 'preco_compra_un', None)
-                            if unit_cost is None:
-                                continue
-                            perc = float(getattr(it, 'percent_uso', 0.0) or 0.0) / 100.0
-                            qty  = float(getattr(it, 'quantidade', 0.0) or 0.0)
-                            mat_cost += to_float0(unit_cost) * perc * qty
+                        # 1) Custo de material e 2) custo interno de serviços (motor de preços)
+                        _, lines_arch = quote_lines(s, oo.id)
+                        mat_cost = float(lines_arch["material_cost"].sum())
                         oo.total_material_cost_eur = (mat_cost if mat_cost > 0 else None)
-
-                        # 2) Custo interno de serviços (por minuto ou total)
-                        srv_cost = 0.0
-                        for it in itens:
-                            if getattr(it, 'unidade', '') != 'min':
-                                continue
-                            # minutos: alguns modelos guardam em `minutos`, noutros em `quantidade`
-                            mins = float(getattr(it, 'minutos', getattr(it, 'quantidade', 0.0)) or 0.0)
-                            # custo por minuto conhecido (preferências por campo)
-                            unit_srv = getattr(it, 'custo_interno_min', None)
-                            if unit_srv is None:
-                                unit_srv = getattr(it, 'preco_servico_min', None)
-                            if unit_srv is not None:
-                                srv_cost += to_float0(unit_srv) * mins
-                                continue
-                            # fallback: custo interno total diretamente no item, se existir
-                            cit = getattr(it, 'custo_interno_total', None)
-                            if cit is not None:
-                                srv_cost += to_float0(cit)
-                                continue
-                            # último fallback: usar preço de compra unitário como custo por minuto (pouco comum)
-                            unit_srv = getattr(it, 'preco_compra_unitario', getattr(it, 'preco_compra_un', None))
-                            if unit_srv is not None:
-                                srv_cost += to_float0(unit_srv) * mins
+                        srv_cost = float(lines_arch["service_cost"].sum())
                         oo.total_service_internal_cost_eur = (srv_cost if srv_cost > 0 else None)
 
                         # 3) Consolidação + métricas
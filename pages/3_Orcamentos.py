@@ -1,14 +1,14 @@
 import streamlit as st
 from sqlmodel import select
-from app.db import get_session, Quote, QuoteItem, Client, Material, Service, Settings
-from app.utils import Margins, price_with_tiered_margin, add_border_to_item, money_input
+from app.db import get_session, get_settings, ensure_schema, load_quote_totals, current_pricing_snapshot_id, load_pricing_snapshots, Quote, QuoteItem, Client, Material, Service
+from app.utils import add_border_to_item, money_input
+from app.pricing import PricingParams, price_items, quote_summary
 from datetime import datetime, date, timedelta
 from app.pdf_utils import gerar_pdf_orcamento
 
 import app.utils  # ativa patch global de number_input (vírgula/ponto; sem saltos)
 
 import os
-import json
 
 # Sidebar (import robusto)
 try:
@@ -27,15 +27,12 @@ show_sidebar()
 # =============================
 
 st.title("💼 Orçamentos")
+ensure_schema()
 
-# Carrega configurações e margens
-with get_session() as s:
-    cfg = s.exec(select(Settings)).first()
-    if not cfg:
-        st.warning("Defina os Parâmetros primeiro (margens, IVA).")
-        cfg = Settings(); s.add(cfg); s.commit(); s.refresh(cfg)
+# Carrega configurações e margens (snapshot em cache; invalidado quando Parâmetros grava)
+cfg = get_settings()
 
-margins = Margins(cfg.margin_0_15, cfg.margin_16_30, cfg.margin_31_70, cfg.margin_71_plus)
+pricing = PricingParams.from_settings(cfg)
 
 # Estado da sessão
 if 'current_quote_id' not in st.session_state:
@@ -238,25 +235,10 @@ else:
         st.rerun()
 # ===== Total ao vivo (topo) =====
 if st.session_state['current_quote_id']:
-    items_live = _load_items(st.session_state['current_quote_id'])
-    total_sem_iva = 0.0
-    for it in items_live:
-        # usar subtotal gravado se existir; caso contrário, calcular como antes
-        if getattr(it, 'subtotal_cliente', None) is not None:
-            val = float(it.subtotal_cliente)
-        else:
-            if it.unidade == "min":
-                part = it.preco_unitario_cliente * it.quantidade
-            else:
-                part = (it.preco_unitario_cliente * (it.percent_uso/100.0)) * it.quantidade
-            val = price_with_tiered_margin(part, it.percent_uso, margins) - (it.desconto_item or 0.0)
-            # adicionar tinta UV ao total do cliente quando aplicável (sem margem extra)
-            try:
-                if getattr(it, 'tipo_item', '') == 'SERVICO' and (getattr(it, 'ink_ml', 0.0) or 0.0) > 0:
-                    val += float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) * float(getattr(it, 'ink_ml', 0.0) or 0.0)
-            except Exception:
-                pass
-        total_sem_iva += max(0.0, val)
+    # soma das linhas mantida em quote_totals (atualizada a cada escrita de item)
+    with get_session() as s_tot:
+        _tot = load_quote_totals(s_tot, [st.session_state['current_quote_id']]).get(st.session_state['current_quote_id'])
+    total_sem_iva = float(_tot.items_subtotal) if _tot is not None else 0.0
     desconto_global_val = total_sem_iva * (desc_percent/100.0)
     subtotal = total_sem_iva - desconto_global_val
     iva = subtotal * (q.iva_percent/100.0) if st.session_state['current_quote_id'] else 0.0
@@ -338,43 +320,21 @@ if sel:
 
     # Preços base
     preco_unit = getattr(obj, 'preco_cliente_un', None) or getattr(obj, 'preco_cliente', 0.0)
-    # Pré-visualização preço cliente
-    part_val = (preco_unit*(percent_uso/100.0))*quantidade if unidade != 'min' else preco_unit*quantidade
-    preco_cliente_prev = price_with_tiered_margin(part_val, percent_uso, margins)
-    # adicionar custo de tinta UV ao subtotal do cliente (sem margem extra)
-    tinta_extra_preview = 0.0
-    if kind == 'SERVICO' and service_machine == 'UV':
-        try:
-            tinta_extra_preview = float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) * float(ink_ml_input or 0.0)
-        except Exception:
-            tinta_extra_preview = 0.0
-        preco_cliente_prev += tinta_extra_preview
+    # Pré-visualização (motor de preços: mesma regra da lista, do Planeamento e do PDF)
+    prev = price_items([{
+        "tipo_item": kind, "ref_id": obj.id, "unidade": unidade, "quantidade": quantidade,
+        "percent_uso": percent_uso, "preco_unitario_cliente": preco_unit, "desconto_item": 0.0,
+        "ink_ml": float(ink_ml_input or 0.0) if (kind == 'SERVICO' and service_machine == 'UV') else 0.0,
+        "preco_compra_unitario": float(getattr(obj, 'preco_compra_un', 0.0) or 0.0) if kind == "MATERIAL" else None,
+    }], pricing, [obj] if kind == "SERVICO" else None).iloc[0]
+    preco_cliente_prev = float(prev["line_client_calc"])
+    tinta_extra_preview = float(prev["ink_eur"])
     # Se a unidade for cm² e a área usada for 0, anula a pré-visualização do cliente
     if unidade == 'cm²' and ((largura_i * altura_i) <= 0):
         preco_cliente_prev = 0.0
-    # Custo real
-    if kind == "MATERIAL":
-        custo_real_prev = (float(obj.preco_compra_un) * (percent_uso/100.0)) * quantidade
-    else:
-        # custo interno do serviço: minutos_por_unidade × custo_por_minuto × quantidade (+ extras + tinta UV quando aplicável)
-        try:
-            minutos_un = float(getattr(obj, 'minutos_por_unidade', 0.0) or 0.0)
-        except Exception:
-            minutos_un = 0.0
-        try:
-            cpm = float(getattr(obj, 'custo_por_minuto', 0.0) or 0.0)
-        except Exception:
-            cpm = 0.0
-        scale = (percent_uso/100.0) if unidade != 'min' else 1.0
-        base = cpm * minutos_un * float(quantidade or 0.0) * float(scale)
-        tinta_line_prev = 0.0
-        try:
-            if service_machine == 'UV' and (ink_ml_input or 0.0) > 0:
-                tinta_line_prev = float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) * float(ink_ml_input or 0.0)
-        except Exception:
-            tinta_line_prev = 0.0
-        custo_real_prev = base + float(getattr(obj, 'custo_extra', 0.0) or 0.0) + float(getattr(obj, 'custo_fornecedor', 0.0) or 0.0) + tinta_line_prev
-        minutos_efetivos_prev = float(minutos_un) * float(quantidade or 0.0) * float(scale)
+    # Custo real (compra do material em uso, ou custo interno do serviço + extras + tinta UV)
+    custo_real_prev = float(prev["line_cost"])
+    minutos_efetivos_prev = float(prev["service_minutes"])
 
     # Pré-visualização detalhada de custos
     if unidade == 'cm²' and ((largura_i * altura_i) <= 0):
@@ -430,37 +390,11 @@ if sel:
             except Exception:
                 unit_cost_snapshot = None
 
-            # snapshot de contexto (margens, máquina, energia, tinta UV, IVA)
+            # snapshot de parâmetros (margens, máquinas, energia, tinta UV, IVA): referência partilhada
             try:
-                snap = {
-                    "ts": datetime.utcnow().isoformat(),
-                    "lingua": lingua,
-                    "cliente_id": getattr(cliente, 'id', None),
-                    "margins": {
-                        "0_15": float(getattr(cfg, 'margin_0_15', 0) or 0),
-                        "16_30": float(getattr(cfg, 'margin_16_30', 0) or 0),
-                        "31_70": float(getattr(cfg, 'margin_31_70', 0) or 0),
-                        "71_plus": float(getattr(cfg, 'margin_71_plus', 0) or 0),
-                    },
-                    "iva_percent": float(getattr(cfg, 'vat_rate', 0) or 0),
-                    "machine_type": service_machine,
-                    "uv_ink_price_eur_ml": float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0),
-                    # parâmetros de energia/desgaste, se existirem no Settings
-                    "laser": {
-                        "energia_eur_kwh": float(getattr(cfg, 'laser_energy_eur_kwh', 0.0) or 0.0),
-                        "desgaste_eur_min": float(getattr(cfg, 'laser_wear_eur_min', 0.0) or 0.0),
-                        "lucro_sobre_maquina_percent": float(getattr(cfg, 'laser_profit_over_machine_percent', 0.0) or 0.0),
-                    },
-                    "uv": {
-                        "energia_eur_kwh": float(getattr(cfg, 'uv_energy_eur_kwh', 0.0) or 0.0),
-                        "desgaste_eur_min": float(getattr(cfg, 'uv_wear_eur_min', 0.0) or 0.0),
-                        "lucro_sobre_maquina_percent": float(getattr(cfg, 'uv_profit_over_machine_percent', 0.0) or 0.0),
-                        "tinta_eur_ml": float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0),
-                    },
-                }
-                snapshot_json = json.dumps(snap)
+                pricing_snapshot_id = current_pricing_snapshot_id(s)
             except Exception:
-                snapshot_json = None
+                pricing_snapshot_id = None
 
             qi = QuoteItem(
                 quote_id=q.id,
@@ -480,7 +414,7 @@ if sel:
                 desconto_item=0.0,
                 ink_ml=float(ink_ml_input or 0.0),
                 preco_compra_unitario=unit_cost_snapshot,
-                snapshot_json=snapshot_json,
+                pricing_snapshot_id=pricing_snapshot_id,
             )
             # guardar o subtotal do cliente conforme pré-visualização
             try:
@@ -499,70 +433,34 @@ if st.session_state['current_quote_id']:
     # mapa de serviços para custos internos
     with get_session() as _s_srv:
         _all_srv = {sv.id: sv for sv in _s_srv.exec(select(Service)).all()}
+        _snapshots = load_pricing_snapshots(_s_srv, items)
     if not items:
         st.info("Ainda não há itens neste orçamento.")
     else:
+        # preço/custo de todas as linhas numa só passagem (motor de preços)
+        lines = price_items(items, pricing, _all_srv, snapshots=_snapshots).set_index("id", drop=False)
         # Agrupar
         grupos = {}
         for it in items:
             grupos.setdefault(it.categoria_item or "—", []).append(it)
 
-        total_sem_iva = 0.0
-        total_mat_cost = 0.0  # custo compra (uso) total
-        total_srv_cost = 0.0  # custo interno total de serviços
         q_live = _load_quote(st.session_state['current_quote_id'])
         for cat, lst in grupos.items():
             st.markdown(f"### {cat}")
             g_sub = 0.0
             g_mat = 0.0  # custo compra (uso) por categoria
             for it in lst:
-                # subtotal da linha (preferir subtotal_cliente gravado)
-                if getattr(it, 'subtotal_cliente', None) is not None:
-                    val = float(it.subtotal_cliente)
-                    tinta_extra_line = 0.0
-                else:
-                    if it.unidade == 'min':
-                        part = it.preco_unitario_cliente * it.quantidade
-                    else:
-                        part = (it.preco_unitario_cliente*(it.percent_uso/100.0)) * it.quantidade
-                    val = price_with_tiered_margin(part, it.percent_uso, margins) - (it.desconto_item or 0.0)
-                    # Tinta UV (sem margem adicional)
-                    tinta_extra_line = 0.0
-                    try:
-                        if (getattr(it, 'ink_ml', 0.0) or 0.0) > 0:
-                            tinta_extra_line = float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) * float(getattr(it, 'ink_ml', 0.0) or 0.0)
-                            val += tinta_extra_line
-                    except Exception:
-                        tinta_extra_line = 0.0
-                g_sub += max(0.0, val)
+                ln = lines.loc[it.id]
+                val = float(ln["line_client"])
+                g_sub += val
                 # custo interno do serviço (min/un × custo/min × qtd) + extras + tinta UV
-                service_internal_line = None
-                if getattr(it, 'tipo_item', '') == 'SERVICO':
-                    try:
-                        _sv = _all_srv.get(it.ref_id)
-                        minutos_un = float(getattr(_sv, 'minutos_por_unidade', 0.0) or 0.0) if _sv else 0.0
-                        cpm = float(getattr(_sv, 'custo_por_minuto', 0.0) or 0.0) if _sv else 0.0
-                        extra = float(getattr(_sv, 'custo_extra', 0.0) or 0.0) if _sv else 0.0
-                        fornec = float(getattr(_sv, 'custo_fornecedor', 0.0) or 0.0) if _sv else 0.0
-                        tinta_line = float(getattr(it, 'ink_ml', 0.0) or 0.0) * float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0)
-                        scale = (float(getattr(it,'percent_uso',0.0) or 0.0)/100.0) if getattr(it,'unidade','min') != 'min' else 1.0
-                        service_internal_line = (cpm * minutos_un * float(it.quantidade or 0.0) * float(scale)) + extra + fornec + tinta_line
-                        minutes_effective_line = float(minutos_un) * float(it.quantidade or 0.0) * float(scale)
-                        total_srv_cost += float(service_internal_line)
-                    except Exception:
-                        service_internal_line = None
-
+                service_internal_line = float(ln["service_cost"]) if getattr(it, 'tipo_item', '') == 'SERVICO' else None
+                minutes_effective_line = float(ln["service_minutes"])
                 # custo de compra da percentagem usada (apenas materiais)
                 custo_compra_uso_line = None
-                try:
-                    if (getattr(it, 'tipo_item', '') == 'MATERIAL') and (it.unidade != 'min'):
-                        unit_cost_snap = getattr(it, 'preco_compra_unitario', None)
-                        if unit_cost_snap is not None:
-                            custo_compra_uso_line = float(unit_cost_snap) * (float(it.percent_uso or 0.0)/100.0) * float(it.quantidade or 0.0)
-                except Exception:
-                    custo_compra_uso_line = None
-                if custo_compra_uso_line is not None:
-                    g_mat += float(custo_compra_uso_line)
+                if (getattr(it, 'tipo_item', '') == 'MATERIAL') and (it.unidade != 'min') and getattr(it, 'preco_compra_unitario', None) is not None:
+                    custo_compra_uso_line = float(ln["material_cost"])
+                    g_mat += custo_compra_uso_line
 
                 # edição inline apenas em RASCUNHO
                 if q_live and q_live.estado == 'RASCUNHO':
@@ -606,14 +504,7 @@ if st.session_state['current_quote_id']:
                             it.desconto_item = new_desc
                             # atualizar subtotal_cliente após edição
                             try:
-                                if it.unidade == 'min':
-                                    part = float(it.preco_unitario_cliente or 0.0) * float(new_qtd or 0.0)
-                                else:
-                                    part = float(it.preco_unitario_cliente or 0.0) * (float(new_pct or 0.0)/100.0) * float(new_qtd or 0.0)
-                                new_val = price_with_tiered_margin(part, float(new_pct or 0.0), margins) - float(new_desc or 0.0)
-                                if float(getattr(it, 'ink_ml', 0.0) or 0.0) > 0:
-                                    new_val += float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) * float(getattr(it, 'ink_ml', 0.0) or 0.0)
-                                it.subtotal_cliente = float(max(0.0, new_val))
+                                it.subtotal_cliente = float(price_items([it], pricing).iloc[0]["line_client_calc"])
                             except Exception:
                                 pass
                             s2.add(it); s2.commit()
@@ -640,18 +531,18 @@ if st.session_state['current_quote_id']:
                         f"{it.quantidade} × {it.unidade} | % uso: {it.percent_uso:.1f} | "
                         f"€ un: {it.preco_unitario_cliente:.2f} | Subtotal: €{val:.2f}{tinta_note}{extra_cost_txt}"
                     )
-            total_sem_iva += g_sub
             st.markdown(f"**Subtotal categoria:** €{g_sub:.2f}")
             if g_mat > 0:
                 st.caption(f"Custo compra (uso) da categoria: €{g_mat:.2f}")
-            total_sem_iva += 0.0  # no-op for clarity
-            total_mat_cost += g_mat
             st.divider()
 
-        desconto_global_val = total_sem_iva * (desc_percent/100.0)
-        subtotal = total_sem_iva - desconto_global_val
-        iva = subtotal * ((_load_quote(st.session_state['current_quote_id']).iva_percent)/100.0)
-        total_final = subtotal + iva
+        summary = quote_summary(lines, desconto_percent=desc_percent, iva_percent=q_live.iva_percent, params=pricing)
+        total_sem_iva = summary["items_subtotal"]
+        total_mat_cost = summary["material_cost"]
+        total_srv_cost = summary["service_cost"]
+        subtotal = summary["net_subtotal"]
+        iva = summary["vat"]
+        total_final = summary["total"]
         c1, c2, c3 = st.columns(3)
         c1.metric("Subtotal (€ s/IVA)", f"{subtotal:.2f}")
         c2.metric("IVA (€)", f"{iva:.2f}")
@@ -659,7 +550,7 @@ if st.session_state['current_quote_id']:
         c4, c5, c6 = st.columns(3)
         c4.metric("Custo compra (materiais) (€)", f"{total_mat_cost:.2f}")
         c5.metric("Custo interno (serviços) (€)", f"{total_srv_cost:.2f}")
-        c6.metric("Lucro estimado s/IVA (€)", f"{max(0.0, subtotal - (total_mat_cost + total_srv_cost)):.2f}")
+        c6.metric("Lucro estimado s/IVA (€)", f"{summary['profit']:.2f}")
 
         colf = st.columns([1,1,1,2])
         if colf[0].button("📦 Guardar rascunho e enviar para Planeamento"):
@@ -753,6 +644,7 @@ if st.session_state['current_quote_id']:
                         desconto_item=it.desconto_item,
                         ink_ml=getattr(it, 'ink_ml', 0.0),
                         preco_compra_unitario=getattr(it, 'preco_compra_unitario', None),
+                        pricing_snapshot_id=getattr(it, 'pricing_snapshot_id', None),
                         snapshot_json=getattr(it, 'snapshot_json', None),
                         subtotal_cliente=getattr(it, 'subtotal_cliente', None),
                     ))
@@ -768,7 +660,8 @@ if st.session_state['current_quote_id']:
                 q = s.get(Quote, st.session_state['current_quote_id'])
                 cli = s.get(Client, q.cliente_id)
                 items_all = s.exec(select(QuoteItem).where(QuoteItem.quote_id == q.id)).all()
-            pdf_bytes = gerar_pdf_orcamento(cfg, q, cli, items_all)
+                snapshots = load_pricing_snapshots(s, items_all)
+            pdf_bytes = gerar_pdf_orcamento(cfg, q, cli, items_all, snapshots=snapshots)
             st.download_button(
                 "⬇️ Download PDF",
                 data=pdf_bytes,
@@ -3,34 +3,13 @@ import io
 import pandas as pd
 import streamlit as st
 from sqlmodel import select
-from app.db import get_session, Service, Settings, Machine
+from app.db import get_session, get_settings, Service, Machine
 
-# Import opcional: coluna machine_type em Service
+# Import opcional: migrações versionadas (machine_type, minutos_por_unidade, unidade, observacoes)
 try:
-    from app.db import upgrade_services_machine_type  # type: ignore
+    from app.db import ensure_schema  # type: ignore
 except Exception:
-    def upgrade_services_machine_type():
-        return None
-
-# Import opcional: coluna minutos_por_unidade em Service
-try:
-    from app.db import upgrade_services_minutes  # type: ignore
-except Exception:
-    def upgrade_services_minutes():
-        return None
-
-# Import opcional: coluna unidade em Service
-try:
-    from app.db import upgrade_services_unidade  # type: ignore
-except Exception:
-    def upgrade_services_unidade():
-        return None
-
-# Import opcional: coluna observacoes em Service
-try:
-    from app.db import upgrade_services_observacoes  # type: ignore
-except Exception:
-    def upgrade_services_observacoes():
+    def ensure_schema():
         return None
 
 # Import opcional: helper para custo/min da máquina
@@ -91,16 +70,13 @@ def export_buttons(df: pd.DataFrame, base_filename: str = "servicos"):
 
 st.title("🛠️ Serviços")
 
-upgrade_services_machine_type()
-upgrade_services_minutes()
-upgrade_services_unidade()
-upgrade_services_observacoes()
+ensure_schema()
 
 tab1, tab2, tab3 = st.tabs(["Lista", "Adicionar", "Editar"])
 
 with get_session() as s:
     # === Recalcular custo/min a partir dos Parâmetros e sincronizar serviços (por tipo de máquina) ===
-    cfg = s.exec(select(Settings)).first()
+    cfg = get_settings()
 
     # --- Dynamic machines from Parâmetros ---
     machine_options = []
@@ -1,11 +1,11 @@
 import streamlit as st
 from sqlmodel import select
-from app.db import get_session, Material, Settings
-# Import opcional: migração leve para a tabela de materiais
+from app.db import get_session, get_settings, Material, StockRemnant, add_remnant
+# Import opcional: migrações versionadas do esquema
 try:
-    from app.db import upgrade_materials_table  # type: ignore
+    from app.db import ensure_schema  # type: ignore
 except Exception:
-    def upgrade_materials_table():
+    def ensure_schema():
         # no-op se não existir no app.db
         return None
 import pandas as pd
@@ -26,7 +26,7 @@ show_sidebar()
 
 # Garantir coluna de controlo (usar margens dos Parâmetros)
 try:
-    upgrade_materials_table()
+    ensure_schema()
 except Exception:
     pass
 
@@ -72,11 +72,11 @@ def export_buttons(df: pd.DataFrame, base_filename: str = "stock"):
 
 st.title("📦 Stock de Materiais")
 
-tab1, tab2, tab3 = st.tabs(["Lista", "Adicionar", "Editar"])
+tab1, tab2, tab3, tab4 = st.tabs(["Lista", "Adicionar", "Editar", "Sobras"])
 
 with get_session() as s:
     # === Recalcular preços ao público para materiais com margens padrão ===
-    cfg = s.exec(select(Settings)).first()
+    cfg = get_settings()
     if cfg:
         default_margin_full = float(getattr(cfg, 'margin_71_plus', 0.0) or 0.0)
         mats_all = s.exec(select(Material)).all()
@@ -166,17 +166,70 @@ with get_session() as s:
         observacoes = st.text_area("Observações", key="add_observacoes")
         last_by = st.text_input("Última alteração por", key="add_last_by")
         if st.button("➕ Adicionar", key="add_submit"):
-            m = Material(
-                code=code, nome_pt=nome_pt, nome_en=nome_en, nome_fr=nome_fr,
-                categoria=categoria, tipo=tipo,
-                largura_cm=float(largura), altura_cm=float(altura), unidade=unidade,
-                preco_compra_un=float(preco_compra), preco_cliente_un=float(preco_cliente),
-                use_param_margins=bool(use_param),
-                fornecedor=fornecedor, quantidade=float(qtd), qtd_minima=float(qtd_min),
-                observacoes=observacoes, last_modified_by=last_by,
-            )
-            s.add(m); s.commit()
-            st.success("Material criado.")
+            if code and s.exec(select(Material).where(Material.code == code)).first():
+                st.error(f"Já existe um material com o código '{code}'.")
+            else:
+                m = Material(
+                    code=code, nome_pt=nome_pt, nome_en=nome_en, nome_fr=nome_fr,
+                    categoria=categoria, tipo=tipo,
+                    largura_cm=float(largura), altura_cm=float(altura), unidade=unidade,
+                    preco_compra_un=float(preco_compra), preco_cliente_un=float(preco_cliente),
+                    use_param_margins=bool(use_param),
+                    fornecedor=fornecedor, quantidade=float(qtd), qtd_minima=float(qtd_min),
+                    observacoes=observacoes, last_modified_by=last_by,
+                )
+                s.add(m); s.commit()
+                st.success("Material criado.")
+
+    # ============ TAB 4 — SOBRAS ============
+    with tab4:
+        st.subheader("Sobras de chapa")
+        st.caption("Sobras registadas ao arquivar orçamentos (chapas usadas em parte) ou a partir do nesting. "
+                   "O nesting gasta-as antes de abrir chapas novas.")
+        codes = sorted({m.code for m in s.exec(select(Material).where(Material.tipo == "AREA")).all() if m.code})
+        f_code = st.selectbox("Material", ["(todos)"] + codes, key="sobras_material")
+        f_status = st.selectbox("Estado", ["DISPONIVEL", "USADA", "DESCARTADA"], key="sobras_estado")
+        q_rem = select(StockRemnant).where(StockRemnant.status == f_status)
+        if f_code != "(todos)":
+            q_rem = q_rem.where(StockRemnant.material_code == f_code)
+        rems = s.exec(q_rem.order_by(StockRemnant.material_code, StockRemnant.area_cm2)).all()
+        df_rem = pd.DataFrame([{
+            "ID": r.id, "Material": r.material_code, "Largura (cm)": r.largura_cm, "Altura (cm)": r.altura_cm,
+            "Área (cm²)": round(r.area_cm2, 1), "Localização": r.localizacao,
+            "Origem (orçamento)": r.origem_quote_id, "Criada": r.created_at,
+        } for r in rems])
+        if df_rem.empty:
+            st.info("Sem sobras com estes filtros.")
+        else:
+            st.dataframe(df_rem, use_container_width=True, hide_index=True)
+            export_buttons(df_rem, base_filename="sobras")
+            sel_rem = st.selectbox("Sobra", df_rem["ID"].tolist(), key="sobras_sel")
+            r_db = s.get(StockRemnant, sel_rem)
+            loc = st.text_input("Localização", value=(r_db.localizacao or ""), key=f"sobra_loc_{sel_rem}")
+            r1, r2 = st.columns(2)
+            if r1.button("💾 Guardar localização", key=f"sobra_save_{sel_rem}"):
+                r_db.localizacao = loc
+                s.add(r_db); s.commit()
+                st.success("Localização atualizada.")
+            if r_db.status == "DISPONIVEL" and r2.button("🗑️ Descartar sobra", key=f"sobra_del_{sel_rem}"):
+                r_db.status = "DESCARTADA"
+                s.add(r_db); s.commit()
+                st.success("Sobra descartada.")
+
+        with st.expander("Registar sobra à mão"):
+            n_code = st.selectbox("Material", codes, key="sobra_nova_material") if codes else None
+            n1, n2 = st.columns(2)
+            n_w = n1.number_input("Largura (cm)", min_value=0.0, value=0.0, key="sobra_nova_w")
+            n_h = n2.number_input("Altura (cm)", min_value=0.0, value=0.0, key="sobra_nova_h")
+            n_loc = st.text_input("Localização", key="sobra_nova_loc")
+            if st.button("➕ Registar sobra", key="sobra_nova_btn"):
+                if not n_code:
+                    st.warning("Não há materiais de área.")
+                elif add_remnant(s, n_code, n_w, n_h, localizacao=n_loc, note="manual") is None:
+                    st.warning("Sobra pequena demais para guardar.")
+                else:
+                    s.commit()
+                    st.success("Sobra registada.")
 
     # ============ TAB 3 — EDITAR ============
     with tab3:
@@ -235,8 +288,11 @@ with get_session() as s:
             c1, c2 = st.columns(2)
             if c1.button("💾 Guardar alterações", key=f"edit_save_{sel_id}"):
                 sel_db = s.get(Material, sel_id)
+                dup = s.exec(select(Material).where(Material.code == code, Material.id != sel_id)).first() if code else None
                 if not sel_db:
                     st.error("Não foi possível carregar o material selecionado.")
+                elif dup:
+                    st.error(f"Já existe outro material com o código '{code}'.")
                 else:
                     sel_db.code = code
                     sel_db.nome_pt = nome_pt
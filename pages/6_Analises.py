@@ -1,7 +1,6 @@
 import streamlit as st
 from sqlmodel import select
-from app.db import get_session, Quote, QuoteItem, Client, Material, Service, Settings
-from app.utils import Margins, price_with_tiered_margin
+from app.db import get_session, ensure_schema, load_quote_totals, Quote, Client
 import pandas as pd
 from datetime import datetime
 
@@ -18,26 +17,12 @@ except Exception:
 show_sidebar()
 
 st.title("📊 Análises")
+ensure_schema()
 
 with get_session() as s:
-    cfg = s.exec(select(Settings)).first()
-    if not cfg:
-        st.warning("Defina Parâmetros primeiro.")
-        cfg = Settings(); s.add(cfg); s.commit(); s.refresh(cfg)
-    margins = Margins(cfg.margin_0_15, cfg.margin_16_30, cfg.margin_31_70, cfg.margin_71_plus)
     qs = s.exec(select(Quote).order_by(Quote.data_criacao)).all()
-    items = s.exec(select(QuoteItem)).all()
-    # calcular totais por orçamento
-    totals = {}
-    for q in qs:
-        it = [i for i in items if i.quote_id==q.id]
-        tot = 0.0
-        for i in it:
-            part = (i.preco_unitario_cliente*(i.percent_uso/100.0))*i.quantidade
-            tot += max(0.0, price_with_tiered_margin(part, i.percent_uso, margins) - i.desconto_item)
-        tot -= q.desconto_total
-        tot += tot*(q.iva_percent/100.0)
-        totals[q.id] = tot
+    # totais por orçamento (materializados em quote_totals)
+    totals = {qid: t.total for qid, t in load_quote_totals(s).items()}
 
     # taxa de aprovação (aprovados / enviados)
     enviados = [q for q in qs if q.estado in ["ENVIADO","APROVADO","EM_PRODUCAO","ENTREGUE","ARQUIVADO"]]
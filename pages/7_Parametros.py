@@ -1,20 +1,13 @@
 import streamlit as st, os
+from dataclasses import replace
 from sqlmodel import select
-from app.db import get_session, Settings, Service, Machine, machine_cost_per_min, upgrade_quoteitems_ink_ml, upgrade_machines_table, seed_default_machines_from_settings, upgrade_services_machine_fk
+from app.db import get_session, get_settings, Settings, Service, Machine, machine_cost_per_min, ensure_schema, load_open_pipeline
+from app.pricing import PricingParams, services_with_machine_cpm, simulate_quotes
 # Import opcional: histórico (tabela)
 try:
-    from app.db import ServiceCostHistory, upgrade_service_cost_history_table  # type: ignore
+    from app.db import ServiceCostHistory  # type: ignore
 except Exception:
     ServiceCostHistory = None  # type: ignore
-    def upgrade_service_cost_history_table():
-        return None
-
-# Import opcional: coluna machine_type em Service
-try:
-    from app.db import upgrade_services_machine_type  # type: ignore
-except Exception:
-    def upgrade_services_machine_type():
-        return None
 
 # Sidebar (import robusto)
 try:
@@ -32,39 +25,9 @@ st.title("⚙️ Parâmetros")
 
 assets_dir = "assets"
 
-# Import opcional: migração leve da tabela Settings
-try:
-    from app.db import upgrade_settings_table  # type: ignore
-except Exception:
-    def upgrade_settings_table():
-        return None
-
-# Garantir que a tabela Settings tem as colunas novas
-try:
-    upgrade_settings_table()
-except Exception:
-    pass
-
-# Garantir que a tabela de histórico existe
-try:
-    upgrade_service_cost_history_table()
-except Exception:
-    pass
-
-# Garantir coluna machine_type em Service
-try:
-    upgrade_services_machine_type()
-except Exception:
-    pass
-
-try:
-    upgrade_quoteitems_ink_ml()
-except Exception:
-    pass
-
-# Garantir que as tabelas de máquinas estão prontas
+# Garantir esquema atualizado (colunas de Settings, histórico, máquinas, ink_ml)
 try:
-    upgrade_machines_table(); seed_default_machines_from_settings(); upgrade_services_machine_fk()
+    ensure_schema()
 except Exception:
     pass
 
@@ -271,8 +234,7 @@ with st.form("form_cfg"):
 st.markdown("---")
 st.header("🛠️ Máquinas")
 
-with get_session() as s_curr:
-    cfg_live = s_curr.exec(select(Settings)).first() or cfg
+cfg_live = get_settings()
 
 # Mini-calc helper with unique keys
 
@@ -479,3 +441,68 @@ else:
                                 pass
                             st.warning("Máquina apagada.")
                             st.rerun()
+
+# =====================
+# Simulador what-if (pipeline aberto)
+# =====================
+st.markdown("---")
+st.header("🧪 Simulador — margens e custo/min das máquinas")
+st.caption("Reprecifica todos os itens dos orçamentos não arquivados com os valores abaixo e compara com os parâmetros atuais. Nada é gravado.")
+
+items_df, quotes_df, services_df = load_open_pipeline()
+if items_df.empty:
+    st.info("Não há itens em orçamentos abertos para simular.")
+else:
+    base_params = PricingParams.from_settings(cfg_live)
+
+    st.markdown("#### Margens candidatas (%)")
+    sm1, sm2, sm3, sm4 = st.columns(4)
+    cand_margins = {}
+    for col, (fld, label) in zip((sm1, sm2, sm3, sm4), (
+        ("margin_0_15", "Até 15% (+)"), ("margin_16_30", "16–30% (+)"),
+        ("margin_31_70", "31–70% (+)"), ("margin_71_plus", "71%+ (+)"),
+    )):
+        cand_margins[fld] = col.slider(label, 0.0, 200.0, float(getattr(base_params, fld)) * 100.0, 0.5, key=f"sim_{fld}") / 100.0
+    cand_params = replace(base_params, **cand_margins)
+
+    # custo/min atual e candidato por máquina (potência/desgaste/lucro); a base usa o atual das máquinas,
+    # não o custo_por_minuto gravado no serviço, para o delta refletir só a mudança simulada
+    base_by_id, base_by_name = {}, {}
+    cpm_by_id, cpm_by_name = {}, {}
+    for m in machines:
+        base_by_id[m.id] = base_by_name[str(m.name)] = machine_cost_per_min(m, cfg_live)
+    if machines:
+        st.markdown("#### Máquinas candidatas")
+        for m in machines:
+            mc1, mc2, mc3, mc4 = st.columns(4)
+            sim_power = mc1.number_input(f"{m.name} — Potência (W)", min_value=0.0, value=float(m.power_watts or 0.0), step=50.0, key=f"sim_pw_{m.id}")
+            sim_wear = mc2.number_input(f"{m.name} — Desgaste (€/min)", min_value=0.0, value=float(m.wear_cost_eur_per_min or 0.0), step=0.01, format="%.4f", key=f"sim_wr_{m.id}")
+            sim_markup = mc3.number_input(f"{m.name} — Lucro (%)", min_value=0.0, max_value=1000.0, value=float(m.markup_percent or 0.0), step=1.0, key=f"sim_mk_{m.id}")
+            cpm_sim = machine_cost_per_min(Machine(power_watts=sim_power, wear_cost_eur_per_min=sim_wear, markup_percent=sim_markup), cfg_live)
+            mc4.metric("Custo/min (sim.)", f"{cpm_sim:.4f} €", delta=f"{cpm_sim - base_by_id[m.id]:+.4f} €")
+            cpm_by_id[m.id] = cpm_sim
+            cpm_by_name[str(m.name)] = cpm_sim
+    base_services = services_with_machine_cpm(services_df, base_by_id, base_by_name)
+    cand_services = services_with_machine_cpm(services_df, cpm_by_id, cpm_by_name)
+
+    sim = simulate_quotes(items_df, quotes_df, base_services, base_params, cand_params, cand_services)
+    tot = sim.sum()
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Receita s/IVA (€)", f"{tot['revenue_new']:.2f}", delta=f"{tot['delta_revenue']:+.2f}")
+    k2.metric("Custo (€)", f"{tot['cost_new']:.2f}", delta=f"{tot['delta_cost']:+.2f}", delta_color="inverse")
+    k3.metric("Lucro s/IVA (€)", f"{tot['profit_new']:.2f}", delta=f"{tot['delta_profit']:+.2f}")
+
+    view = sim.join(quotes_df[["numero", "estado"]])
+    view = view.reindex(view["delta_profit"].abs().sort_values(ascending=False).index)
+    st.dataframe(
+        view.reset_index().rename(columns={
+            "id": "ID", "numero": "Número", "estado": "Estado",
+            "revenue": "Receita atual", "revenue_new": "Receita sim.", "delta_revenue": "Δ Receita",
+            "cost": "Custo atual", "cost_new": "Custo sim.", "delta_cost": "Δ Custo",
+            "profit": "Lucro atual", "profit_new": "Lucro sim.", "delta_profit": "Δ Lucro",
+        })[["ID", "Número", "Estado", "Receita atual", "Receita sim.", "Δ Receita",
+            "Custo atual", "Custo sim.", "Δ Custo", "Lucro atual", "Lucro sim.", "Δ Lucro"]],
+        use_container_width=True,
+        hide_index=True,
+    )
+    st.caption(f"{len(items_df)} linhas em {len(quotes_df)} orçamentos abertos. Os subtotais gravados nos itens são ignorados nos dois cenários, para o delta refletir apenas a alteração de parâmetros.")
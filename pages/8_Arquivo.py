@@ -38,22 +38,24 @@ show_sidebar()
 # Importar modelos e utils da BD (NÃO redefinir modelos aqui)
 from app.db import (
     get_session,
+    get_settings,
     Quote,
     QuoteItem,
     QuoteVersion,
     Client,
-    Settings,
     StockMovement,
     Material,
-    upgrade_quotes_metrics,
+    ensure_schema,
+    load_pricing_snapshots,
 )
+from app.pricing import PricingParams, price_items
 from app.pdf_utils import gerar_pdf_orcamento
 
 st.title("📚 Arquivo de Orçamentos")
 
-# Garantir que as colunas novas existem (migração idempotente)
+# Garantir que as colunas novas existem (migrações versionadas)
 try:
-    upgrade_quotes_metrics()
+    ensure_schema()
 except Exception:
     pass
 
@@ -223,29 +225,25 @@ else:
 st.subheader("Itens do orçamento")
 with get_session() as s:
     itens = s.exec(select(QuoteItem).where(QuoteItem.quote_id == qsel.id)).all()
-    cfg = s.exec(select(Settings)).first()
+    snapshots = load_pricing_snapshots(s, itens)
+cfg = get_settings()
 
 if not itens:
     st.info("Este orçamento não tem itens guardados.")
 else:
     rows = []
-    uv_price = float(getattr(cfg, 'uv_ink_price_eur_ml', 0.0) or 0.0) if cfg else 0.0
+    # subtotal por linha: motor de preços (mesma regra de Orçamentos/Planeamento/PDF)
+    lines = price_items(itens, PricingParams.from_settings(cfg), snapshots=snapshots)
     lang = (getattr(qsel,'lingua','PT') or 'PT').upper()
     total_estimado = 0.0
-    for it in itens:
+    for it, tl in zip(itens, lines["line_client"]):
         nome_item = getattr(it,'nome_pt','') or ''
         if lang == 'EN' and (getattr(it,'nome_en','') or ''):
             nome_item = getattr(it,'nome_en')
         elif lang == 'FR' and (getattr(it,'nome_fr','') or ''):
             nome_item = getattr(it,'nome_fr')
-        if it.unidade == 'min':
-            part = float(getattr(it,'preco_unitario_cliente',0.0) or 0.0) * float(getattr(it,'quantidade',0.0) or 0.0)
-        else:
-            part = float(getattr(it,'preco_unitario_cliente',0.0) or 0.0) * (float(getattr(it,'percent_uso',0.0) or 0.0)/100.0) * float(getattr(it,'quantidade',0.0) or 0.0)
-        tl = max(0.0, part - float(getattr(it,'desconto_item',0.0) or 0.0))
+        tl = float(tl)
         tinta_ml = float(getattr(it,'ink_ml',0.0) or 0.0)
-        if tinta_ml > 0:
-            tl += uv_price * tinta_ml
         total_estimado += tl
         rows.append({
             "Categoria": getattr(it,'categoria_item','') or '',
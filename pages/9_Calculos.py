@@ -1,10 +1,6 @@
-import os, io, json, base64, time, math, random
-from math import ceil
+import os, json, base64, time, uuid
 from datetime import datetime
 
-import numpy as np
-import cv2
-from PIL import Image, ImageDraw, ImageFont
 import streamlit as st
 
 # Sidebar (import robusto)
@@ -19,16 +15,19 @@ except Exception:
     from app.sidebar import show_sidebar
 show_sidebar()
 
-# Shapely para o modo avançado
-try:
-    from shapely.geometry import Polygon, box
-    from shapely.affinity import rotate as shp_rotate, translate as shp_translate
-    from shapely.ops import unary_union
-    SHAPELY_OK = True
-except Exception:
-    SHAPELY_OK = False
+from app.nesting import NestRequest, Sheet, Piece, render_layout
+from app.nesting.cache import (detect_cached, vector_cached, nest_cached, plan_parts_cached, png_cached, request_key,
+                               parts_key, digest, cached_layout, cached_plan, with_textures, alternatives_key,
+                               cached_alternatives, plan_alternatives_cached)
+from app.nesting.vector import is_vector
+from app.nesting.jobs import get_runner, best_placements, DONE, ALIVE
+from app.db import DB_PATH, ensure_schema, get_session, find_remnants, add_remnant, consume_remnant
+from app.nesting import PartSpec, MultiNestRequest, Remnant
+from app.nesting.planner import plan_single, AlternativesRequest, sheet_options
+from app.nesting.core import SHAPELY_OK
 
 HISTORICO_PATH = "data/historico_calculos.json"
+ensure_schema()
 
 # ---------------- Histórico ----------------
 def carregar_historico():
@@ -41,157 +40,178 @@ def salvar_historico(h):
     with open(HISTORICO_PATH, "w", encoding="utf-8") as f:
         json.dump(h, f, ensure_ascii=False, indent=2)
 
-# ----- Detetar peça: textura + polígono em coords do recorte -----
-def detect_piece(image_rgba: Image.Image):
-    rgb = image_rgba.convert("RGB")
-    arr = np.array(rgb)
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    gray = cv2.GaussianBlur(gray, (3, 3), 0)
-    _, th = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
-    cnts, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not cnts:
-        return None, None, None, None
-    cnt = max(cnts, key=cv2.contourArea)
-    x, y, w, h = cv2.boundingRect(cnt)
-
-    cropped = image_rgba.crop((x, y, x + w, y + h)).convert("RGBA")
-    mask_full = np.zeros_like(th)
-    cv2.drawContours(mask_full, [cnt], -1, 255, -1)
-    mask_crop = Image.fromarray(mask_full).crop((x, y, x + w, y + h))
-    cropped.putalpha(mask_crop)
-
-    epsilon = 0.004 * cv2.arcLength(cnt, True)
-    approx = cv2.approxPolyDP(cnt, epsilon, True)
-    pts = [(int(p[0][0]-x), int(p[0][1]-y)) for p in approx]
-    if len(pts) < 3:
-        return None, None, None, None
-    poly = Polygon(pts)
-    if not poly.is_valid:
-        poly = poly.buffer(0)
-    return cropped, poly, (w, h), np.array(mask_crop) > 0
-
-# ----- Renderização final com numeração -----
-def render_layout(placements, sheet_w, sheet_h):
-    canvas = Image.new("RGBA", (sheet_w, sheet_h), (255, 255, 255, 255))
-    draw = ImageDraw.Draw(canvas)
-    font = ImageFont.load_default()
-    for idx, p in enumerate(placements, start=1):
-        canvas.paste(p["img"], (p["x"], p["y"]), p["img"])
-        draw.text((p["x"] + 5, p["y"] + 5), str(idx), fill=(255, 0, 0), font=font)
-    return canvas
-
-# ================== MODO 1: Alinhamento ortogonal (sem encaixe) ==================
-def orthogonal_pack(tex, sheet_w, sheet_h, gap_px):
-    """Coloca peças em linhas/colunas usando apenas 0/90/180/270, sem tentar encaixar recortes."""
-    angles = [0, 90, 180, 270]
-    placements = []
-    y = 0
-    while y < sheet_h:
-        x = 0
-        linha_altura = 0
-        while x < sheet_w:
-            placed = False
-            for ang in angles:
-                t = tex.rotate(ang, expand=True)
-                w, h = t.size
-                if x + w <= sheet_w and y + h <= sheet_h:
-                    placements.append({"x": x, "y": y, "img": t})
-                    x += w + gap_px
-                    linha_altura = max(linha_altura, h)
-                    placed = True
-                    break
-            if not placed:
-                # não cabe em x → salta para próxima linha
-                break
-        if linha_altura == 0:
-            break
-        y += linha_altura + gap_px
-
-    # % de aproveitamento aproximada por bbox da textura
-    area_total = sheet_w * sheet_h
-    area_peca = tex.size[0] * tex.size[1]
-    util = (len(placements) * area_peca / area_total * 100.0) if area_total else 0.0
-    return placements, util
-
-# ================== MODO 2: Nesting Avançado (Shapely) ==================
-def candidate_positions(sheet_w, sheet_h, step):
-    pts = [(x, y) for y in range(0, sheet_h, step) for x in range(0, sheet_w, step)]
-    random.shuffle(pts)
-    return pts
-
-def advanced_nest_shapely(tex_base, poly_base, sheet_w, sheet_h, gap_px, angs,
-                          time_limit_s=20, max_trials=60000):
-    """
-    - Roda polígono no mesmo centro do bitmap, com ângulo NEGATIVO (coords shapely vs imagem).
-    - Mantém a ordem de 'angs' (se queres só 0/90/180/270, passa [0,90,180,270]).
-    - Verificação geométrica (buffer folga) + verificação raster para zero sobreposição.
-    """
-    t0 = time.time()
-    sheet_poly = box(0, 0, sheet_w, sheet_h)
-
-    W0, H0 = tex_base.size
-    center = (W0/2.0, H0/2.0)
-
-    angle_variants = []
-    for ang in angs:
-        tex_rot = tex_base.rotate(ang, expand=True)
-        poly_rot = shp_rotate(poly_base, -ang, origin=center, use_radians=False)
-        minx, miny, maxx, maxy = poly_rot.bounds
-        poly_rot_00 = shp_translate(poly_rot, xoff=-minx, yoff=-miny)
-        w_rot = int(math.ceil(maxx - minx))
-        h_rot = int(math.ceil(maxy - miny))
-        alpha = np.array(tex_rot.split()[-1]) > 0
-        angle_variants.append((ang, tex_rot, poly_rot_00, w_rot, h_rot, alpha))
-
-    occ = np.zeros((sheet_h, sheet_w), dtype=np.uint8)
-    placements = []
-    union = None
-    occ_area = 0.0
-
-    base_step = max(2, min(W0, H0) // 6)
-    trials = 0
-    stuck = 0
-
-    for (cx, cy) in candidate_positions(sheet_w, sheet_h, base_step):
-        if time.time() - t0 > time_limit_s or trials > max_trials:
-            break
-        placed = False
-        # TENTA ANGULOS NA ORDEM DADA (sem baralhar)
-        for ang, tex_rot, poly_rot_00, w_rot, h_rot, alpha in angle_variants:
-            trials += 1
-            if cx + w_rot > sheet_w or cy + h_rot > sheet_h:
-                continue
-            placed_poly = shp_translate(poly_rot_00, xoff=cx, yoff=cy)
-            placed_with_gap = placed_poly.buffer(gap_px, join_style=2)
-            if union is not None and not placed_with_gap.disjoint(union):
-                continue
-            if not sheet_poly.contains(placed_with_gap):
-                continue
-            sub = occ[cy:cy+h_rot, cx:cx+w_rot]
-            if sub.shape != (h_rot, w_rot) or np.any(sub[alpha] != 0):
-                continue
-            # OK
-            sub[alpha] = 1
-            union = placed_with_gap if union is None else unary_union([union, placed_with_gap])
-            placements.append({"x": cx, "y": cy, "img": tex_rot})
-            occ_area += placed_poly.area
-            placed = True
-            break
-        if placed:
-            stuck = 0
+# ---------------- Peças carregadas ----------------
+TIPOS_PECA = ["png", "jpg", "jpeg", "svg", "dxf"]
+
+
+def carregar_peca(f):
+    """(textura, polígono, tamanho do desenho em cm ou None, exata) de um ficheiro carregado.
+    SVG/DXF: polígono lido do vetor (exato, com o tamanho do ficheiro); imagens: contorno detetado."""
+    if not is_vector(f.name):
+        tex, poly, _, _ = detect_cached(f.getvalue())
+        return tex, poly, None, False
+    try:
+        contorno = vector_cached(f.getvalue(), f.name)
+    except (ValueError, RuntimeError) as e:
+        st.error(f"{f.name}: {e}")
+        return None, None, None, True
+    if contorno is None:
+        return None, None, None, True
+    if contorno.dropped:
+        st.caption(f"{f.name}: {contorno.dropped} contorno(s) fora da peça principal ignorados.")
+    peca = contorno.piece()
+    return peca.image, peca.polygon, (contorno.width_cm, contorno.height_cm), True
+
+
+# ---------------- Jobs em segundo plano ----------------
+def resultado_em_fundo(kind, req, chave, pieces, sheet_px, slot="nest_slot"):
+    """Resultado da cache ou, se ainda não existir, um job em segundo plano acompanhado com reruns.
+    Enquanto corre mostra o progresso e o melhor layout até agora; devolve None se o job parou.
+    `slot` separa jobs da mesma sessão que correm lado a lado (p.ex. o plano com sobras)."""
+    ler, calcular = {"plan": (cached_plan, plan_parts_cached),
+                     "alternatives": (cached_alternatives, plan_alternatives_cached)}.get(kind, (cached_layout, nest_cached))
+    hit = ler(req, chave)
+    if hit is not None:
+        return hit
+    if slot not in st.session_state:
+        st.session_state[slot] = uuid.uuid4().hex
+    runner = get_runner(DB_PATH)
+    job = runner.get(runner.submit(st.session_state[slot], kind, req, chave, float(req.time_limit_s)))
+    if job["status"] == DONE:
+        return calcular(req, chave)
+    if job["status"] not in ALIVE:
+        st.error(f"Cálculo {job['status'].lower()}. {job['message']}")
+        if st.button("Tentar de novo"):
+            st.session_state[slot] = uuid.uuid4().hex     # slot novo = job novo
+            st.rerun()
+        return None
+
+    txt = f"A calcular… {job['best_count']} peças" if job["best_count"] else "A calcular…"
+    if job["best_util"]:
+        txt += f" | {job['best_util']:.1f}%"
+    if job["message"]:
+        txt += f" | {job['message']}"
+    st.progress(min(1.0, float(job["progress"] or 0.0)), text=txt)
+    melhor = best_placements(job)
+    if melhor:
+        st.image(render_layout(with_textures(melhor, pieces, req.dpi), *sheet_px),
+                 caption="Melhor layout até agora", use_column_width=True)
+    if st.button("⏹️ Cancelar cálculo"):
+        runner.cancel(job["id"])
+        st.rerun()
+    time.sleep(1.0)
+    st.rerun()
+
+
+# ---------------- Sobras do inventário ----------------
+def sobras_para(parts):
+    """Sobras disponíveis do material escolhido onde cabe pelo menos a peça mais pequena."""
+    if not codigo_sobras:
+        return []
+    borda = 2 * folga_material_cm
+    menor = min(min(p.piece.width_cm, p.piece.height_cm) for p in parts) + borda
+    maior = min(max(p.piece.width_cm, p.piece.height_cm) for p in parts) + borda
+    with get_session() as s:
+        rows = find_remnants(s, codigo_sobras, menor, maior)
+    return [Remnant(0.0, 0.0, r.largura_cm, r.altura_cm, id=r.id, material_code=r.material_code) for r in rows]
+
+
+def mostrar_sobras_usadas(plano, chave):
+    if not plano.offcuts:
+        st.caption("Nenhuma sobra do inventário serve para estas peças.")
+        return
+    st.table([{
+        "Sobra": f"#{o.remnant.id}",
+        "Medida (cm)": f"{o.remnant.width_cm:g}×{o.remnant.height_cm:g}",
+        "Peças": len(o.placements),
+        "Resto (cm)": f"{o.leftover.width_cm:.1f}×{o.leftover.height_cm:.1f}" if o.leftover is not None else "—",
+    } for o in plano.offcuts])
+    with st.expander("Layouts nas sobras"):
+        for o in plano.offcuts:
+            st.image(png_cached(digest(chave, "sobra", o.remnant.id), lambda o=o: render_layout(o.placements, *o.sheet_px)),
+                     caption=f"Sobra #{o.remnant.id}: {len(o.placements)} peças", use_column_width=True)
+    if st.button("✅ Marcar sobras como usadas", key=f"usar_sobras_{chave}"):
+        with get_session() as s:
+            for o in plano.offcuts:
+                resto = (o.leftover.width_cm, o.leftover.height_cm) if o.leftover is not None else None
+                consume_remnant(s, o.remnant.id, leftover_cm=resto)
+            s.commit()
+        st.success("Sobras marcadas como usadas (o resto de cada uma ficou no inventário).")
+
+
+def guardar_sobra(plano, chave):
+    """Regista no inventário a faixa livre da última chapa nova do plano."""
+    if not codigo_sobras or plano.remnant is None or not plano.sheets:
+        return
+    if st.button(f"📥 Guardar sobra da última chapa ({plano.remnant.width_cm:.1f}×{plano.remnant.height_cm:.1f} cm)",
+                 key=f"guardar_sobra_{chave}"):
+        with get_session() as s:
+            rem = add_remnant(s, codigo_sobras, plano.remnant.width_cm, plano.remnant.height_cm, note="nesting")
+            s.commit()
+        if rem is None:
+            st.info("Sobra pequena demais para guardar.")
         else:
-            stuck += 1
-            if stuck >= 3:
-                base_step = max(1, base_step // 2); stuck = 0
+            st.success(f"Sobra #{rem.id} registada no inventário.")
+
+
+# ---------------- Plano de chapas ----------------
+def mostrar_sobra(plano):
+    if not plano.sheets:
+        return
+    ult = len(plano.layouts[-1])
+    txt = f"Última chapa: {ult} peças | material gasto: {plano.sheets_used:.2f} chapas"
+    if plano.remnant is not None:
+        txt += f" | sobra reutilizável {plano.remnant.width_cm:.1f}×{plano.remnant.height_cm:.1f} cm"
+    st.caption(txt)
+
+
+def alternativas_chapa(parts, angs):
+    with st.expander("Alternativas de chapa (materiais de área)"):
+        from sqlmodel import select
+        from app.db import get_session, Material
+        with get_session() as s:
+            mats = s.exec(select(Material)).all()
+        opts = sheet_options(mats, folga_material_cm)
+        if not opts:
+            st.info("Nenhum material de área com largura/altura definidas.")
+            return
+        req = AlternativesRequest(MultiNestRequest(
+            parts=parts, sheet=Sheet(material_w_cm, material_h_cm, folga_material_cm),
+            gap_cm=folga_peca_cm, dpi=dpi, angles=angs, time_limit_s=int(tempo_max),
+        ), opts)
+        chave = alternatives_key(req)
+        # o botão só vale para estes dados: mudar peças/parâmetros não relança a comparação sozinho
+        if st.button("Comparar tamanhos de chapa"):
+            st.session_state["alternativas_chave"] = chave
+        if st.session_state.get("alternativas_chave") != chave and cached_alternatives(req, chave) is None:
+            return
+        alts = resultado_em_fundo("alternatives", req, chave, [], (0, 0), slot="nest_slot_alternativas")
+        if alts is None:
+            return
+        st.table([{
+            "Material": opt.name,
+            "Chapa (cm)": f"{opt.sheet.width_cm:g}×{opt.sheet.height_cm:g}",
+            "Chapas": plano.sheets,
+            "Gasto (chapas)": round(plano.sheets_used, 2),
+            "Aproveitamento %": round(plano.utilization, 1),
+            "Custo": round(opt.price * plano.sheets_used, 2),
+            "Stock": opt.stock,
+            "Completo": "sim" if plano.complete else f"faltam {sum(plano.remaining)}",
+        } for opt, plano in alts])
 
-    area_total = float(sheet_w) * float(sheet_h)
-    util = (occ_area / area_total * 100.0) if area_total else 0.0
-    return placements, util
 
 # ===================== UI =====================
 st.title("📐 Cálculos — Alinhamento ortogonal / Nesting Avançado")
 
-piece_file = st.file_uploader("Peça (PNG/JPG) — linhas escuras em fundo claro", type=["png","jpg","jpeg"])
+misto = st.toggle("Trabalho misto (várias peças, cada uma com a sua quantidade)", value=False)
+if misto:
+    piece_files = st.file_uploader("Peças (PNG/JPG com linhas escuras em fundo claro, ou SVG/DXF)", type=TIPOS_PECA,
+                                   accept_multiple_files=True)
+    piece_file = None
+else:
+    piece_file = st.file_uploader("Peça (PNG/JPG com linhas escuras em fundo claro, ou SVG/DXF)", type=TIPOS_PECA)
+    piece_files = []
+tex, poly, tamanho, exata = carregar_peca(piece_file) if piece_file else (None, None, None, False)
 dpi = st.slider("Precisão (pixels/cm) [render]", 10, 120, 40)
 
 col_dims = st.columns(2)
@@ -199,67 +219,186 @@ material_w_cm = col_dims[0].number_input("Largura da chapa (cm)", 1.0, 1000.0, 6
 material_h_cm = col_dims[1].number_input("Altura da chapa (cm)", 1.0, 1000.0, 40.0)
 
 c1, c2, c3 = st.columns(3)
-piece_w_cm = c1.number_input("Largura da peça (cm)", 0.1, 500.0, 12.0)
-piece_h_cm = c2.number_input("Altura da peça (cm)", 0.1, 500.0, 8.0)
+if not misto:
+    # SVG/DXF: o tamanho vem do ficheiro (pode ser alterado)
+    piece_w_cm = c1.number_input("Largura da peça (cm)", 0.1, 500.0, round(tamanho[0], 2) if tamanho else 12.0)
+    piece_h_cm = c2.number_input("Altura da peça (cm)", 0.1, 500.0, round(tamanho[1], 2) if tamanho else 8.0)
 angle_step = c3.selectbox("Ângulo (passo) p/ modo avançado", [5,10,15,20,30,45,90], index=2)
 
 folga_material_cm = st.number_input("Folga do material (cm)", 0.0, 10.0, 0.5)
 folga_peca_cm = st.number_input("Folga entre peças (cm)", 0.0, 10.0, 0.4)
-qty_needed = st.number_input("Quantidade necessária", 0, 100000, 0)
-
-modo = st.radio("Modo", ["Alinhamento ortogonal (sem encaixe)", "Nesting Avançado (Shapely)"], horizontal=True)
+qty_needed = 0 if misto else st.number_input("Quantidade necessária", 0, 100000, 0)
+
+MODOS = {
+    "Automático (retângulos → MaxRects, outras formas → alinhamento ortogonal)": "auto",
+    "Alinhamento ortogonal (sem encaixe)": "orthogonal",
+    "Retângulos (MaxRects/guilhotina)": "rect",
+    "Nesting Avançado (Shapely)": "shapely",
+    "Nesting raster (FFT)": "fft",
+    "Nesting NFP (exato)": "nfp",
+    "Nesting NFP + recozimento (usa todo o tempo)": "anneal",
+}
+ORDENS = {
+    "Maior área primeiro": "area",
+    "Maior dimensão primeiro": "largest",
+    "Ordem de carregamento": "input",
+}
+if misto:
+    ordem = st.radio("Ordem de colocação (NFP)", list(ORDENS), horizontal=True)
+else:
+    modo = st.radio("Modo", list(MODOS), horizontal=True)
+guilhotina = (not misto and MODOS[modo] in ("auto", "rect")
+              and st.toggle("Só cortes de guilhotina (serra de painel)", value=False))
 so_ortogonais = st.toggle("No modo avançado, usar só 0°/90°/180°/270°", value=False)
-tempo_max = st.slider("Limite de tempo (s) [Shapely]", 5, 60, 20)
-
-if piece_file:
-    raw_piece = Image.open(piece_file).convert("RGBA")
-    tex, poly, (pw, ph), _ = detect_piece(raw_piece)
-    if tex is None:
-        st.error("Não foi possível detetar o contorno. Aumente o contraste (linhas escuras).")
+tempo_max = st.slider("Limite de tempo (s) [Shapely/FFT/NFP]", 5, 60, 20)
+codigo_sobras = None
+if st.toggle("Gastar primeiro sobras do inventário", value=False):
+    from sqlmodel import select
+    from app.db import Material
+    with get_session() as s:
+        codigos = [m.code for m in s.exec(select(Material).where(Material.tipo == "AREA")).all() if m.code]
+    codigo_sobras = st.selectbox("Material das sobras", codigos) if codigos else None
+
+# ---------------- Trabalho misto ----------------
+if misto and piece_files:
+    if not SHAPELY_OK:
+        st.error("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+        st.stop()
+    parts = []
+    for i, f in enumerate(piece_files):
+        tex_i, poly_i, tam_i, exata_i = carregar_peca(f)
+        if tex_i is None:
+            st.warning(f"{f.name}: contorno não detetado (peça ignorada).")
+            continue
+        cw, ch, cq, co = st.columns(4)
+        w_i = cw.number_input(f"{f.name} — largura (cm)", 0.1, 500.0, round(tam_i[0], 2) if tam_i else 12.0,
+                              key=f"misto_w_{i}")
+        h_i = ch.number_input("Altura (cm)", 0.1, 500.0, round(tam_i[1], 2) if tam_i else 8.0, key=f"misto_h_{i}")
+        q_i = cq.number_input("Quantidade", 0, 100000, 1, key=f"misto_q_{i}")
+        o_i = co.toggle("Só 0°/90°/180°/270°", value=False, key=f"misto_o_{i}")
+        parts.append(PartSpec(
+            piece=Piece(image=tex_i, polygon=poly_i, width_cm=w_i, height_cm=h_i, name=f.name, exact=exata_i),
+            quantity=int(q_i), angles=[0, 90, 180, 270] if o_i else None,
+        ))
+    if not parts:
         st.stop()
 
-    # redimensionar peça
-    target_w_px = max(1, int(piece_w_cm * dpi))
-    target_h_px = max(1, int(piece_h_cm * dpi))
-    tex = tex.resize((target_w_px, target_h_px), Image.BICUBIC)
+    angs = [0, 90, 180, 270] if so_ortogonais else list(range(0, 360, int(angle_step)))
+    req_misto = MultiNestRequest(
+        parts=parts, sheet=Sheet(material_w_cm, material_h_cm, folga_material_cm),
+        gap_cm=folga_peca_cm, dpi=dpi, angles=angs, order=ORDENS[ordem], time_limit_s=int(tempo_max),
+        remnants=sobras_para(parts),
+    )
+    chave = parts_key(req_misto)
+    plano = resultado_em_fundo("plan", req_misto, chave, [p.piece for p in parts],
+                               req_misto.sheet.usable_px(req_misto.dpi))
+    if plano is None:
+        st.stop()
+    if codigo_sobras:
+        mostrar_sobras_usadas(plano, chave)
+    if not plano.sheets:
+        if plano.offcuts and plano.complete:
+            st.success("Tudo cabe nas sobras do inventário: não é preciso abrir chapas novas.")
+        else:
+            st.error("Nenhuma peça cabe na chapa.")
+        st.stop()
+    sheet_w_px, sheet_h_px = plano.sheet_px
+    n_chapa = st.selectbox("Chapa", list(range(1, plano.sheets + 1)),
+                           format_func=lambda i: f"{i} de {plano.sheets} ({len(plano.layouts[i - 1])} peças)")
+    png_bytes = png_cached(digest(chave, n_chapa),
+                           lambda: render_layout(plano.layouts[n_chapa - 1], sheet_w_px, sheet_h_px))
+    st.image(png_bytes, caption=f"Chapa {n_chapa}: {len(plano.layouts[n_chapa - 1])} peças", use_column_width=True)
 
-    # polígono nas mesmas coords do bitmap
-    sx = target_w_px / max(1, pw)
-    sy = target_h_px / max(1, ph)
-    poly_scaled = Polygon([(x*sx, y*sy) for (x,y) in poly.exterior.coords])
+    cA, cB, cC = st.columns(3)
+    cA.metric("Chapas necessárias", plano.sheets)
+    cB.metric("% Aproveitamento (total)", f"{plano.utilization:.1f}%")
+    cC.metric("Em falta", sum(plano.remaining))
+    mostrar_sobra(plano)
+    guardar_sobra(plano, chave)
+    st.table([{"Peça": n, "Pedidas": q, "Colocadas": k, "Em falta": max(0, q - k)}
+              for n, q, k in zip(plano.names, plano.requested, plano.placed)])
+    if plano.stats.get("timed_out"):
+        st.warning("Limite de tempo atingido: o plano está incompleto.")
+
+    st.download_button("⬇️ Exportar PNG", data=png_bytes, file_name=f"layout_misto_{n_chapa}.png", mime="image/png")
+    alternativas_chapa(parts, angs)
+    st.stop()
 
-    # chapa útil
-    sheet_w_px = max(1, int((material_w_cm - 2 * folga_material_cm) * dpi))
-    sheet_h_px = max(1, int((material_h_cm - 2 * folga_material_cm) * dpi))
-    gap_px = max(0, int(folga_peca_cm * dpi))
+if piece_file:
+    if tex is None:
+        st.error("Sem contorno fechado no desenho." if exata else
+                 "Não foi possível detetar o contorno. Aumente o contraste (linhas escuras).")
+        st.stop()
 
-    if modo.startswith("Alinhamento"):
-        placements, util = orthogonal_pack(tex, sheet_w_px, sheet_h_px, gap_px)
+    modo_key = MODOS[modo]
+    if modo_key in ("shapely", "nfp", "anneal") and not SHAPELY_OK:
+        st.error("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
+        st.stop()
+    if modo_key == "orthogonal" or so_ortogonais:
+        angs = [0, 90, 180, 270]
     else:
-        if not SHAPELY_OK:
-            st.error("Falta 'shapely'. Adicione 'shapely>=2.0' ao requirements.txt e instale.")
-            st.stop()
-        if so_ortogonais:
-            angs = [0, 90, 180, 270]
-        else:
-            angs = list(range(0, 360, int(angle_step)))
-        placements, util = advanced_nest_shapely(
-            tex, poly_scaled, sheet_w_px, sheet_h_px, gap_px,
-            angs=angs, time_limit_s=int(tempo_max)
-        )
+        angs = list(range(0, 360, int(angle_step)))
+
+    req = NestRequest(
+        piece=Piece(image=tex, polygon=poly, width_cm=piece_w_cm, height_cm=piece_h_cm, name=piece_file.name,
+                    exact=exata),
+        sheet=Sheet(material_w_cm, material_h_cm, folga_material_cm),
+        gap_cm=folga_peca_cm, dpi=dpi, angles=angs, strategy=modo_key,
+        time_limit_s=int(tempo_max), guillotine=bool(guilhotina),
+    )
+    chave = request_key(req)
+    res = resultado_em_fundo("nest", req, chave, [req.piece], req.sheet.usable_px(req.dpi))
+    if res is None:
+        st.stop()
+    placements, util = res.placements, res.utilization
+    if modo_key == "auto":
+        st.caption("Modo automático: " + ("peça retangular → MaxRects/guilhotina" if res.strategy == "rect"
+                                          else "peça não retangular → alinhamento ortogonal"))
+    sheet_w_px, sheet_h_px = res.sheet_px
 
     # render + métricas
-    canvas = render_layout(placements, sheet_w_px, sheet_h_px)
+    png_bytes = png_cached(chave, lambda: render_layout(placements, sheet_w_px, sheet_h_px))
     total = len(placements)
-    st.image(canvas, caption=f"{total} peças | {util:.1f}% de aproveitamento", use_column_width=True)
+    st.image(png_bytes, caption=f"{total} peças | {util:.1f}% de aproveitamento", use_column_width=True)
 
     cA, cB, cC = st.columns(3)
     cA.metric("Peças por chapa", total)
     cB.metric("% Aproveitamento", f"{util:.1f}%")
-    cC.metric("Chapas necessárias", ceil(qty_needed/total) if total>0 and qty_needed>0 else 0)
+    plano = plan_single(res, qty_needed, Sheet(material_w_cm, material_h_cm, folga_material_cm),
+                        folga_peca_cm, name=piece_file.name)
+    cC.metric("Chapas necessárias", plano.sheets)
+    mostrar_sobra(plano)
+    if plano.sheets and len(plano.layouts[-1]) < total:
+        with st.expander("Última chapa (parcial)"):
+            st.image(render_layout(plano.layouts[-1], sheet_w_px, sheet_h_px), use_column_width=True)
+    if qty_needed and codigo_sobras and SHAPELY_OK:
+        part = PartSpec(piece=req.piece, quantity=int(qty_needed), angles=angs)
+        req_sobras = MultiNestRequest(
+            parts=[part], sheet=req.sheet, gap_cm=folga_peca_cm, dpi=dpi, angles=angs,
+            time_limit_s=int(tempo_max), remnants=sobras_para([part]),
+        )
+        if req_sobras.remnants:
+            st.subheader("Com sobras do inventário")
+            chave_s = parts_key(req_sobras)
+            plano_s = resultado_em_fundo("plan", req_sobras, chave_s, [req.piece],
+                                         req.sheet.usable_px(dpi), slot="nest_slot_sobras")
+            if plano_s is not None:
+                mostrar_sobras_usadas(plano_s, chave_s)
+                st.caption(f"Chapas novas com sobras: {plano_s.sheets} (sem sobras: {plano.sheets})")
+                guardar_sobra(plano_s, chave_s)
+        else:
+            st.caption("Nenhuma sobra do inventário serve para esta peça.")
+            guardar_sobra(plano, chave)
+    elif qty_needed:
+        guardar_sobra(plano, chave)
+    if qty_needed and SHAPELY_OK:
+        alternativas_chapa([PartSpec(
+            piece=Piece(image=tex, polygon=poly, width_cm=piece_w_cm, height_cm=piece_h_cm, name=piece_file.name,
+                        exact=exata),
+            quantity=int(qty_needed), angles=angs,
+        )], angs)
 
     # Exportar
-    buf = io.BytesIO(); canvas.save(buf, format="PNG"); png_bytes = buf.getvalue()
     st.download_button("⬇️ Exportar PNG", data=png_bytes, file_name="layout_nesting.png", mime="image/png")
     b64 = base64.b64encode(png_bytes).decode()
     svg = f"<svg xmlns='http://www.w3.org/2000/svg' width='{sheet_w_px}' height='{sheet_h_px}'><image href='data:image/png;base64,{b64}' width='{sheet_w_px}' height='{sheet_h_px}'/></svg>"
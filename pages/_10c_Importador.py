@@ -57,7 +57,12 @@ if uploaded:
 
     if st.button("⬇️ Importar"):
         count=0
+        skipped=0
         with get_session() as s:
+            # códigos de material já usados (o código é único na BD)
+            mat_codes = set()
+            if tipo=="Materiais":
+                mat_codes = {c for c in s.exec(select(Material.code)).all() if c}
             for _, row in df.iterrows():
                 def val(field):
                     col = mapping.get(field)
@@ -73,6 +78,11 @@ if uploaded:
                         nif_tva=str(val("nif_tva") or ""),
                         notas=str(val("notas") or ""))
                 elif tipo=="Materiais":
+                    mcode = str(val("code") or "")
+                    if mcode and mcode in mat_codes:
+                        skipped += 1
+                        continue
+                    mat_codes.add(mcode)
                     obj = Material(
                         code=str(val("code") or ""),
                         nome_pt=str(val("nome_pt") or ""),
@@ -103,3 +113,5 @@ if uploaded:
                 s.add(obj); count+=1
             s.commit()
         st.success(f"Importados {count} registos.")
+        if skipped:
+            st.warning(f"Ignorados {skipped} materiais com código já existente.")
@@ -5,7 +5,7 @@ import pandas as pd
 import streamlit as st
 from sqlmodel import select
 
-from app.db import get_session, Client, Quote, QuoteItem  # usa os teus modelos
+from app.db import get_session, Client, Quote, QuoteItem, next_quote_number, register_quote_number  # usa os teus modelos
 
 # Sidebar (import robusto)
 try:
@@ -358,23 +358,19 @@ if st.button("🚀 Importar para a BD"):
                 if raw_num:
                     numero_ok = normalize_num_with_year(raw_num, dt, entrega)
                 # se ainda vazio e a opção permitir, gerar sequencial do ano atual
+                numero_gerado = False
                 if not numero_ok and gerar_numero_se_faltar:
-                    yy = datetime.utcnow().strftime("%y")
-                    existentes = s.exec(select(Quote).where(Quote.numero.like(f"{yy}%"))).all()
-                    seq = 0
-                    if existentes:
-                        try:
-                            seq = max([int(str(q.numero)[2:]) for q in existentes if getattr(q, 'numero', None) and len(str(q.numero)) >= 6])
-                        except Exception:
-                            seq = 0
-                    numero_ok = f"{yy}{seq+1:04d}"
+                    numero_ok = next_quote_number(s)
+                    numero_gerado = True
 
                 # duplicado?
-                if numero_ok:
+                if numero_ok and not numero_gerado:
                     dup = s.exec(select(Quote).where(Quote.numero == numero_ok)).first()
                     if dup:
                         dup_q += 1
                         continue
+                    # número vindo do ficheiro: a sequência do ano não pode ficar para trás
+                    register_quote_number(s, numero_ok)
 
                 q = Quote(
                     numero = numero_ok if numero_ok else None,
@@ -0,0 +1,38 @@
+# tests/conftest.py — Raiz do repositório no sys.path (como o import robusto das páginas) e peças de teste
+import sys
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def drawing(shape: str, size=(220, 140)) -> Image.Image:
+    """Desenho simples (preto em fundo branco), como os PNG que a página de Cálculos recebe."""
+    img = Image.new("RGB", size, "white")
+    d = ImageDraw.Draw(img)
+    if shape == "rect":
+        d.rectangle([20, 20, 199, 119], fill="black")
+    elif shape == "house":
+        d.polygon([(20, 60), (110, 10), (200, 60), (200, 130), (20, 130)], fill="black")
+    elif shape == "L":
+        d.polygon([(20, 10), (80, 10), (80, 90), (200, 90), (200, 130), (20, 130)], fill="black")
+    else:
+        raise ValueError(shape)
+    return img
+
+
+def overlap_pixels(placements, sheet_px) -> int:
+    """Píxeis opacos (alpha > 0) cobertos por mais de uma colocação, no layout desenhado."""
+    import numpy as np
+    W, H = sheet_px
+    count = np.zeros((H + 2, W + 2), dtype=np.int32)   # margem para texturas que encostam ao bordo
+    for p in placements:
+        a = np.array(p.image.getchannel("A")) > 0
+        h, w = a.shape
+        y0, x0 = max(0, p.y), max(0, p.x)
+        sub = a[y0 - p.y:y0 - p.y + count.shape[0] - y0, x0 - p.x:x0 - p.x + count.shape[1] - x0]
+        count[y0:y0 + sub.shape[0], x0:x0 + sub.shape[1]] += sub
+    return int((count > 1).sum())
@@ -0,0 +1,11 @@
+# tests/test_cache.py — Cache de nesting: pasta em disco e chaves
+from conftest import ROOT
+
+from app.nesting.cache import CACHE_DIR, NEST_CACHE
+
+
+def test_disk_cache_lives_in_the_repo_data_dir_whatever_the_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert CACHE_DIR.is_absolute()
+    assert CACHE_DIR == ROOT / "data" / "nesting_cache"
+    assert NEST_CACHE.root == CACHE_DIR
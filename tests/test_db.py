@@ -0,0 +1,135 @@
+# tests/test_db.py — quote_totals mantido pelos hooks de flush e o executor de migrações, numa BD temporária
+import logging
+
+import pytest
+
+pytest.importorskip("sqlmodel")
+pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+
+from sqlmodel import create_engine, select  # noqa: E402
+
+import app.db as db  # noqa: E402
+from app.pricing import PricingParams, price_items, quote_summary  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """app.db apontado para uma BD SQLite vazia, com o estado das migrações do processo reposto."""
+    monkeypatch.setattr(db, "engine", create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}"))
+    monkeypatch.setattr(db, "_schema_version_ready", 0)
+    monkeypatch.setattr(db, "_migrations_tried", False)
+    return db
+
+
+@pytest.fixture
+def migrated(fresh_db):
+    fresh_db.init_db()
+    with fresh_db.get_session() as s:
+        if s.exec(select(db.Settings)).first() is None:
+            s.add(db.Settings())
+            s.commit()
+    return fresh_db
+
+
+def _expected(session, quote):
+    items = session.exec(select(db.QuoteItem).where(db.QuoteItem.quote_id == quote.id)).all()
+    params = PricingParams.from_settings(session.exec(select(db.Settings)).first())
+    return quote_summary(price_items(items, params), desconto_percent=quote.desconto_percent,
+                         desconto_total=quote.desconto_total, iva_percent=quote.iva_percent, params=params)
+
+
+def _new_quote(session, **kw):
+    cli = session.exec(select(db.Client)).first()
+    if cli is None:
+        cli = db.Client(numero_cliente=1, nome="Cliente")
+        session.add(cli)
+        session.flush()
+    q = db.Quote(cliente_id=cli.id, iva_percent=23.0, **kw)
+    session.add(q)
+    session.flush()
+    return q
+
+
+def _item(quote_id, pct, **kw):
+    return db.QuoteItem(quote_id=quote_id, tipo_item="MATERIAL", unidade="cm²", quantidade=2.0,
+                        percent_uso=pct, preco_unitario_cliente=40.0, **kw)
+
+
+def test_migrations_reach_schema_version(fresh_db):
+    assert fresh_db.get_schema_version() == 0
+    fresh_db.init_db()
+    assert fresh_db.get_schema_version() == fresh_db.SCHEMA_VERSION
+    assert fresh_db._schema_version_ready == fresh_db.SCHEMA_VERSION
+    # segunda execução não volta a aplicar nada
+    assert fresh_db.run_migrations() == fresh_db.SCHEMA_VERSION
+
+
+def test_failed_migration_is_logged_raised_once_and_not_recorded(migrated, monkeypatch, caplog):
+    def broken():
+        raise RuntimeError("coluna em falta")
+
+    version = migrated.SCHEMA_VERSION + 1
+    monkeypatch.setattr(migrated, "MIGRATIONS", migrated.MIGRATIONS + [(version, "broken_step", broken)])
+    monkeypatch.setattr(migrated, "_migrations_tried", False)
+
+    with caplog.at_level(logging.ERROR, logger=migrated.log.name):
+        with pytest.raises(RuntimeError):
+            migrated.run_migrations()
+    assert f"Migração {version} (broken_step) falhou" in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.ERROR, logger=migrated.log.name):
+        assert migrated.run_migrations() == migrated.SCHEMA_VERSION      # no mesmo processo só fica no log
+    assert "broken_step" in caplog.text
+    assert migrated.get_schema_version() == migrated.SCHEMA_VERSION
+    assert migrated._schema_version_ready == migrated.SCHEMA_VERSION
+
+
+def test_quote_totals_follow_item_changes(migrated):
+    with migrated.get_session() as s:
+        q = _new_quote(s, desconto_total=5.0)
+        a, b = _item(q.id, 15), _item(q.id, 71, desconto_item=2.0, ink_ml=3.0)
+        s.add_all([a, b])
+        s.commit()
+
+        def check():
+            got = migrated.load_quote_totals(s, [q.id])[q.id]
+            s.refresh(got)
+            exp = _expected(s, q)
+            assert got.items_count == exp["items_count"]
+            for k in ("items_subtotal", "net_subtotal", "vat", "total"):
+                assert getattr(got, k) == pytest.approx(exp[k]), k
+
+        check()
+        a.percent_uso = 16                                             # muda de escalão
+        s.add(a)
+        s.commit()
+        check()
+        s.delete(b)
+        s.commit()
+        check()
+        q.desconto_percent = 10.0
+        s.add(q)
+        s.commit()
+        check()
+
+
+def test_settings_change_reprices_open_quotes_only(migrated):
+    with migrated.get_session() as s:
+        open_q = _new_quote(s)
+        archived = _new_quote(s, estado="ARQUIVADO")
+        s.add_all([_item(open_q.id, 20), _item(archived.id, 20)])
+        s.commit()
+        before = {k: t.items_subtotal for k, t in migrated.load_quote_totals(s, [open_q.id, archived.id]).items()}
+
+        cfg = s.exec(select(db.Settings)).first()
+        cfg.margin_16_30 += 0.5
+        s.add(cfg)
+        s.commit()
+        after = migrated.load_quote_totals(s, [open_q.id, archived.id])
+        for t in after.values():
+            s.refresh(t)
+
+    assert after[open_q.id].items_subtotal == pytest.approx(before[open_q.id] + 40.0 * 0.2 * 2.0 * 0.5)
+    assert after[archived.id].items_subtotal == pytest.approx(before[archived.id])
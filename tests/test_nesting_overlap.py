@@ -0,0 +1,45 @@
+# tests/test_nesting_overlap.py — Layouts desenhados sem sobreposições (alpha das texturas), em todas as estratégias
+import pytest
+
+from app.nesting import MultiNestRequest, NestRequest, PartSpec, Piece, Sheet
+from app.nesting.core import STRATEGIES
+from app.nesting.detect import detect_piece
+from app.nesting.engine import nest
+from app.nesting.planner import plan_parts
+from conftest import drawing, overlap_pixels
+
+SHEET = Sheet(60, 40, 0.5)
+
+
+def _piece(shape, w_cm=10.0, h_cm=8.0):
+    tex, poly = detect_piece(drawing(shape).convert("RGBA"))[:2]
+    return Piece(tex, poly, w_cm, h_cm)
+
+
+@pytest.mark.parametrize("shape", ["house", "L"])
+@pytest.mark.parametrize("dpi", [10, 20])
+@pytest.mark.parametrize("angles", [[0, 90, 180, 270], list(range(0, 360, 15))])
+def test_nfp_gap_zero_does_not_overlap(shape, dpi, angles):
+    # regressão: polígono em coords de centro de píxel + posição arredondada → peças desenhadas sobrepostas
+    res = nest(NestRequest(piece=_piece(shape), sheet=SHEET, dpi=dpi, gap_cm=0, angles=angles,
+                           strategy="nfp", time_limit_s=2))
+    assert res.count > 10
+    assert overlap_pixels(res.placements, res.sheet_px) == 0
+
+
+def test_multi_gap_zero_does_not_overlap():
+    req = MultiNestRequest(parts=[PartSpec(_piece("L"), 20), PartSpec(_piece("house", 8, 6), 20)],
+                           sheet=SHEET, gap_cm=0, dpi=20, angles=[0, 90, 180, 270], time_limit_s=3)
+    plan = plan_parts(req)
+    assert sum(plan.placed) == 40
+    for layout in plan.layouts:
+        assert overlap_pixels(layout, plan.sheet_px) == 0
+
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+@pytest.mark.parametrize("gap_cm", [0, 0.4])
+def test_every_strategy_places_without_overlap(strategy, gap_cm):
+    res = nest(NestRequest(piece=_piece("house"), sheet=SHEET, dpi=10, gap_cm=gap_cm, angles=[0, 90, 180, 270],
+                           strategy=strategy, time_limit_s=1, max_trials=300, seed=1, workers=1))
+    assert res.count > 5, strategy
+    assert overlap_pixels(res.placements, res.sheet_px) == 0, strategy
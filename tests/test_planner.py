@@ -0,0 +1,46 @@
+# tests/test_planner.py — Plano de chapas de uma peça: última chapa parcial e sobra
+import random
+
+from app.nesting import NestRequest, Piece, Sheet
+from app.nesting.core import NestResult, Placement
+from app.nesting.detect import detect_piece
+from app.nesting.engine import nest
+from app.nesting.planner import plan_single
+from conftest import drawing
+
+
+def _grid_result(shuffle_seed):
+    # 5×4 peças de 10×5 cm numa chapa útil de 50×20 cm (10 px/cm), por ordem aleatória
+    pl = [Placement(x * 100, y * 50, 0, 100, 50) for y in range(4) for x in range(5)]
+    random.Random(shuffle_seed).shuffle(pl)
+    return NestResult(placements=pl, utilization=100.0, sheet_px=(500, 200), dpi=10.0, strategy="shapely")
+
+
+def test_last_sheet_leaves_the_largest_strip_whatever_the_placement_order():
+    for seed in range(5):
+        plan = plan_single(_grid_result(seed), qty=25, sheet=Sheet(50, 20))
+        assert plan.sheets == 2 and len(plan.layouts[-1]) == 5
+        # a primeira fila inteira: sobra de 50×15 cm em baixo
+        assert plan.remnant is not None
+        assert (plan.remnant.width_cm, plan.remnant.height_cm) == (50, 15)
+
+
+def _overlaps(p, rem, sheet, dpi):
+    x0, y0 = sheet.margin_cm + p.x / dpi, sheet.margin_cm + p.y / dpi
+    x1, y1 = x0 + p.w / dpi, y0 + p.h / dpi
+    return (x0 < rem.x_cm + rem.width_cm and rem.x_cm < x1 and
+            y0 < rem.y_cm + rem.height_cm and rem.y_cm < y1)
+
+
+def test_remnant_is_clear_of_the_last_sheet_with_an_unordered_strategy():
+    tex, poly = detect_piece(drawing("house").convert("RGBA"))[:2]
+    sheet = Sheet(60, 40, 0.5)
+    res = nest(NestRequest(piece=Piece(tex, poly, 10, 8), sheet=sheet, dpi=10, gap_cm=0.2,
+                           strategy="shapely", time_limit_s=2, seed=1))
+    assert res.count > 4
+    plan = plan_single(res, qty=res.count + 3, sheet=sheet, gap_cm=0.2)
+    last = plan.layouts[-1]
+    assert len(last) == 3 and plan.remnant is not None
+    assert not any(_overlaps(p, plan.remnant, sheet, res.dpi) for p in last)
+    # pelo menos metade da chapa fica livre com só 3 peças
+    assert plan.remnant.area_cm2 >= 0.5 * sheet.width_cm * sheet.height_cm
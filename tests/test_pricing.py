@@ -0,0 +1,128 @@
+# tests/test_pricing.py — Motor vetorizado (app/pricing.py) face à regra por item de antes (utils.pick_margin)
+import json
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("streamlit")     # app.utils aplica o patch do st.number_input ao importar
+
+from app.pricing import PricingParams, price_items, quote_summary, quotes_summary  # noqa: E402
+from app.utils import Margins, pick_margin, price_with_tiered_margin  # noqa: E402
+
+PARAMS = PricingParams(margin_0_15=0.5, margin_16_30=0.3, margin_31_70=0.25, margin_71_plus=0.1,
+                       uv_ink_price_eur_ml=0.12)
+MARGINS = Margins(PARAMS.margin_0_15, PARAMS.margin_16_30, PARAMS.margin_31_70, PARAMS.margin_71_plus)
+SERVICES = {7: {"id": 7, "custo_por_minuto": 0.8, "minutos_por_unidade": 3.0, "custo_extra": 1.5,
+                "custo_fornecedor": 2.0, "machine_id": None, "machine_type": ""}}
+# escalões: limites incluídos à esquerda (≤ 15, ≤ 30, ≤ 70) e valores logo a seguir
+EDGE_PCTS = [0, 1, 15, 15.01, 16, 30, 30.01, 31, 70, 70.01, 71, 100]
+
+
+def _item(i, pct, **kw):
+    it = {"id": i, "quote_id": kw.pop("quote_id", 1), "tipo_item": "MATERIAL", "ref_id": None, "unidade": "cm²",
+          "quantidade": 3.0, "percent_uso": pct, "preco_unitario_cliente": 20.0, "desconto_item": 0.0,
+          "ink_ml": 0.0, "subtotal_cliente": None, "preco_compra_unitario": 8.0, "pricing_snapshot_id": None}
+    it.update(kw)
+    return it
+
+
+def _items():
+    out = [_item(i, pct) for i, pct in enumerate(EDGE_PCTS, 1)]
+    n = len(out)
+    out += [
+        _item(n + 1, 40, unidade="min", quantidade=12.0, preco_unitario_cliente=1.25),
+        _item(n + 2, 20, desconto_item=3.0, ink_ml=5.0),
+        _item(n + 3, 10, desconto_item=500.0),                       # desconto maior que a linha: 0
+        _item(n + 4, 50, subtotal_cliente=77.7),                     # subtotal gravado prevalece
+        _item(n + 5, 60, tipo_item="SERVICO", ref_id=7, ink_ml=4.0, preco_compra_unitario=None),
+        _item(n + 6, 100, tipo_item="SERVICO", ref_id=7, unidade="min", quantidade=2.0, preco_compra_unitario=None),
+        _item(n + 7, 25, quote_id=2, quantidade=1.0),
+        _item(n + 8, 90, quote_id=2, ink_ml=2.5),
+    ]
+    return out
+
+
+# --- regra por item de antes (páginas Orçamentos/Planeamento antes do motor vetorizado) ---
+def baseline_line(it, margins=MARGINS, ink_price=PARAMS.uv_ink_price_eur_ml):
+    if it["subtotal_cliente"] is not None:
+        return max(0.0, float(it["subtotal_cliente"]))
+    if it["unidade"] == "min":
+        part = it["preco_unitario_cliente"] * it["quantidade"]
+    else:
+        part = it["preco_unitario_cliente"] * (it["percent_uso"] / 100.0) * it["quantidade"]
+    val = price_with_tiered_margin(part, it["percent_uso"], margins) - (it["desconto_item"] or 0.0)
+    if (it["ink_ml"] or 0.0) > 0:
+        val += ink_price * it["ink_ml"]
+    return max(0.0, val)
+
+
+def baseline_costs(it, ink_price=PARAMS.uv_ink_price_eur_ml):
+    scale = it["percent_uso"] / 100.0 if it["unidade"] != "min" else 1.0
+    mat = srv = 0.0
+    if it["tipo_item"] == "MATERIAL" and it["unidade"] != "min" and it["preco_compra_unitario"] is not None:
+        mat = it["preco_compra_unitario"] * (it["percent_uso"] / 100.0) * it["quantidade"]
+    if it["tipo_item"] == "SERVICO":
+        sv = SERVICES[it["ref_id"]]
+        srv = (sv["custo_por_minuto"] * sv["minutos_por_unidade"] * it["quantidade"] * scale
+               + sv["custo_extra"] + sv["custo_fornecedor"] + it["ink_ml"] * ink_price)
+    return mat, srv
+
+
+def test_margin_tiers_match_pick_margin_at_the_edges():
+    lines = price_items([_item(i, pct) for i, pct in enumerate(EDGE_PCTS, 1)], PARAMS)
+    for pct, rate in zip(EDGE_PCTS, lines["margin_rate"]):
+        assert rate == pytest.approx(pick_margin(pct, MARGINS)), pct
+
+
+def test_lines_and_costs_match_the_per_item_rule():
+    items = _items()
+    lines = price_items(items, PARAMS, SERVICES)
+    for it, (_, row) in zip(items, lines.iterrows()):
+        mat, srv = baseline_costs(it)
+        assert row["line_client"] == pytest.approx(baseline_line(it)), it["id"]
+        assert row["material_cost"] == pytest.approx(mat), it["id"]
+        assert row["service_cost"] == pytest.approx(srv), it["id"]
+        assert row["line_margin"] == pytest.approx(row["line_client"] - mat - srv), it["id"]
+
+
+@pytest.mark.parametrize("desconto_percent, desconto_total", [(None, 0.0), (None, 12.5), (10.0, 99.0)])
+def test_quote_totals_match_the_per_item_sums(desconto_percent, desconto_total):
+    items = [it for it in _items() if it["quote_id"] == 1]
+    sub = sum(baseline_line(it) for it in items)
+    costs = [baseline_costs(it) for it in items]
+    discount = sub * desconto_percent / 100.0 if desconto_percent is not None else desconto_total
+    net = sub - discount
+    got = quote_summary(price_items(items, PARAMS, SERVICES), desconto_percent=desconto_percent,
+                        desconto_total=desconto_total, iva_percent=23.0, params=PARAMS)
+    assert got["items_count"] == len(items)
+    assert got["items_subtotal"] == pytest.approx(sub)
+    assert got["net_subtotal"] == pytest.approx(net)
+    assert got["vat"] == pytest.approx(net * 0.23)
+    assert got["total"] == pytest.approx(net * 1.23)
+    assert got["material_cost"] == pytest.approx(sum(c[0] for c in costs))
+    assert got["service_cost"] == pytest.approx(sum(c[1] for c in costs))
+    assert got["profit"] == pytest.approx(max(0.0, net - sum(map(sum, costs))))
+
+
+def test_quotes_summary_keeps_quotes_without_items_at_zero():
+    lines = price_items(_items(), PARAMS, SERVICES)
+    totals = quotes_summary(lines, [(1, 0.0, None, 23.0), (2, 0.0, None, 0.0), (3, 5.0, None, 23.0)], PARAMS)
+    assert list(totals.index) == [1, 2, 3]
+    assert totals.loc[2, "items_subtotal"] == pytest.approx(sum(baseline_line(it) for it in _items()
+                                                                if it["quote_id"] == 2))
+    assert totals.loc[3, "items_count"] == 0 and totals.loc[3, "items_subtotal"] == 0.0
+
+
+def test_items_with_a_snapshot_use_its_margins_ink_and_machine_cost():
+    machines = [{"id": 4, "name": "UV", "power_watts": 1200, "wear_cost_eur_per_min": 0.05, "markup_percent": 20}]
+    snap = {"id": 9, "margin_0_15": 1.0, "margin_16_30": 0.9, "margin_31_70": 0.8, "margin_71_plus": 0.7,
+            "uv_ink_price_eur_ml": 0.3, "energy_cost_eur_kwh": 0.25, "machines_json": json.dumps(machines)}
+    services = {7: dict(SERVICES[7], machine_id=4)}
+    old = Margins(1.0, 0.9, 0.8, 0.7)
+    items = [_item(1, 20, ink_ml=2.0, pricing_snapshot_id=9), _item(2, 20, ink_ml=2.0),
+             _item(3, 60, tipo_item="SERVICO", ref_id=7, pricing_snapshot_id=9, preco_compra_unitario=None)]
+    lines = price_items(items, PARAMS, services, snapshots=[snap])
+    assert lines.loc[0, "line_client"] == pytest.approx(baseline_line(items[0], old, 0.3))
+    assert lines.loc[1, "line_client"] == pytest.approx(baseline_line(items[1]))
+    cpm = (1200 / 1000 / 60 * 0.25 + 0.05) * 1.2
+    assert lines.loc[2, "service_cost"] == pytest.approx(cpm * 3.0 * 3.0 * 0.6 + 1.5 + 2.0)
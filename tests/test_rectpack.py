@@ -0,0 +1,27 @@
+# tests/test_rectpack.py — Deteção de peças retangulares (estratégia `auto`)
+from PIL import Image
+
+from app.nesting import NestRequest, Piece, Sheet
+from app.nesting.detect import detect_piece
+from app.nesting.engine import resolve_strategy
+from conftest import drawing
+
+
+def _piece(img, w_cm=18.0, h_cm=10.0):
+    tex, poly = detect_piece(img.convert("RGBA"))[:2]
+    return Piece(tex, poly, w_cm, h_cm)
+
+
+def test_filled_rectangle_png_goes_to_rect(tmp_path):
+    # regressão: o contorno do approxPolyDP dava 0.9696 para este retângulo e `auto` escolhia orthogonal
+    path = tmp_path / "rect.png"
+    drawing("rect").save(path)
+    piece = _piece(Image.open(path))
+    for dpi in (10, 40):
+        assert resolve_strategy(NestRequest(piece=piece, sheet=Sheet(60, 40), dpi=dpi, strategy="auto")) == "rect"
+
+
+def test_other_shapes_keep_orthogonal():
+    for shape in ("house", "L"):
+        piece = _piece(drawing(shape), 10.0, 8.0)
+        assert resolve_strategy(NestRequest(piece=piece, sheet=Sheet(60, 40), strategy="auto")) == "orthogonal"